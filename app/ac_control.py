@@ -0,0 +1,569 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# 消息协议与触摸屏面板共用，位于仓库的 esp32_lvgl 目录
+ESP32_LVGL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'esp32_lvgl')
+if ESP32_LVGL_DIR not in sys.path:
+    sys.path.append(ESP32_LVGL_DIR)
+
+import ac_protocol
+# 红外发射端（stickc_ac_con.ino）的API指令
+from ac_protocol import API_POWER_ON, API_POWER_OFF, API_TEMP_PREFIX, API_STATUS
+
+MIN_TEMP = 16
+MAX_TEMP = 30
+
+# 同一空调的指令按此顺序发送（先开机再设温度）
+COMMAND_KINDS = ("power", "temp", "status")
+
+# 协议操作 <-> (指令类型, 值)
+_OP_TO_COMMAND = {
+    ac_protocol.OP_ON: ("power", "on"),
+    ac_protocol.OP_OFF: ("power", "off"),
+    ac_protocol.OP_STATUS: ("status", None),
+}
+
+MAX_OUTSTANDING_COMMANDS = 64  # 每台空调最多跟踪的未确认指令数量
+ACK_HISTORY = 1024             # 每台空调记住最近多少个指令版本号的确认结果
+
+UNIT_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+
+def command_topic(unit: str) -> str:
+    """空调控制指令主题，例如 stickc/aircon"""
+    return f"{unit}/aircon"
+
+
+def status_topic(unit: str) -> str:
+    """空调状态反馈主题，例如 stickc/up"""
+    return f"{unit}/up"
+
+
+def validate_unit(unit: str) -> str:
+    """检查空调编号，避免拼出带通配符的主题"""
+    if not UNIT_PATTERN.match(unit or ""):
+        raise ValueError(f"无效的空调编号: {unit}")
+    return unit
+
+
+def parse_command(data):
+    """
+    解析控制指令，返回 (类型, 值)
+    支持:
+    - {"command": "on"} / {"command": "off"} / {"command": "temp", "value": 25} / {"command": "status"}
+    - {"power": "on"} / {"temp": 25}
+    - 旧格式字符串: "on"、"off"、"set 25"、"api/power/on"、"api/temp/25"、"api/status"
+    - 二进制指令帧（ac_protocol）
+    """
+    if isinstance(data, dict):
+        if "command" in data:
+            command = str(data["command"]).lower()
+            if command in ("on", "off"):
+                return "power", command
+            if command in ("temp", "set"):
+                return "temp", _parse_temp(data.get("value"))
+            if command == "status":
+                return "status", None
+            # 允许 command 字段直接携带旧格式字符串
+            return parse_command(command)
+        if "power" in data:
+            power = data["power"]
+            if isinstance(power, bool):
+                power = "on" if power else "off"
+            power = str(power).lower()
+            if power not in ("on", "off"):
+                raise ValueError(f"无效的电源状态: {data['power']}")
+            return "power", power
+        if "temp" in data:
+            return "temp", _parse_temp(data["temp"])
+        raise ValueError("缺少 command 字段")
+
+    if isinstance(data, (bytes, bytearray)):
+        if ac_protocol.is_frame(data):
+            return _parse_frame(data)
+        data = data.decode("utf-8", errors="replace")
+    if not isinstance(data, str):
+        raise ValueError("无法识别的指令格式")
+
+    try:
+        legacy = ac_protocol.parse_legacy(data)
+    except ValueError:
+        raise ValueError(f"无效的温度值: {data}")
+    if legacy is None or legacy[0] != ac_protocol.MSG_COMMAND:
+        raise ValueError(f"无法识别的指令: {data}")
+    return _command_from_op(legacy[1], legacy[2])
+
+
+def _parse_frame(payload):
+    try:
+        message = ac_protocol.decode(payload)
+    except ValueError as e:
+        raise ValueError(f"无效的指令帧: {e}")
+    if message[0] != ac_protocol.MSG_COMMAND:
+        raise ValueError("不是指令帧")
+    return _command_from_op(message[3], message[4])
+
+
+def _command_from_op(op, value):
+    if op == ac_protocol.OP_TEMP:
+        return "temp", _parse_temp(value)
+    if op not in _OP_TO_COMMAND:
+        raise ValueError(f"无效的操作: {op}")
+    return _OP_TO_COMMAND[op]
+
+
+def command_seq(data):
+    """
+    取出指令的序号（用于去重），没有序号时返回None
+    JSON指令使用 seq 字段，二进制帧使用帧内序号
+    """
+    if isinstance(data, dict):
+        seq = data.get("seq")
+        if seq is None:
+            return None
+        try:
+            seq = int(seq)
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的序号: {seq}")
+        if not 0 <= seq <= ac_protocol.SEQ_MASK:
+            raise ValueError(f"序号超出范围(0-{ac_protocol.SEQ_MASK}): {seq}")
+        return seq
+    if isinstance(data, (bytes, bytearray)) and ac_protocol.is_frame(data):
+        return ac_protocol.decode(data)[2]
+    return None
+
+
+def _parse_temp(value) -> int:
+    try:
+        temp = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"无效的温度值: {value}")
+    if not MIN_TEMP <= temp <= MAX_TEMP:
+        raise ValueError(f"温度超出范围({MIN_TEMP}-{MAX_TEMP}): {temp}")
+    return temp
+
+
+def _command_op(kind, value):
+    if kind == "power":
+        return ac_protocol.OP_ON if value == "on" else ac_protocol.OP_OFF
+    if kind == "temp":
+        return ac_protocol.OP_TEMP
+    return ac_protocol.OP_STATUS
+
+
+def encode_command(kind: str, value, seq=None, binary=False):
+    """
+    编码指令
+    binary=True 时编码为二进制指令帧（带序号），否则为红外发射端可识别的API字符串
+    """
+    op = _command_op(kind, value)
+    temp = value if kind == "temp" else 0
+    if binary:
+        return ac_protocol.encode(ac_protocol.MSG_COMMAND, ac_protocol.NODE_SERVER, seq or 0, op, temp)
+    return ac_protocol.to_legacy(ac_protocol.MSG_COMMAND, op, temp, ac_protocol.DIALECT_FIRMWARE).decode()
+
+
+def parse_status(payload):
+    """
+    解析状态反馈
+    {"status":"on|off","temp":25} 或二进制状态帧 -> {"power": "on", "temp": 25}
+    二进制状态帧附带所确认指令的序号 seq
+    上线消息等其他内容返回None
+    """
+    if isinstance(payload, (bytes, bytearray)) and ac_protocol.is_frame(payload):
+        try:
+            message = ac_protocol.decode(payload)
+        except ValueError:
+            return None
+        if message[0] != ac_protocol.MSG_STATE:
+            return None
+        state = {"power": "on" if message[3] == ac_protocol.OP_ON else "off"}
+        if message[4]:
+            state["temp"] = message[4]
+        if message[2]:
+            state["seq"] = message[2]
+        return state
+
+    try:
+        data = json.loads(payload)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get("status") not in ("on", "off"):
+        return None
+    state = {"power": data["status"]}
+    if "temp" in data:
+        try:
+            state["temp"] = int(data["temp"])
+        except (TypeError, ValueError):
+            pass
+    return state
+
+
+class ACStateCache:
+    """
+    空调状态缓存
+    - 每台空调保存最新的电源/温度状态和版本号（每次状态反馈加1）
+    - 每条指令分配一个递增的指令版本号，按版本号单独跟踪是否已确认：
+      指令发布后，状态反馈与指令目标一致（电源或温度相同；二进制状态帧按序号）才确认这一条；
+      因与目标状态相同而丢弃的指令直接确认，被同类新指令合并的指令随新指令一起确认
+    - wait_for 支持长轮询，等待指定指令版本被确认
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._units = {}     # 空调编号 -> 状态字典
+        self._commands = {}  # 空调编号 -> OrderedDict(指令版本号 -> 未确认的指令)
+        self._acked = {}     # 空调编号 -> 最近已确认的指令版本号集合
+
+    def _unit(self, unit):
+        state = self._units.get(unit)
+        if state is None:
+            state = {
+                "power": None,
+                "temp": None,
+                "version": 0,          # 状态版本号
+                "command_version": 0,  # 最近分配的指令版本号
+                "updated_at": None     # 最近一次状态反馈的时间
+            }
+            self._units[unit] = state
+            self._commands[unit] = OrderedDict()
+            self._acked[unit] = set()
+        return state
+
+    def _snapshot(self, unit):
+        state = dict(self._unit(unit))
+        # 未确认的指令版本号（包括被合并的）
+        state["outstanding"] = sorted(v for command in self._commands[unit].values()
+                                      for v in command["versions"])
+        return state
+
+    def get(self, unit):
+        """返回状态快照"""
+        with self._cond:
+            return self._snapshot(unit)
+
+    def value(self, unit, kind):
+        """已知的电源或温度状态，未知时返回None"""
+        with self._cond:
+            state = self._units.get(unit)
+            return state.get(kind) if state else None
+
+    def next_command_version(self, unit, kind=None, value=None):
+        """为新指令分配版本号，并开始跟踪这条指令"""
+        with self._cond:
+            state = self._unit(unit)
+            state["command_version"] += 1
+            version = state["command_version"]
+            commands = self._commands[unit]
+            commands[version] = {"kind": kind, "value": value, "published": False, "state_version": None,
+                                 "versions": [version]}
+            while len(commands) > MAX_OUTSTANDING_COMMANDS:
+                # 一直没有反馈的旧指令不再跟踪，等待它们的请求超时返回未确认
+                commands.popitem(last=False)
+            return version
+
+    def target(self, unit, kind):
+        """
+        电源或温度的目标状态：最新一条已发布、尚未确认的同类指令的目标值，
+        没有这样的指令时为已知状态，未知时返回None
+        发布之后又收到过状态反馈而仍未确认的指令视为没有生效，不再作为目标
+        """
+        with self._cond:
+            state = self._units.get(unit)
+            if state is None:
+                return None
+            for command in reversed(self._commands[unit].values()):
+                if (command["kind"] == kind and command["published"]
+                        and command["state_version"] == state["version"]):
+                    return command["value"]
+            return state.get(kind)
+
+    def mark_published(self, unit, command_version, published=True):
+        """
+        记录指令已发布，之后与指令目标一致的状态反馈会确认它
+        需要在真正发布之前调用（固件的回复可能比发布函数返回得更早），发布失败时以 published=False 撤销
+        """
+        with self._cond:
+            state = self._unit(unit)
+            command = self._commands[unit].get(command_version)
+            if command is not None:
+                command["published"] = published
+                command["state_version"] = state["version"]
+
+    def supersede(self, unit, old_version, new_version):
+        """旧指令被同类的新指令取代（合并或发送失败），随新指令一起确认"""
+        with self._cond:
+            self._unit(unit)
+            commands = self._commands[unit]
+            old = commands.pop(old_version, None)
+            new = commands.get(new_version)
+            if old is not None and new is not None:
+                new["versions"].extend(old["versions"])
+
+    def acknowledge(self, unit, command_version):
+        """直接确认指令（例如与当前状态相同而被丢弃的指令）"""
+        with self._cond:
+            self._unit(unit)
+            self._acknowledge(unit, command_version)
+            self._cond.notify_all()
+
+    def _acknowledge(self, unit, command_version):
+        command = self._commands[unit].pop(command_version, None)
+        acked = self._acked[unit]
+        acked.update(command["versions"] if command else [command_version])
+        if len(acked) > ACK_HISTORY:
+            oldest = self._units[unit]["command_version"] - ACK_HISTORY
+            acked.difference_update([v for v in acked if v <= oldest])
+
+    @staticmethod
+    def _matches(command, command_version, new_state):
+        """状态反馈是否确认了这条已发布的指令"""
+        seq = new_state.get("seq")
+        if seq is not None and seq == ac_protocol.next_seq(command_version - 1):
+            return True
+        if command["kind"] in ("power", "temp"):
+            return new_state.get(command["kind"]) == command["value"]
+        # 状态查询：任何状态反馈都是回复
+        return True
+
+    def update(self, unit, new_state):
+        """
+        根据状态反馈更新缓存，确认目标与反馈一致的已发布指令
+        还在排队（未发布）的指令不会被确认，按钮等操作产生的反馈只确认与之一致的指令
+        """
+        with self._cond:
+            state = self._unit(unit)
+            state.update(new_state)
+            state["version"] += 1
+            state["updated_at"] = time.time()
+            for version, command in list(self._commands[unit].items()):
+                if command["published"] and self._matches(command, version, new_state):
+                    self._acknowledge(unit, version)
+            self._cond.notify_all()
+            return self._snapshot(unit)
+
+    def wait_for(self, unit, command_version, timeout):
+        """
+        等待指令版本被确认，返回 (是否确认, 状态快照)
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._unit(unit)
+            while command_version not in self._acked[unit]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False, self._snapshot(unit)
+                self._cond.wait(timeout=remaining)
+            return True, self._snapshot(unit)
+
+
+class CommandDispatcher:
+    """
+    空调指令调度器
+    - 每台空调一个合并队列：同类指令只保留最新值（连续调温只发送最后一次）
+    - 温度指令等待一小段时间再发送，与固件的 TEMP_SEND_DELAY 去抖一致
+    - 每台空调两次发布之间至少间隔 min_interval 秒
+    - 根据固件的状态反馈跟踪空调状态，丢弃不会改变状态的重复指令
+    - 带序号的指令按空调和客户端去重，客户端重试同一序号时返回第一次的处理结果
+    - binary_units 中的空调发送二进制指令帧，其余空调发送旧格式API字符串
+    - 通常由后台线程发送；不启动线程时可以按需调用 dispatch_due（模拟器按虚拟时间驱动）
+    """
+
+    def __init__(self, publish, state_cache=None, min_interval=2.0, coalesce_delay=1.0, binary_units=(),
+                 clock=time.monotonic):
+        self._publish = publish                # 发布函数 publish(topic, payload) -> bool
+        self._clock = clock                    # 单调时钟（模拟时可换成虚拟时钟）
+        self.state_cache = state_cache or ACStateCache()
+        self.min_interval = min_interval       # 同一空调两次发布的最小间隔（秒）
+        self.coalesce_delay = coalesce_delay   # 温度指令合并等待时间（秒）
+        self._cond = threading.Condition()
+        self._pending = {}                     # 空调编号 -> {类型: (值, 到期时间, 指令版本号)}
+        self._last_publish = {}                # 空调编号 -> 上次发布时间
+        self.binary_units = set(binary_units)  # 使用二进制指令帧的空调
+        self._seq_lock = threading.Lock()
+        self._seq_results = {}                 # (空调编号, 客户端) -> OrderedDict(序号 -> 处理结果)
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "published": 0,
+            "failed": 0,
+            "duplicates": 0
+        }
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """启动后台发送线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ac-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _is_redundant(self, unit, kind, value):
+        """
+        指令是否与目标状态相同
+        已发布但尚未确认的指令优先于已知状态：状态为开、刚发出关机指令时再提交开机不能被丢弃
+        """
+        if kind == "status":
+            return False
+        return self.state_cache.target(unit, kind) == value
+
+    def submit(self, unit, kind, value, seq=None, client=None):
+        """
+        提交指令，返回处理结果和指令版本号
+        seq 为客户端序号，按 (空调, 客户端) 分别记录最近 SEQ_WINDOW 个序号的处理结果；
+        同一客户端重复提交已处理过的序号时不再排队，返回 {"status": "duplicate", ...} 和第一次的版本号
+        """
+        if seq is None:
+            return self._submit(unit, kind, value)
+
+        # 查找、提交和记录结果在同一把锁内完成，并发的重试只会看到完整的结果
+        with self._seq_lock:
+            results = self._seq_results.setdefault((unit, client), OrderedDict())
+            previous = results.get(seq)
+            if previous is not None:
+                self.stats["duplicates"] += 1
+                return dict(previous, status="duplicate")
+            result = self._submit(unit, kind, value)
+            result["seq"] = seq
+            results[seq] = dict(result)
+            while len(results) > ac_protocol.SEQ_WINDOW:
+                results.popitem(last=False)
+            return result
+
+    def _submit(self, unit, kind, value):
+        now = self._clock()
+        version = self.state_cache.next_command_version(unit, kind, value)
+        with self._cond:
+            self.stats["submitted"] += 1
+            pending = self._pending.setdefault(unit, {})
+
+            if self._is_redundant(unit, kind, value):
+                # 已经是目标状态，同时取消排队中的同类指令
+                pending.pop(kind, None)
+                self.stats["dropped"] += 1
+                self.state_cache.acknowledge(unit, version)
+                return {"status": "dropped", "reason": "空调已处于目标状态", "version": version}
+
+            coalesced = kind in pending
+            if coalesced:
+                self.stats["coalesced"] += 1
+                self.state_cache.supersede(unit, pending[kind][2], version)
+            delay = self.coalesce_delay if kind == "temp" else 0
+            pending[kind] = (value, now + delay, version)
+            self._cond.notify()
+
+        return {"status": "coalesced" if coalesced else "queued", "version": version}
+
+    def handle_status(self, unit, payload):
+        """处理固件的状态反馈，更新空调状态缓存"""
+        state = parse_status(payload)
+        if state is None:
+            return None
+        return self.state_cache.update(unit, state)
+
+    def pending(self, unit):
+        """排队中的指令"""
+        with self._cond:
+            return {kind: item[0] for kind, item in self._pending.get(unit, {}).items()}
+
+    def _next_ready(self, now):
+        """
+        找到下一条可发送的指令
+        返回 (空调编号, 类型, 值, 指令版本号) 或 (None, 等待秒数)
+        """
+        wait = None
+        for unit, pending in self._pending.items():
+            if not pending:
+                continue
+            unit_ready = self._last_publish.get(unit, 0) + self.min_interval
+            for kind in COMMAND_KINDS:
+                if kind not in pending:
+                    continue
+                value, due, version = pending[kind]
+                ready_at = max(due, unit_ready)
+                if ready_at <= now:
+                    del pending[kind]
+                    return unit, kind, value, version
+                if wait is None or ready_at - now < wait:
+                    wait = ready_at - now
+        return None, wait
+
+    def _take_ready(self):
+        """
+        （持有锁时调用）取出下一条要发送的指令并记录发送时间，等待期间状态已更新的指令直接丢弃
+        返回 (空调编号, 类型, 值, 指令版本号) 或 (None, 等待秒数)
+        """
+        while True:
+            ready = self._next_ready(self._clock())
+            if ready[0] is None:
+                return ready
+            unit, kind, value, version = ready
+            if self._is_redundant(unit, kind, value):
+                self.stats["dropped"] += 1
+                self.state_cache.acknowledge(unit, version)
+                continue
+            self._last_publish[unit] = self._clock()
+            return ready
+
+    def dispatch_due(self):
+        """
+        立即发送所有已到期的指令（不等待）
+        返回距离下一条指令到期的秒数，没有排队的指令时返回None
+        """
+        while True:
+            with self._cond:
+                ready = self._take_ready()
+            if ready[0] is None:
+                return ready[1]
+            self._send(*ready)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    ready = self._take_ready()
+                    if ready[0] is not None:
+                        break
+                    self._cond.wait(timeout=ready[1])
+            self._send(*ready)
+
+    def _send(self, unit, kind, value, version):
+        # 二进制帧的序号取指令版本号的低16位，重发失败的指令时序号不变
+        binary = unit in self.binary_units
+        payload = encode_command(kind, value, ac_protocol.next_seq(version - 1), binary)
+        # 先标记为已发布：固件的状态回复可能在发布函数返回之前就被处理
+        self.state_cache.mark_published(unit, version)
+        try:
+            ok = self._publish(command_topic(unit), payload)
+        except Exception as e:
+            print(f"发送空调指令失败: {e}")
+            ok = False
+
+        with self._cond:
+            if ok:
+                self.stats["published"] += 1
+                print(f"已发送空调指令: {command_topic(unit)} {payload.hex() if binary else payload}")
+            else:
+                self.stats["failed"] += 1
+                self.state_cache.mark_published(unit, version, published=False)
+                # 发送失败时重新排队，除非期间已有更新的同类指令
+                pending = self._pending.setdefault(unit, {})
+                if kind not in pending:
+                    pending[kind] = (value, self._clock() + self.min_interval, version)
+                else:
+                    self.state_cache.supersede(unit, version, pending[kind][2])
@@ -0,0 +1,363 @@
+import time
+import heapq
+import bisect
+import threading
+from collections import deque
+
+ALERT_OPS = (">", ">=", "<", "<=")
+ALERT_AGGS = ("avg", "min", "max")
+MAX_ALERT_EVENTS = 200  # 内存中保留的最近告警事件数量
+TICK_INTERVAL = 1.0     # 后台检查“持续时间”和“无数据”告警的间隔（秒）
+
+
+class WindowAggregate:
+    """
+    时间窗口内的平均值、最小值、最大值
+    平均值用滑动求和，最小值/最大值用单调队列，每次更新均摊 O(1)
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._values = deque()     # (时间, 值)
+        self._total = 0.0
+        self._min_queue = deque()  # 值递增
+        self._max_queue = deque()  # 值递减
+
+    def add(self, ts, value):
+        self._values.append((ts, value))
+        self._total += value
+        while self._min_queue and self._min_queue[-1][1] >= value:
+            self._min_queue.pop()
+        self._min_queue.append((ts, value))
+        while self._max_queue and self._max_queue[-1][1] <= value:
+            self._max_queue.pop()
+        self._max_queue.append((ts, value))
+
+        cutoff = ts - self.window
+        while self._values[0][0] <= cutoff:
+            self._total -= self._values.popleft()[1]
+        while self._min_queue[0][0] <= cutoff:
+            self._min_queue.popleft()
+        while self._max_queue[0][0] <= cutoff:
+            self._max_queue.popleft()
+
+    def value(self, agg):
+        if agg == "avg":
+            return self._total / len(self._values)
+        if agg == "min":
+            return self._min_queue[0][1]
+        return self._max_queue[0][1]
+
+
+class AlertRule:
+    """
+    告警规则，由字典定义：
+    - 阈值: {"name": "high_temperature", "field": "temperature", "op": ">", "value": 28, "for": 300}
+      可选 "agg"（avg/min/max）和 "window"（秒），与窗口聚合值比较；"for" 为条件需要持续的秒数
+    - 无数据: {"name": "no_data", "no_data_for": 600}，设备超过指定秒数没有上报时告警
+    """
+
+    def __init__(self, rule_id, definition):
+        self.id = rule_id
+        self.name = definition.get("name") or f"rule_{rule_id}"
+        self.no_data_for = definition.get("no_data_for")
+        self.field = definition.get("field")
+        self.op = definition.get("op")
+        self.value = definition.get("value")
+        self.duration = definition.get("for", 0)
+        self.agg = definition.get("agg")
+        self.window = definition.get("window")
+
+        if self.no_data_for is not None:
+            if self.no_data_for <= 0:
+                raise ValueError(f"告警规则 {self.name}: no_data_for 需要大于0")
+            return
+        if not self.field or self.op not in ALERT_OPS or not isinstance(self.value, (int, float)):
+            raise ValueError(f"告警规则 {self.name}: 需要 field、op（{' '.join(ALERT_OPS)}）和数值 value")
+        if self.agg is not None and (self.agg not in ALERT_AGGS or not self.window or self.window <= 0):
+            raise ValueError(f"告警规则 {self.name}: agg 可选 {', '.join(ALERT_AGGS)}，并需要 window（秒）")
+        if self.duration < 0:
+            raise ValueError(f"告警规则 {self.name}: for 不能小于0")
+
+    @property
+    def source(self):
+        """规则比较的数据来源：(字段, 聚合方式, 窗口)，相同来源的规则共用一个窗口聚合"""
+        return (self.field, self.agg, self.window)
+
+    def describe(self):
+        if self.no_data_for is not None:
+            return f"超过 {self.no_data_for} 秒没有数据"
+        subject = self.field if self.agg is None else f"{self.window}秒{self.agg}({self.field})"
+        text = f"{subject} {self.op} {self.value}"
+        return f"{text} 持续 {self.duration} 秒" if self.duration else text
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "condition": self.describe()}
+
+
+class ThresholdGroup:
+    """
+    同一数据来源、同一比较方向的规则，按阈值排序
+    某个值满足的规则是排序后的一段前缀（> >=）或后缀（< <=），用二分查找得到分界位置
+    值变化时只有两个分界位置之间的规则状态会改变，与规则总数无关
+    """
+
+    def __init__(self, op, rules):
+        self.op = op
+        self.rules = sorted(rules, key=lambda rule: rule.value)
+        self.thresholds = [rule.value for rule in self.rules]
+        self.prefix = op in (">", ">=")
+        # 没有任何规则满足时的分界位置
+        self.empty = 0 if self.prefix else len(self.rules)
+
+    def boundary(self, value):
+        if self.op == ">":
+            return bisect.bisect_left(self.thresholds, value)
+        if self.op == ">=":
+            return bisect.bisect_right(self.thresholds, value)
+        if self.op == "<":
+            return bisect.bisect_right(self.thresholds, value)
+        return bisect.bisect_left(self.thresholds, value)
+
+    def satisfied(self, boundary, index):
+        return index < boundary if self.prefix else index >= boundary
+
+
+class DeviceState:
+    def __init__(self):
+        self.last_seen = None      # 最新读数的设备时间（阈值和持续时间按设备时间计算）
+        self.last_received = None  # 最近一次收到读数的服务器时间（“无数据”按服务器时间计算）
+        self.windows = {}      # 数据来源 -> WindowAggregate
+        self.current = {}      # 数据来源 -> 最新值（或窗口聚合值）
+        self.boundaries = {}   # ThresholdGroup -> 分界位置
+        self.pending = {}      # 规则id -> (计时版本号, 到期的设备时间)（条件已满足，等待持续时间）
+        self.generation = 0
+        self.firing = {}       # 规则id -> 告警事件
+        self.stale_scheduled = False
+
+
+class AlertEngine:
+    """
+    按设备增量计算的告警规则引擎
+    - 规则按数据来源 (字段, 聚合, 窗口) 和比较方向分组，每条消息对每个数据来源只更新一次窗口聚合、
+      每组做一次二分查找，只处理状态发生变化的规则，计算量不随规则数量增长
+    - “持续时间”和“无数据”告警的到期时间放在一个最小堆中（服务器时间），收到消息时和后台线程每秒检查一次
+    - 阈值和持续时间按读数的设备时间计算；“无数据”按服务器收到读数的时间计算，设备时钟偏慢或补传历史数据时不会误报
+    - 告警事件（firing/resolved）交给 emit 回调（例如发布到MQTT），同时保留在内存中供HTTP长轮询
+    """
+
+    def __init__(self, rules, emit=None, max_events=MAX_ALERT_EVENTS, tick_interval=TICK_INTERVAL):
+        self.rules = [AlertRule(i + 1, definition) for i, definition in enumerate(rules)]
+        self._emit = emit
+        self.tick_interval = tick_interval
+
+        by_group = {}
+        for rule in self.rules:
+            if rule.no_data_for is None:
+                by_group.setdefault((rule.source, rule.op), []).append(rule)
+        self._sources = {}  # 字段 -> [(数据来源, [ThresholdGroup, ...]), ...]
+        for (source, op), rules_in_group in by_group.items():
+            entries = self._sources.setdefault(source[0], [])
+            for entry in entries:
+                if entry[0] == source:
+                    entry[1].append(ThresholdGroup(op, rules_in_group))
+                    break
+            else:
+                entries.append((source, [ThresholdGroup(op, rules_in_group)]))
+        self._stale_rules = sorted((rule for rule in self.rules if rule.no_data_for is not None),
+                                   key=lambda rule: rule.no_data_for)
+
+        self._devices = {}
+        self._heap = []     # (到期的服务器时间, 序号, 类型, 设备, 规则id, 计时版本号)
+        self._counter = 0
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=max_events)
+        self._outbox = []   # 待交给 emit 的事件，在锁外发送
+        self._next_event_id = 1
+        self._running = False
+        self._thread = None
+        self.stats = {"messages": 0, "out_of_order": 0, "group_updates": 0, "transitions": 0, "events": 0}
+
+    # ---------------- 输入 ----------------
+
+    def observe(self, device, ts, values, received_at=None):
+        """
+        处理一条读数（ts 为读数时间，整数Unix时间戳；received_at 为服务器收到的时间，默认为当前时间）
+        窗口聚合和持续时间按时间顺序计算，早于该设备已处理读数的（乱序到达、更早的补传数据）只计数不处理
+        """
+        received_at = time.time() if received_at is None else received_at
+        with self._cond:
+            self.stats["messages"] += 1
+            state = self._devices.get(device)
+            if state is None:
+                state = self._devices[device] = DeviceState()
+            # 设备确实在上报，乱序的读数也刷新“无数据”计时
+            state.last_received = received_at if state.last_received is None else max(state.last_received, received_at)
+            if state.last_seen is not None and ts < state.last_seen:
+                self.stats["out_of_order"] += 1
+                return
+            state.last_seen = ts
+            for rule in self._stale_rules:
+                if rule.id in state.firing:
+                    self._resolve(state, device, rule, None, ts)
+            if self._stale_rules and not state.stale_scheduled:
+                self._schedule(state.last_received + self._stale_rules[0].no_data_for, "stale", device, None, None)
+                state.stale_scheduled = True
+
+            for field, sources in self._sources.items():
+                value = values.get(field)
+                if value is None:
+                    continue
+                for source, groups in sources:
+                    _, agg, window = source
+                    if agg is not None:
+                        aggregate = state.windows.get(source)
+                        if aggregate is None:
+                            aggregate = state.windows[source] = WindowAggregate(window)
+                        aggregate.add(ts, value)
+                        value_for_source = aggregate.value(agg)
+                    else:
+                        value_for_source = value
+                    state.current[source] = value_for_source
+                    for group in groups:
+                        self._update_group(state, device, group, value_for_source, ts, received_at)
+
+            # 条件一直满足、设备时间已经越过持续时间的到期点（例如一次补传的多条历史读数）
+            for rule_id, (generation, deadline) in list(state.pending.items()):
+                if deadline <= ts:
+                    del state.pending[rule_id]
+                    rule = self.rules[rule_id - 1]
+                    self._fire(state, device, rule, state.current.get(rule.source), deadline)
+            self._run_due(received_at)
+        self._flush()
+
+    def tick(self, now=None):
+        """检查到期的“持续时间”和“无数据”告警（now 为服务器时间）"""
+        with self._cond:
+            self._run_due(time.time() if now is None else now)
+        self._flush()
+
+    # ---------------- 状态更新 ----------------
+
+    def _update_group(self, state, device, group, value, ts, received_at):
+        self.stats["group_updates"] += 1
+        new = group.boundary(value)
+        old = state.boundaries.get(group, group.empty)
+        if new == old:
+            return
+        state.boundaries[group] = new
+        for index in range(min(old, new), max(old, new)):
+            rule = group.rules[index]
+            self.stats["transitions"] += 1
+            if group.satisfied(new, index):
+                if rule.duration:
+                    state.generation += 1
+                    state.pending[rule.id] = (state.generation, ts + rule.duration)
+                    # 之后没有新读数时由后台检查按服务器时间到期
+                    self._schedule(received_at + rule.duration, "rule", device, rule.id, state.generation)
+                else:
+                    self._fire(state, device, rule, value, ts)
+            else:
+                state.pending.pop(rule.id, None)
+                if rule.id in state.firing:
+                    self._resolve(state, device, rule, value, ts)
+
+    def _schedule(self, deadline, kind, device, rule_id, generation):
+        self._counter += 1
+        heapq.heappush(self._heap, (deadline, self._counter, kind, device, rule_id, generation))
+
+    def _run_due(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, kind, device, rule_id, generation = heapq.heappop(self._heap)
+            state = self._devices[device]
+            if kind == "rule":
+                pending = state.pending.get(rule_id)
+                if pending is not None and pending[0] == generation:
+                    del state.pending[rule_id]
+                    rule = self.rules[rule_id - 1]
+                    self._fire(state, device, rule, state.current.get(rule.source), pending[1])
+                continue
+
+            # 无数据检查：收到新消息后不会删除旧的到期项，到期时按最后收到读数的服务器时间重新计算
+            state.stale_scheduled = False
+            silent = now - state.last_received
+            for rule in self._stale_rules:
+                if rule.no_data_for > silent:
+                    self._schedule(state.last_received + rule.no_data_for, "stale", device, None, None)
+                    state.stale_scheduled = True
+                    break
+                if rule.id not in state.firing:
+                    self._fire(state, device, rule, silent, now)
+
+    # ---------------- 事件 ----------------
+
+    def _event(self, device, rule, status, value, ts):
+        event = {
+            "id": self._next_event_id,
+            "device": device,
+            "rule": rule.name,
+            "status": status,
+            "condition": rule.describe(),
+            "value": value,
+            "ts": int(ts)
+        }
+        self._next_event_id += 1
+        self._events.append(event)
+        self._outbox.append(event)
+        self.stats["events"] += 1
+        self._cond.notify_all()
+        return event
+
+    def _fire(self, state, device, rule, value, ts):
+        state.firing[rule.id] = self._event(device, rule, "firing", value, ts)
+
+    def _resolve(self, state, device, rule, value, ts):
+        del state.firing[rule.id]
+        self._event(device, rule, "resolved", value, ts)
+
+    def _flush(self):
+        with self._cond:
+            events, self._outbox = self._outbox, []
+        if self._emit:
+            for event in events:
+                try:
+                    self._emit(event)
+                except Exception as e:
+                    print(f"发送告警事件失败: {e}")
+
+    # ---------------- 查询 ----------------
+
+    def events_since(self, last_id=0, timeout=0):
+        """返回编号大于 last_id 的事件；没有新事件时最多等待 timeout 秒（长轮询）"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._events and self._events[-1]["id"] > last_id, timeout=timeout)
+            return [event for event in self._events if event["id"] > last_id]
+
+    def active(self):
+        """正在告警的 (设备, 规则)"""
+        with self._cond:
+            return [event for state in self._devices.values() for event in state.firing.values()]
+
+    # ---------------- 后台线程 ----------------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="alert-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.tick_interval)
+                if not self._running:
+                    return
+            self.tick()
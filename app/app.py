@@ -1,85 +1,612 @@
-import json
 import time
-from datetime import datetime
-from flask import Flask, render_template, jsonify
-import paho.mqtt.client as mqtt
+PROCESS_START = time.monotonic()  # 用于统计启动耗时，需要在其他导入之前记录
+
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import Flask, Response, render_template, jsonify, request
 from sensor_parser import parse_mqtt_payload, hex_to_bytes
+from ac_control import ACStateCache, CommandDispatcher, command_seq, parse_command, status_topic, validate_unit
+from mqtt_manager import ManagedMQTTClient
+from query_cache import QueryCache
+from storage import STORAGE_COLUMNS, open_storage, row_from_record
+from export import PYARROW_FORMATS, export_stream, parse_time, pyarrow_available
+from series import SeriesService, DEFAULT_POINTS
+from hot_store import HotStore
+from journal import PacketJournal
+from batch_writer import BatchWriter
+from warm_start import load_recent, history_record
+from ingest import DedupStage, Deadband, event_time, next_sequence
+from alerts import AlertEngine
+from thermostat import ThermostatService
 import os
-import argparse
 import random
 
 app = Flask(__name__)
 
+# 数据库配置（位于 instance 目录）
+# 存储引擎: sqlite（默认）、duckdb（需要安装duckdb）、memory（不持久化，用于测试）
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'sqlite')
+DB_PATH = os.path.join(app.instance_path, 'sensor_data.db')
+DUCKDB_PATH = os.path.join(app.instance_path, 'sensor_data.duckdb')
+RETENTION_DAYS = 180  # 数据库保留最近180天的数据
+os.makedirs(app.instance_path, exist_ok=True)
+storage = open_storage(STORAGE_ENGINE, DUCKDB_PATH if STORAGE_ENGINE == 'duckdb' else DB_PATH)
+
+# 查询结果缓存（范围查询和图表序列共用），写入新数据时失效覆盖该时间点的条目
+query_cache = QueryCache()
+
+# 图表序列查询（与范围查询共用查询结果缓存）
+series_service = SeriesService(storage, query_cache)
+DEFAULT_HISTORY_RANGE = timedelta(hours=24)  # /api/history 省略 start 时查询的时间范围
+MAX_HISTORY_RANGE = timedelta(days=31)  # /api/history 单次最多查询的时间范围，更长的范围使用 /api/export
+
 # 存储最近接收到的数据
 sensor_data_history = []
 MAX_HISTORY_SIZE = 50  # 最多保存50条历史记录
 
+# 最近读数的列式内存存储（每台设备一个环形缓冲区，用于窗口统计和图表）
+hot_store = HotStore()
+
+# 入库前的去重和死区压缩
+dedup_stage = DedupStage()
+DEADBAND_ENABLED = False  # 开启后温湿度变化不超过阈值的读数只保留在内存中，按心跳间隔写入数据库
+deadband = Deadband()
+
 # MQTT配置
 MQTT_BROKER = "192.168.1.59"  # MQTT服务器地址
 MQTT_PORT = 1883  # MQTT服务器端口
 MQTT_TOPIC = "qingping/up"  # 订阅的主题
+MQTT_CLIENT_ID = "qingping-monitor"  # 固定客户端ID，用于持久会话
+MQTT_KEEPALIVE = 30  # 心跳间隔（秒）
+MQTT_TOPIC_QOS = {MQTT_TOPIC: 1}  # 各主题的QoS
 
-# 添加命令行参数解析
-parser = argparse.ArgumentParser(description='青萍传感器数据监控应用')
-parser.add_argument('--port', type=int, default=os.environ.get('PORT', 5001), 
-                    help='Web服务器端口号 (默认: 5001)')
-args = parser.parse_args()
+# 红外解码服务（共享解码器实例和结果缓存），第一次请求时才导入和创建
+ir_decode_service = None
+ir_decode_lock = threading.Lock()
+MAX_IR_BATCH_SIZE = 64  # 单次请求最多解码的捕获数量
+IR_CALIBRATION_FILE = os.path.join(app.instance_path, 'ir_calibration.json')  # 各接收器的时序校准结果
 
-# MQTT回调函数
-def on_connect(client, userdata, flags, rc):
-    print(f"已连接到MQTT服务器，返回码: {rc}")
-    client.subscribe(MQTT_TOPIC)
-    print(f"已订阅主题: {MQTT_TOPIC}")
+# 空调控制配置
+AC_UNITS = ["stickc"]  # 红外发射端编号，对应主题 <编号>/aircon 和 <编号>/up
+AC_STATUS_TOPICS = {status_topic(unit): unit for unit in AC_UNITS}
+AC_BINARY_UNITS = []  # 支持二进制指令帧（ac_protocol）的空调，其余发送旧格式API字符串
+MAX_AC_WAIT = 30  # 长轮询最长等待时间（秒）
+
+# 告警规则（按设备增量计算，见 alerts.AlertRule），告警事件发布到 ALERT_TOPIC 并可通过 /api/alerts 获取
+ALERT_TOPIC = "qingping/alerts"
+ALERT_RULES = [
+    {"name": "high_temperature", "field": "temperature", "op": ">", "value": 28, "for": 300},
+    {"name": "low_battery", "field": "battery", "op": "<", "value": 15},
+    {"name": "no_data", "no_data_for": 600},
+]
+MAX_ALERT_WAIT = 30  # 告警长轮询最长等待时间（秒）
+
+# 恒温控制（见 thermostat.RoomThermostat），每个房间一个传感器主题对应一台空调，默认不启用，例如:
+# {"room": "bedroom", "device": "qingping/up", "unit": "stickc", "setpoint": 26, "mode": "hysteresis"}
+THERMOSTAT_ROOMS = []
+
+# 启动耗时统计（秒）
+startup_metrics = {
+    "import_seconds": None,         # 进程启动到模块导入完成
+    "warm_seconds": None,           # 从数据库预热内存数据
+    "warm_records": 0,
+    "replay_seconds": None,         # 回放预写日志
+    "replayed_records": 0,
+    "ready_seconds": None,          # 进程启动到开始监听端口
+    "first_request_seconds": None   # 进程启动到处理第一个请求
+}
 
+# MQTT回调函数
 def on_message(client, userdata, msg):
+    # 空调状态反馈
+    if msg.topic in AC_STATUS_TOPICS:
+        state = ac_dispatcher.handle_status(AC_STATUS_TOPICS[msg.topic], msg.payload)
+        if state:
+            print(f"空调状态更新: {msg.topic} {state}")
+        return
+
+    # 先写入预写日志，再解析；数据库由后台线程批量写入，提交后推进日志检查点
+    received_at = time.time()
     try:
-        # 解析MQTT消息
-        payload = msg.payload
-        parsed_data, hex_data = parse_mqtt_payload(payload)
-        
-        # 添加时间戳
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 创建记录
-        record = {
-            "timestamp": timestamp,
-            "topic": msg.topic,
-            "hex_data": hex_data,
-            "parsed_data": parsed_data
-        }
-        
-        # 添加到历史记录
-        global sensor_data_history
-        sensor_data_history.insert(0, record)  # 新数据插入到列表开头
-        
-        # 限制历史记录大小
-        if len(sensor_data_history) > MAX_HISTORY_SIZE:
-            sensor_data_history = sensor_data_history[:MAX_HISTORY_SIZE]
-            
-        print(f"收到新数据: {json.dumps(record, ensure_ascii=False)}")
+        position = packet_journal.append(msg.topic, msg.payload, received_at)
+    except OSError as e:
+        print(f"写入预写日志失败: {e}")
+        position = None
+    try:
+        records = ingest_packet(msg.topic, msg.payload, received_at)
+        db_writer.add_many(records, position)
     except Exception as e:
         print(f"处理消息时出错: {e}")
 
-# 初始化MQTT客户端
-mqtt_client = mqtt.Client()
-mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
+def ingest_packet(topic, payload, received_at, verbose=True, live=True):
+    """
+    解析传感器数据包，加入内存历史记录和列式内存存储
+    返回需要保存到数据库的记录列表（补传的历史数据每条读数一条记录）；
+    解析失败、重复的数据包或被死区压缩的读数不返回记录
+    live 为 False 时（启动回放日志）不驱动恒温控制
+    """
+    global sensor_data_history
+    parsed_data, hex_data = parse_mqtt_payload(payload)
+
+    # 重复的数据包（传感器重发、重复投递）不再处理
+    if dedup_stage.seen(topic, parsed_data.get("_timestamp"), payload, received_at):
+        if verbose:
+            print(f"跳过重复数据包: {topic} {hex_data}")
+        return []
+    
+    # 读数时间（整数Unix时间戳，设备时间优先），只在API返回时格式化
+    ts = event_time(parsed_data.get("_timestamp"), received_at)
+    
+    # 创建记录
+    record = {
+        "ts": ts,
+        "seq": next_sequence(),
+        "topic": topic,
+        "hex_data": hex_data,
+        "parsed_data": parsed_data
+    }
+    
+    # 添加到历史记录
+    sensor_data_history.insert(0, record)  # 新数据插入到列表开头
+    
+    # 限制历史记录大小
+    if len(sensor_data_history) > MAX_HISTORY_SIZE:
+        sensor_data_history = sensor_data_history[:MAX_HISTORY_SIZE]
+
+    if verbose:
+        print(f"收到新数据: {json.dumps(record, ensure_ascii=False)}")
+    if "error" in parsed_data:
+        return []
+    if "_history" in parsed_data:
+        return history_records(topic, parsed_data["_history"], received_at)
+    hot_store.append(topic, ts, parsed_data)
+    alert_engine.observe(topic, ts, parsed_data, received_at)
+    if live:
+        thermostat_service.observe(topic, ts, parsed_data, received_at)
+    if DEADBAND_ENABLED and not deadband.should_store(topic, ts, parsed_data):
+        return []
+    return [record]
+
+def history_records(topic, samples, received_at):
+    """
+    补传的历史数据：每条读数按自己的时间戳（基准时间 + 序号 * 间隔）生成一条数据库记录
+    与之前补传过的读数重复的跳过；早于内存中最新读数的只写入数据库
+    新的读数按时间顺序交给告警引擎：补传后“无数据”告警恢复，阈值规则能看到最新的读数
+    """
+    records = []
+    observed = []
+    for sample in samples:
+        if dedup_stage.seen(topic, sample["timestamp"], sample["_record"].encode(), received_at):
+            continue
+        sample_time = event_time(sample["timestamp"], received_at)
+        fields = {name: value for name, value in sample.items() if not name.startswith("_") and name != "timestamp"}
+        hot_store.append(topic, sample_time, fields)
+        observed.append((sample_time, fields))
+        if DEADBAND_ENABLED and not deadband.should_store(topic, sample_time, fields):
+            continue
+        parsed_data = dict(fields, _raw_hex=sample["_record"], _format="434731", _timestamp=sample["timestamp"])
+        records.append({
+            "ts": sample_time,
+            "seq": next_sequence(),
+            "topic": topic,
+            "hex_data": sample["_record"],
+            "parsed_data": parsed_data
+        })
+    observed.sort(key=lambda item: item[0])
+    for sample_time, fields in observed:
+        alert_engine.observe(topic, sample_time, fields, received_at)
+    return records
+
+def get_ir_decode_service():
+    """延迟导入红外解码器，不用红外解码时不影响启动速度"""
+    global ir_decode_service
+    with ir_decode_lock:
+        if ir_decode_service is None:
+            from ir_service import IRDecodeService
+            ir_decode_service = IRDecodeService(calibration_file=IR_CALIBRATION_FILE)
+        return ir_decode_service
+
+def warm_from_db():
+    """
+    从数据库读取最近的读数，恢复内存历史记录和列式内存存储
+    重启后页面不再是空白，直到收到新消息
+    """
+    global sensor_data_history
+    started = time.monotonic()
+    readings = load_recent(storage, hot_store.capacity)
+    # 按时间顺序分配序号，最旧的读数序号最小
+    sensor_data_history = [history_record(*reading) for reading in reversed(readings[:MAX_HISTORY_SIZE])][::-1]
+    for ts, topic, _, fields in reversed(readings):
+        hot_store.append(topic, ts, fields)
+    startup_metrics["warm_seconds"] = round(time.monotonic() - started, 3)
+    startup_metrics["warm_records"] = len(readings)
+    print(f"已从数据库预热 {len(readings)} 条读数，耗时 {startup_metrics['warm_seconds']} 秒")
+
+def replay_journal():
+    """启动时回放预写日志中尚未写入数据库的数据包，恢复数据库和内存数据"""
+    started = time.monotonic()
+    count = 0
+    for topic, payload, received_at, position in packet_journal.replay():
+        try:
+            records = ingest_packet(topic, bytes(payload), received_at, verbose=False, live=False)
+        except Exception as e:
+            print(f"回放数据包时出错: {e}")
+            records = []
+        db_writer.add_many(records, position)
+        count += 1
+    db_writer.flush()
+    startup_metrics["replay_seconds"] = round(time.monotonic() - started, 3)
+    startup_metrics["replayed_records"] = count
+    if count:
+        print(f"已回放预写日志 {count} 条，耗时 {startup_metrics['replay_seconds']} 秒")
+    return count
+
+def write_records(records):
+    """批量写入数据库（在后台写入线程中调用），一次事务提交"""
+    rows = [row_from_record(record) for record in records]
+    storage.append_batch(rows)
+    for row in rows:
+        query_cache.invalidate(datetime.fromtimestamp(row[0]))
+
+def history_rows(start=None, end=None):
+    """
+    带缓存的范围查询，返回字典列表
+    start/end 省略时为到当前时间为止的最近24小时，范围最多31天，参数无效时抛出ValueError
+    调用者指定的、已经结束的时间范围永久缓存；未指定 end（或 end 还没到）时查询到当前时间，
+    缓存键中用None表示“到现在”，按TTL缓存，默认参数的重复请求命中同一个条目
+    """
+    now = datetime.now()
+    closed = end is not None and end < now
+    key = ("range", start, end if closed else None)
+    rows = query_cache.get(key)
+    if rows is not None:
+        return rows
+
+    end = end if closed else now
+    start = start or end - DEFAULT_HISTORY_RANGE
+    if start >= end:
+        raise ValueError("start 需要早于 end")
+    if end - start > MAX_HISTORY_RANGE:
+        raise ValueError("时间范围超过31天，请使用 /api/export 导出")
+
+    generation = query_cache.generation
+    rows = []
+    for ts, *values in storage.range_query(int(start.timestamp()), int(end.timestamp())):
+        row = dict(zip(STORAGE_COLUMNS, values))
+        row["timestamp"] = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+        row["timestamp_unix"] = ts
+        rows.append(row)
+    query_cache.put(key, rows, start, end, closed=closed, generation=generation)
+    return rows
+
+def apply_retention():
+    """删除超过保留期限的数据，每天执行一次"""
+    try:
+        deleted = storage.retention(int(time.time()) - RETENTION_DAYS * 86400)
+        if deleted:
+            # 删除的数据可能在任何已缓存的范围内
+            query_cache.clear()
+            print(f"已删除 {deleted} 条超过 {RETENTION_DAYS} 天的数据")
+    except Exception as e:
+        print(f"清理旧数据时出错: {e}")
+    timer = threading.Timer(86400, apply_retention)
+    timer.daemon = True
+    timer.start()
+
+# 原始数据包预写日志和数据库批量写入
+JOURNAL_DIR = os.path.join(app.instance_path, 'journal')
+packet_journal = PacketJournal(JOURNAL_DIR)
+db_writer = BatchWriter(write_records, on_committed=packet_journal.checkpoint)
+
+# 初始化MQTT客户端（持久会话、指数退避重连）
+mqtt_manager = ManagedMQTTClient(MQTT_BROKER, MQTT_PORT, client_id=MQTT_CLIENT_ID, keepalive=MQTT_KEEPALIVE)
+mqtt_manager.on_message = on_message
+for topic, qos in MQTT_TOPIC_QOS.items():
+    mqtt_manager.subscribe(topic, qos)
+for topic in AC_STATUS_TOPICS:
+    mqtt_manager.subscribe(topic, 1)
+
+def publish_ac_command(topic, payload):
+    """发布空调指令，返回是否成功交给MQTT客户端"""
+    return mqtt_manager.publish(topic, payload, qos=1)
+
+def publish_alert(event):
+    """告警事件以JSON发布到告警主题"""
+    mqtt_manager.publish(ALERT_TOPIC, json.dumps(event, ensure_ascii=False), qos=1)
+
+alert_engine = AlertEngine(ALERT_RULES, emit=publish_alert)
+
+# 空调状态缓存和指令调度器（合并重复指令并限制发送频率）
+ac_state_cache = ACStateCache()
+ac_dispatcher = CommandDispatcher(publish_ac_command, ac_state_cache, binary_units=AC_BINARY_UNITS)
+
+# 恒温控制：根据实时读数向调度器提交开关机和设定温度指令，空调实际状态以状态反馈为准
+thermostat_service = ThermostatService(THERMOSTAT_ROOMS, submit=ac_dispatcher.submit, ac_state=ac_state_cache.get)
+
+@app.before_request
+def record_first_request():
+    if startup_metrics["first_request_seconds"] is None:
+        startup_metrics["first_request_seconds"] = round(time.monotonic() - PROCESS_START, 3)
+        print(f"启动到第一个请求耗时 {startup_metrics['first_request_seconds']} 秒")
 
 # Flask路由
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def record_view(record):
+    """内存记录转换为API返回格式，在这里才把时间戳格式化为字符串"""
+    view = dict(record)
+    view["timestamp"] = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    return view
+
 @app.route('/api/data')
 def get_data():
-    return jsonify(sensor_data_history)
+    return jsonify([record_view(record) for record in sensor_data_history])
 
 @app.route('/api/latest')
 def get_latest():
     if sensor_data_history:
-        return jsonify(sensor_data_history[0])
+        return jsonify(record_view(sensor_data_history[0]))
     return jsonify({})
 
+@app.route('/api/export')
+def export_data():
+    """
+    导出数据库中的传感器数据
+    参数: start、end（日期、日期时间或Unix时间戳，均可省略），format=csv|ndjson|parquet|arrow，raw=1 同时导出原始数据
+    数据从SQLite分块读取后逐块输出，导出大时间范围时内存占用不随行数增长
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if storage.name != 'sqlite':
+        return jsonify({"error": f"导出目前只支持sqlite存储引擎（当前为 {storage.name}）"}), 501
+    if fmt in PYARROW_FORMATS and not pyarrow_available():
+        return jsonify({"error": f"导出 {fmt} 格式需要安装 pyarrow"}), 501
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+        include_raw = request.args.get('raw') in ('1', 'true')
+        if not os.path.exists(DB_PATH):
+            return jsonify({"error": "数据库不存在"}), 404
+        stream, mimetype, extension = export_stream(DB_PATH, fmt, start, end, include_raw)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filename = "sensor_data"
+    if start:
+        filename += start.strftime("_%Y%m%d%H%M%S")
+    if end:
+        filename += end.strftime("_%Y%m%d%H%M%S")
+    headers = {"Content-Disposition": f"attachment; filename={filename}.{extension}"}
+    return Response(stream, mimetype=mimetype, headers=headers)
+
+@app.route('/api/hot/stats')
+def hot_stats():
+    """
+    最近读数的窗口统计（最小值、最大值、平均值、最新值）
+    参数: field（默认temperature），window=秒（默认3600，0表示全部），device=主题（省略时返回所有设备）
+    """
+    field = request.args.get('field', 'temperature')
+    try:
+        window = float(request.args.get('window', 3600))
+        since = time.time() - window if window > 0 else None
+        devices = [request.args['device']] if 'device' in request.args else hot_store.devices()
+        result = {device: hot_store.window_stats(device, field, since) for device in devices}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"field": field, "window": window, "devices": result, "store": hot_store.stats()})
+
+@app.route('/api/hot/series')
+def hot_series():
+    """
+    最近读数的原始序列
+    参数: device=主题（默认为传感器主题），field（默认temperature），window=秒（默认3600，0表示全部）
+    """
+    device = request.args.get('device', MQTT_TOPIC)
+    field = request.args.get('field', 'temperature')
+    try:
+        window = float(request.args.get('window', 3600))
+        times, values = hot_store.series(device, field, time.time() - window if window > 0 else None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"device": device, "field": field, "t": times, "value": values})
+
+@app.route('/api/history')
+def get_history():
+    """
+    查询数据库中指定时间范围的数据
+    参数: start、end（省略时为最近24小时），范围最多31天
+    """
+    try:
+        rows = history_rows(parse_time(request.args.get('start')), parse_time(request.args.get('end')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(rows)
+
+@app.route('/api/startup')
+def startup_stats():
+    """启动耗时（导入、预热、回放、开始监听、第一个请求）"""
+    return jsonify(startup_metrics)
+
+@app.route('/api/journal/stats')
+def journal_stats():
+    """预写日志和数据库批量写入统计"""
+    return jsonify({
+        "journal": packet_journal.stats,
+        "segments": packet_journal.segments(),
+        "checkpoint": packet_journal.read_checkpoint(),
+        "writer": db_writer.stats
+    })
+
+@app.route('/api/ingest/stats')
+def ingest_stats():
+    """去重和死区压缩统计"""
+    return jsonify({
+        "dedup": dedup_stage.stats,
+        "deadband": dict(deadband.stats, enabled=DEADBAND_ENABLED,
+                         thresholds=deadband.thresholds, heartbeat=deadband.heartbeat)
+    })
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """查询结果缓存统计（命中、未命中、淘汰、失效）"""
+    return jsonify(query_cache.stats())
+
+@app.route('/api/series')
+def get_series():
+    """
+    图表数据降采样
+    参数: field=temperature|humidity|pressure|battery|rssi，start、end（省略时为最近24小时），
+    points=N（默认500，最多5000），method=minmax（按时间分桶的最小/最大/平均值，默认）|lttb
+    """
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+        points = int(request.args.get('points', DEFAULT_POINTS))
+        result = series_service.query(request.args.get('field', 'temperature'), start, end, points,
+                                      request.args.get('method', 'minmax'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/ir/decode', methods=['POST'])
+def ir_decode():
+    """
+    解码原始红外脉冲数据
+    - JSON: {"raw": [...]} 或 {"captures": [[...], [...]]}，可选 "receiver_id"
+    - 二进制(application/octet-stream): 重复的 [数量uint16] + [脉冲uint16 * 数量]，小端序
+    """
+    receiver_id = request.args.get('receiver_id')
+    try:
+        if request.mimetype == 'application/octet-stream':
+            from ir_service import parse_binary_captures
+            captures = parse_binary_captures(request.get_data())
+        else:
+            from ir_service import parse_json_captures
+            body = request.get_json(silent=True)
+            if isinstance(body, dict):
+                receiver_id = body.get('receiver_id', receiver_id)
+                captures = body.get('captures') or ([body['raw']] if 'raw' in body else [])
+            elif isinstance(body, list):
+                # 兼容直接提交单个脉冲数组
+                captures = [body]
+            else:
+                captures = []
+            captures = parse_json_captures(captures)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"请求数据无效: {e}"}), 400
+
+    if not captures:
+        return jsonify({"error": "没有需要解码的脉冲数据"}), 400
+    if len(captures) > MAX_IR_BATCH_SIZE:
+        return jsonify({"error": f"单次最多解码 {MAX_IR_BATCH_SIZE} 组数据"}), 400
+
+    service = get_ir_decode_service()
+    results = service.decode_batch(captures, receiver_id)
+    return jsonify({"results": results, "cache": service.stats()})
+
+@app.route('/api/ac/<unit>/command', methods=['POST'])
+def ac_command(unit):
+    """
+    发送空调控制指令
+    请求体: {"command": "on"} / {"command": "off"} / {"command": "temp", "value": 25}
+    可带 "seq" 字段（0-65535），同一客户端（X-Client-Id 请求头或客户端地址）重试同一序号不会重复执行
+    Content-Type 为 application/octet-stream 时请求体为二进制指令帧
+    可选参数 wait=N: 最多等待N秒，直到空调确认该指令后再返回
+    """
+    try:
+        validate_unit(unit)
+        wait = min(float(request.args.get('wait', 0)), MAX_AC_WAIT)
+        if request.mimetype == 'application/octet-stream':
+            body = request.get_data()
+        else:
+            body = request.get_json(silent=True)
+            if body is None:
+                body = request.get_data(as_text=True)
+        kind, value = parse_command(body)
+        seq = command_seq(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # 序号按客户端区分：请求头 X-Client-Id，没有时使用客户端地址
+    client = request.headers.get('X-Client-Id') or request.remote_addr
+    result = ac_dispatcher.submit(unit, kind, value, seq, client)
+    result.update({
+        "unit": unit,
+        "command": kind,
+        "value": value
+    })
+    if wait > 0:
+        acknowledged, state = ac_state_cache.wait_for(unit, result["version"], wait)
+        result.update({"acknowledged": acknowledged, "state": state})
+        return jsonify(result), 200 if acknowledged else 202
+    result["pending"] = ac_dispatcher.pending(unit)
+    return jsonify(result), 202
+
+@app.route('/api/ac/<unit>/state')
+def ac_state(unit):
+    """
+    获取空调状态
+    可选参数 version=N&timeout=T: 长轮询，等待指令版本N被确认（最多T秒）
+    """
+    try:
+        validate_unit(unit)
+        version = request.args.get('version', type=int)
+        timeout = min(float(request.args.get('timeout', 10)), MAX_AC_WAIT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if version is None:
+        state = ac_state_cache.get(unit)
+        state["pending"] = ac_dispatcher.pending(unit)
+        return jsonify(state)
+
+    acknowledged, state = ac_state_cache.wait_for(unit, version, timeout)
+    state["confirmed"] = acknowledged
+    state["pending"] = ac_dispatcher.pending(unit)
+    return jsonify(state)
+
+@app.route('/api/alerts')
+def alerts():
+    """
+    当前告警和最近的告警事件
+    可选参数 since=N&timeout=T: 长轮询，等待编号大于N的事件（最多T秒）
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        timeout = min(float(request.args.get('timeout', 0)), MAX_ALERT_WAIT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "active": alert_engine.active(),
+        "events": alert_engine.events_since(since, timeout),
+        "rules": [rule.to_dict() for rule in alert_engine.rules],
+        "stats": alert_engine.stats
+    })
+
+@app.route('/api/thermostat')
+def thermostat_status():
+    """各房间恒温控制状态、统计和决策耗时（从收到读数到提交指令）"""
+    return jsonify(thermostat_service.status())
+
+@app.route('/api/thermostat/<room>', methods=['POST'])
+def update_thermostat(room):
+    """修改房间设定温度或启用/停用恒温控制，JSON: {"setpoint": 26, "enabled": true}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        status = thermostat_service.update_room(room, data.get("setpoint"), data.get("enabled"))
+    except KeyError:
+        return jsonify({"error": f"未配置的房间: {room}"}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(status)
+
+@app.route('/api/mqtt/metrics')
+def mqtt_metrics():
+    """MQTT连接指标（重连次数、重连耗时等）"""
+    return jsonify(mqtt_manager.get_metrics())
+
 # 测试数据生成函数（仅用于开发测试）
 def generate_test_data():
     """
@@ -224,56 +751,83 @@ def generate_test_data():
     return packet
 
 if __name__ == '__main__':
-    try:
-        # 连接到MQTT服务器
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        # 在后台线程中启动MQTT循环
-        mqtt_client.loop_start()
-        print(f"已连接到MQTT服务器 {MQTT_BROKER}:{MQTT_PORT}")
-    except Exception as e:
-        print(f"连接MQTT服务器失败: {e}")
-        print("将使用测试数据模式...")
-        
-        # 定义测试数据生成函数
-        def generate_test_data_record():
-            """生成测试数据记录并添加到历史记录中"""
-            try:
-                # 生成测试数据包
-                payload = generate_test_data()
-                
-                # 解析测试数据
-                parsed_data, hex_data = parse_mqtt_payload(payload)
-                
-                # 添加时间戳
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                # 创建记录
-                record = {
-                    "timestamp": timestamp,
-                    "topic": MQTT_TOPIC,
-                    "hex_data": hex_data,
-                    "parsed_data": parsed_data
-                }
+    import argparse
+
+    # 添加命令行参数解析
+    parser = argparse.ArgumentParser(description='青萍传感器数据监控应用')
+    parser.add_argument('--port', type=int, default=os.environ.get('PORT', 5001), 
+                        help='Web服务器端口号 (默认: 5001)')
+    args = parser.parse_args()
+    startup_metrics["import_seconds"] = round(time.monotonic() - PROCESS_START, 3)
+
+    # 先从数据库预热内存数据，再回放上次退出前未写入数据库的数据包（更新的数据），然后打开预写日志继续写入
+    warm_from_db()
+    replay_journal()
+    packet_journal.open()
+    db_writer.start()
+    apply_retention()
+
+    # 启动空调指令调度线程和告警检查线程
+    ac_dispatcher.start()
+    alert_engine.start()
+
+    # 连接MQTT服务器，服务器不可用时在后台按指数退避自动重试
+    mqtt_manager.start()
+
+    # 定义测试数据生成函数
+    def generate_test_data_record():
+        """生成测试数据记录并添加到历史记录中"""
+        try:
+            # 生成测试数据包
+            payload = generate_test_data()
+            
+            # 解析测试数据
+            parsed_data, hex_data = parse_mqtt_payload(payload)
+            
+            # 测试数据使用当前时间
+            ts = int(time.time())
+            
+            # 创建记录
+            record = {
+                "ts": ts,
+                "seq": next_sequence(),
+                "topic": MQTT_TOPIC,
+                "hex_data": hex_data,
+                "parsed_data": parsed_data
+            }
+            
+            # 添加到历史记录
+            global sensor_data_history
+            sensor_data_history.insert(0, record)
+            if len(sensor_data_history) > MAX_HISTORY_SIZE:
+                sensor_data_history = sensor_data_history[:MAX_HISTORY_SIZE]
+            if "error" not in parsed_data:
+                hot_store.append(MQTT_TOPIC, ts, parsed_data)
                 
-                # 添加到历史记录
-                global sensor_data_history
-                sensor_data_history.insert(0, record)
-                if len(sensor_data_history) > MAX_HISTORY_SIZE:
-                    sensor_data_history = sensor_data_history[:MAX_HISTORY_SIZE]
-                    
-                print(f"生成测试数据记录: 温度={parsed_data.get('temperature')}°C, 湿度={parsed_data.get('humidity')}%")
-            except Exception as e:
-                print(f"生成测试数据时出错: {e}")
-                import traceback
-                print(traceback.format_exc())
-        
-        # 定时生成测试数据
-        def schedule_test_data_generation():
-            """定时生成测试数据"""
-            import threading
-            generate_test_data_record()
-            # 每30秒生成一次测试数据
-            threading.Timer(30, schedule_test_data_generation).start()
+            print(f"生成测试数据记录: 温度={parsed_data.get('temperature')}°C, 湿度={parsed_data.get('humidity')}%")
+        except Exception as e:
+            print(f"生成测试数据时出错: {e}")
+            import traceback
+            print(traceback.format_exc())
+    
+    # 定时生成测试数据
+    def schedule_test_data_generation():
+        """定时生成测试数据，MQTT连接成功后停止"""
+        if mqtt_manager.has_connected():
+            print("MQTT已连接，停止生成测试数据")
+            return
+        generate_test_data_record()
+        # 每30秒生成一次测试数据
+        threading.Timer(30, schedule_test_data_generation).start()
+    
+    def wait_for_first_connect():
+        """等待首次连接，超时仍未连接则进入测试数据模式（在后台进行，不推迟Web服务器启动）"""
+        for _ in range(50):
+            if mqtt_manager.has_connected():
+                return
+            time.sleep(0.1)
+        print(f"暂时无法连接MQTT服务器 {MQTT_BROKER}:{MQTT_PORT}")
+        print("将使用测试数据模式，连接成功后自动停止...")
         
         # 立即生成一些初始测试数据
         for _ in range(3):
@@ -282,7 +836,11 @@ if __name__ == '__main__':
         
         # 启动定时生成测试数据
         schedule_test_data_generation()
+
+    threading.Thread(target=wait_for_first_connect, name="test-data", daemon=True).start()
     
     # 启动Flask应用，使用命令行参数或环境变量指定的端口
-    print(f"启动Web服务器，端口: {args.port}")
-    app.run(host='0.0.0.0', port=args.port, debug=True) 
\ No newline at end of file
+    startup_metrics["ready_seconds"] = round(time.monotonic() - PROCESS_START, 3)
+    print(f"启动Web服务器，端口: {args.port}，启动耗时 {startup_metrics['ready_seconds']} 秒")
+    # 关闭自动重载：重载进程会用相同的客户端ID再连一次，两个连接会互相踢下线
+    app.run(host='0.0.0.0', port=args.port, debug=True, use_reloader=False) 
\ No newline at end of file
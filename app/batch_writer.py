@@ -0,0 +1,106 @@
+import time
+import threading
+
+
+class BatchWriter:
+    """
+    批量写入数据库
+    - 记录先进入内存队列，凑满 max_batch 条或等待 max_delay 秒后由后台线程一次提交
+    - 每次提交成功后把最后一条记录的预写日志位置交给 on_committed（用于检查点）
+    - 提交失败时保留队列，稍后重试
+    """
+
+    def __init__(self, write_batch, on_committed=None, max_batch=200, max_delay=0.5):
+        self._write_batch = write_batch    # 写入函数 write_batch(records)
+        self._on_committed = on_committed  # 提交后的回调 on_committed(position)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._records = []
+        self._position = None   # 队列中最后一条数据的预写日志位置
+        self._first_at = None   # 队列中第一条数据的加入时间
+        self._running = False
+        self._thread = None
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failures": 0}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程，并提交剩余的数据"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+    def add(self, record, position=None):
+        """
+        加入一条记录；record 为None时只推进预写日志位置（例如无法解析的数据包）
+        """
+        self.add_many([] if record is None else [record], position)
+
+    def add_many(self, records, position=None):
+        """
+        加入同一个数据包解析出的多条记录（例如补传的历史数据）
+        这些记录一起进入队列，会在同一次提交中写入数据库
+        """
+        with self._cond:
+            self._records.extend(records)
+            self.stats["queued"] += len(records)
+            if position is not None:
+                self._position = position
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            if len(self._records) >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self):
+        """立即提交队列中的数据，返回提交的条数"""
+        with self._cond:
+            records, position = self._records, self._position
+            self._records, self._position, self._first_at = [], None, None
+        if not records and position is None:
+            return 0
+        try:
+            if records:
+                self._write_batch(records)
+        except Exception as e:
+            print(f"批量写入数据库失败: {e}")
+            with self._cond:
+                # 放回队列头部，保持顺序
+                self._records = records + self._records
+                if self._position is None:
+                    self._position = position
+                self._first_at = self._first_at or time.monotonic()
+                self.stats["failures"] += 1
+            return 0
+        with self._cond:
+            self.stats["written"] += len(records)
+            self.stats["batches"] += 1 if records else 0
+        if position is not None and self._on_committed:
+            self._on_committed(position)
+        return len(records)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if len(self._records) >= self.max_batch:
+                        break
+                    if self._first_at is not None:
+                        remaining = self._first_at + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(timeout=remaining)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+            # 失败时数据放回队列，等待 max_delay 后重试
+            self.flush()
@@ -0,0 +1,91 @@
+"""
+存储引擎基准测试：比较各引擎的写入和查询吞吐量
+
+    python bench_storage.py --rows 200000 --batch 200
+    python bench_storage.py --engines sqlite memory
+
+数据为一台设备每10秒一条的模拟读数，数据库文件写在临时目录中，测试结束后删除
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from storage import STORAGE_ENGINES, open_storage
+
+READING_INTERVAL = 10  # 模拟读数间隔（秒）
+
+
+def make_rows(count, start):
+    rows = []
+    temperature = 22.0
+    for i in range(count):
+        temperature += random.uniform(-0.1, 0.1)
+        rows.append((start + i * READING_INTERVAL, "qingping/up", round(temperature, 1),
+                     round(random.uniform(40, 60), 1), 101.3, 90, -60, "434734", "434734"))
+    return rows
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def bench_engine(engine, path, rows, batch_size):
+    storage = open_storage(engine, path)
+    start, end = rows[0][0], rows[-1][0]
+    day = 86400
+    result = {"engine": engine}
+    try:
+        started = time.perf_counter()
+        for i in range(0, len(rows), batch_size):
+            storage.append_batch(rows[i:i + batch_size])
+        result["ingest_rows_per_sec"] = len(rows) / (time.perf_counter() - started)
+
+        recent, result["range_1d_ms"] = timed(storage.range_query, end - day, end)
+        result["range_1d_ms"] *= 1000
+        _, result["range_all_ms"] = timed(storage.range_query, start, end, columns=("temperature",))
+        result["range_all_ms"] *= 1000
+        _, result["latest_ms"] = timed(storage.range_query, start, end, limit=100, newest_first=True)
+        result["latest_ms"] *= 1000
+        buckets = max((end - start) // 500, 1)
+        _, result["aggregate_ms"] = timed(storage.aggregate, "temperature", start, end, buckets)
+        result["aggregate_ms"] *= 1000
+        deleted, result["retention_ms"] = timed(storage.retention, start + (end - start) // 10)
+        result["retention_ms"] *= 1000
+        result["range_1d_rows"] = len(recent)
+        result["deleted"] = deleted
+    finally:
+        storage.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="存储引擎基准测试")
+    parser.add_argument("--rows", type=int, default=100000, help="写入的行数")
+    parser.add_argument("--batch", type=int, default=200, help="每批写入的行数")
+    parser.add_argument("--engines", nargs="+", default=list(STORAGE_ENGINES), choices=STORAGE_ENGINES)
+    args = parser.parse_args()
+
+    random.seed(0)
+    rows = make_rows(args.rows, int(time.time()) - args.rows * READING_INTERVAL)
+    print(f"{args.rows} 行，每批 {args.batch} 行")
+    print(f"{'引擎':<8}{'写入(行/秒)':>14}{'1天范围(ms)':>14}{'全部单列(ms)':>14}"
+          f"{'最新100条(ms)':>15}{'聚合(ms)':>12}{'保留清理(ms)':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for engine in args.engines:
+            path = os.path.join(directory, f"bench.{engine}")
+            try:
+                result = bench_engine(engine, path, rows, args.batch)
+            except ValueError as e:
+                print(f"{engine:<8}跳过: {e}")
+                continue
+            print(f"{engine:<8}{result['ingest_rows_per_sec']:>14.0f}{result['range_1d_ms']:>14.1f}"
+                  f"{result['range_all_ms']:>14.1f}{result['latest_ms']:>15.1f}"
+                  f"{result['aggregate_ms']:>12.1f}{result['retention_ms']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import io
+import csv
+import json
+import sqlite3
+from datetime import datetime
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+PYARROW_FORMATS = ("parquet", "arrow")  # 需要pyarrow的格式
+
+EXPORT_CHUNK_SIZE = 5000  # 每次从SQLite读取的行数
+
+# 导出的列（raw_data 只在需要时导出，单行体积是其他列的几十倍）
+EXPORT_COLUMNS = ["id", "timestamp", "temperature", "humidity", "pressure",
+                  "battery", "rssi", "topic", "data_format"]
+RAW_COLUMN = "raw_data"
+
+# 数据库 timestamp 列中本地时间字符串的格式（与早期版本相同），导出时原样输出
+DB_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def parse_time(value):
+    """解析时间参数，支持 2025-03-10、2025-03-10 12:00:00、ISO 格式和Unix时间戳"""
+    if value is None or value == "":
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value))
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"无效的时间: {value}")
+
+
+def iter_rows(db_path, start=None, end=None, columns=EXPORT_COLUMNS, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    按时间顺序分块读取传感器数据，每次产出一批行（元组列表）
+    使用只读连接和 fetchmany，任何时候内存中最多只有一批数据
+    """
+    where = []
+    params = []
+    # 按整数Unix时间戳列 ts 过滤和排序（存储引擎打开数据库时会添加），夏令时切换前后的顺序不会错乱
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(int(start.timestamp()))
+    if end is not None:
+        where.append("ts <= ?")
+        params.append(int(end.timestamp()))
+    sql = f"SELECT {', '.join(columns)} FROM sensor_data"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts, id"
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def stream_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_ndjson(batches, columns):
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """pyarrow写入的目标：只追加，每批写完后取出已写入的字节，不保留历史数据"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def pyarrow_available():
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        return False
+
+
+def _import_pyarrow():
+    """pyarrow是可选依赖，只有导出Parquet/Arrow时才需要"""
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ValueError("导出 parquet/arrow 格式需要安装 pyarrow")
+
+
+def _arrow_schema(pa, columns):
+    types = {
+        "id": pa.int64(),
+        "timestamp": pa.timestamp("us"),
+        "temperature": pa.float64(),
+        "humidity": pa.float64(),
+        "pressure": pa.float64(),
+        "battery": pa.int64(),
+        "rssi": pa.int64(),
+        "topic": pa.string(),
+        "data_format": pa.string(),
+        RAW_COLUMN: pa.string(),
+    }
+    return pa.schema([(name, types[name]) for name in columns])
+
+
+def _record_batch(pa, schema, columns, rows):
+    arrays = []
+    for index, name in enumerate(columns):
+        values = [row[index] for row in rows]
+        if name == "timestamp":
+            # SQLite中是字符串，交给Arrow批量转换
+            arrays.append(pa.array(values, pa.string()).cast(schema.field(name).type))
+        else:
+            arrays.append(pa.array(values, schema.field(name).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream_arrow(batches, columns):
+    """Arrow IPC流格式，每批数据一个RecordBatch"""
+    pa = _import_pyarrow()
+    import pyarrow.ipc
+    schema = _arrow_schema(pa, columns)
+    sink = _ChunkSink()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(pa, schema, columns, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_parquet(batches, columns):
+    """Parquet，每批数据一个行组，文件尾在最后写出"""
+    pa = _import_pyarrow()
+    import pyarrow.parquet
+    schema = _arrow_schema(pa, columns)
+    sink = _ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(pa, schema, columns, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+STREAMERS = {
+    "csv": stream_csv,
+    "ndjson": stream_ndjson,
+    "parquet": stream_parquet,
+    "arrow": stream_arrow,
+}
+
+
+def export_stream(db_path, fmt, start=None, end=None, include_raw=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    返回 (字节流生成器, Content-Type, 文件扩展名)
+    格式不支持或缺少pyarrow时抛出ValueError（在开始输出之前）
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {', '.join(EXPORT_FORMATS)}")
+    if fmt in PYARROW_FORMATS:
+        _import_pyarrow()
+    columns = EXPORT_COLUMNS + [RAW_COLUMN] if include_raw else list(EXPORT_COLUMNS)
+    batches = iter_rows(db_path, start, end, columns, chunk_size)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return STREAMERS[fmt](batches, columns), mimetype, extension
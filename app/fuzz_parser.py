@@ -0,0 +1,314 @@
+"""
+青萍数据包解析的模糊测试和性质测试：检查 parse_keys / parse_mqtt_payload 对畸形数据包的健壮性和解析速度
+
+    python fuzz_parser.py                       # 默认20000个变异数据包
+    python fuzz_parser.py --iterations 100000 --seed 7
+    python fuzz_parser.py --skip-fuzz           # 只测吞吐量
+
+种子数据包在 fuzz_corpus.txt 中，在种子上做截断、翻转比特、篡改长度字段、拼接、插入大量零长度键等变异。
+每个数据包检查：
+- parse_mqtt_payload 不抛出异常，也不走到内部的异常分支
+- parse_keys 的结果与参考实现 reference_parse_keys 完全相同
+- parse_keys 执行的语句数不超过 常数 + 常数 × min(包长 / 3, MAX_PACKET_KEYS)（终止且每字节的工作量有界）
+- 一个数据包打印的日志行数和字符数有上限
+之后对正常数据包和几种病态数据包（几千个零长度键、长度字段为0xFFFF等）测量解析吞吐量
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import contextlib
+
+from sensor_parser import MAX_PACKET_KEYS, LOG_HEX_LIMIT, parse_keys, parse_mqtt_payload, hex_to_bytes
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fuzz_corpus.txt")
+MAX_PACKET_SIZE = 5 + 0xFFFF         # 负载长度字段最大时的数据包长度
+MAX_LOG_LINES = 40                   # 一个数据包最多打印的日志行数
+MAX_LOG_CHARS = 4 * LOG_HEX_LIMIT + 4000
+TRACE_BASE_LINES = 20                # parse_keys 每个数据包的固定语句数
+TRACE_LINES_PER_KEY = 12             # parse_keys 每个键值对的语句数上限
+INTERNAL_ERROR = "解析MQTT消息时出错"
+
+
+def load_corpus(path=CORPUS_FILE):
+    corpus = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                corpus.append(hex_to_bytes(line))
+    return corpus
+
+
+def reference_parse_keys(data, max_keys=MAX_PACKET_KEYS):
+    """
+    parse_keys 的参考实现，按协议逐项切片：
+    数据项从第5个字节开始，起始位置小于 负载长度 + 3 且不超过数据包末尾；
+    键和长度不完整、值超出数据包末尾或已有 max_keys 个数据项时停止；同一个键保留最后一个值
+    """
+    if len(data) < 5:
+        return {}
+    limit = min(len(data), int.from_bytes(data[3:5], "little") + 3)
+    items = []
+    rest = data[5:]
+    position = 5
+    while position < limit and len(items) < max_keys:
+        header, rest = rest[:3], rest[3:]
+        if len(header) < 3:
+            break
+        length = int.from_bytes(header[1:3], "little")
+        if length > len(rest):
+            break
+        items.append((f"0x{header[0]:02x}", rest[:length]))
+        rest = rest[length:]
+        position += 3 + length
+    return dict(items)
+
+
+# ------------------------------ 数据包构造和变异 ------------------------------
+def packet(command, items, declared=None):
+    """items 为 [(键, 值)]，declared 为负载长度字段（默认为实际长度）"""
+    body = b"".join(bytes((key,)) + len(value).to_bytes(2, "little") + value for key, value in items)
+    length = len(body) if declared is None else declared
+    return b"CG" + command + (length & 0xFFFF).to_bytes(2, "little") + body
+
+
+def zero_length_keys(count, key=0x00, command=b"4"):
+    """count 个长度为0的键，负载长度字段按实际长度（超过0xFFFF时截断）"""
+    return packet(command, [(key, b"")] * count)
+
+
+def item_offsets(data):
+    """按长度字段走一遍，返回每个数据项的起始位置（用于篡改长度字段）"""
+    offsets = []
+    i = 5
+    while i + 3 <= len(data):
+        offsets.append(i)
+        i += 3 + (data[i + 1] | (data[i + 2] << 8))
+    return offsets
+
+
+def mutate(data, corpus, rng):
+    """返回 (变异方式, 数据包)"""
+    data = bytearray(data)
+    kind = rng.choice(("flip", "byte", "insert", "delete", "truncate", "payload_length", "item_length",
+                       "splice", "zero_keys", "duplicate", "garbage"))
+    if kind == "flip" and data:
+        for _ in range(rng.randint(1, 4)):
+            position = rng.randrange(len(data))
+            data[position] ^= 1 << rng.randrange(8)
+    elif kind == "byte" and data:
+        data[rng.randrange(len(data))] = rng.choice((0x00, 0xFF, 0x7F, 0x80, rng.randrange(256)))
+    elif kind == "insert":
+        position = rng.randint(0, len(data))
+        data[position:position] = bytes(rng.randrange(256) for _ in range(rng.randint(1, 16)))
+    elif kind == "delete" and data:
+        position = rng.randrange(len(data))
+        del data[position:position + rng.randint(1, 8)]
+    elif kind == "truncate":
+        del data[rng.randint(0, len(data)):]
+    elif kind == "payload_length" and len(data) >= 5:
+        value = rng.choice((0, 1, 2, 3, 0xFFFF, len(data), len(data) - 5, rng.randrange(0x10000)))
+        data[3:5] = (value & 0xFFFF).to_bytes(2, "little")
+    elif kind == "item_length":
+        offsets = item_offsets(data)
+        if offsets:
+            i = rng.choice(offsets)
+            value = rng.choice((0, 1, 0xFFFF, len(data) - i - 3, len(data) - i - 2, rng.randrange(0x10000)))
+            data[i + 1:i + 3] = (max(value, 0) & 0xFFFF).to_bytes(2, "little")
+    elif kind == "splice":
+        other = rng.choice(corpus)
+        data = data[:rng.randint(0, len(data))] + other[rng.randint(0, len(other)):]
+    elif kind == "zero_keys":
+        count = rng.choice((10, 100, 1000, rng.randint(1, 5000)))
+        data = bytearray(zero_length_keys(count, key=rng.randrange(256), command=rng.choice((b"4", b"1"))))
+        if rng.random() < 0.5:
+            data[3:5] = b"\xff\xff"
+    elif kind == "duplicate":
+        offsets = item_offsets(data)
+        if offsets:
+            i = offsets[0]
+            data = data[:5] + data[i:] * rng.randint(2, 50)
+            data[3:5] = ((len(data) - 5) & 0xFFFF).to_bytes(2, "little")
+    elif kind == "garbage":
+        data = bytearray(b"CG" + rng.choice((b"4", b"1")) + bytes(rng.randrange(256)
+                                                                   for _ in range(rng.randint(0, 300))))
+    return kind, bytes(data)
+
+
+def random_valid_packet(rng):
+    """随机的合法数据包，返回 (数据包, 期望的解析结果)"""
+    items = [(rng.randrange(256), bytes(rng.randrange(256) for _ in range(rng.choice((0, 1, 4, 11, rng.randint(0, 64))))))
+             for _ in range(rng.randint(0, 20))]
+    expected = {}
+    for key, value in items:
+        expected[f"0x{key:02x}"] = value
+    return packet(rng.choice((b"4", b"1")), items, declared=None), expected
+
+
+# ------------------------------ 检查 ------------------------------
+class LogCounter(io.TextIOBase):
+    """代替标准输出，只统计打印的行数和字符数"""
+
+    def __init__(self):
+        self.lines = 0
+        self.chars = 0
+
+    def write(self, text):
+        self.lines += text.count("\n")
+        self.chars += len(text)
+        return len(text)
+
+
+def traced_lines(function, *args):
+    """执行 function，返回 (结果, 在 function 自身中执行的语句数)"""
+    code = function.__code__
+    count = 0
+
+    def tracer(frame, event, arg):
+        if frame.f_code is not code:
+            return None
+
+        def local(frame, event, arg):
+            nonlocal count
+            if event == "line":
+                count += 1
+            return local
+        return local
+
+    with contextlib.redirect_stdout(LogCounter()):
+        sys.settrace(tracer)
+        try:
+            result = function(*args)
+        finally:
+            sys.settrace(None)
+    return result, count
+
+
+def check(data):
+    """返回发现的问题列表（空列表表示通过）"""
+    problems = []
+    log = LogCounter()
+    try:
+        with contextlib.redirect_stdout(log):
+            parsed, _ = parse_mqtt_payload(data)
+        if INTERNAL_ERROR in str(parsed.get("error", "")):
+            problems.append(f"parse_mqtt_payload 内部异常: {parsed['error'].splitlines()[0]}")
+    except Exception as e:
+        problems.append(f"parse_mqtt_payload 抛出异常: {e!r}")
+    if log.lines > MAX_LOG_LINES or log.chars > MAX_LOG_CHARS:
+        problems.append(f"日志过多: {log.lines} 行, {log.chars} 字符")
+
+    try:
+        keys, lines = traced_lines(parse_keys, data)
+    except Exception as e:
+        return problems + [f"parse_keys 抛出异常: {e!r}"]
+    expected = reference_parse_keys(data)
+    if keys != expected:
+        problems.append(f"与参考实现不一致: {sorted(keys)} != {sorted(expected)}")
+    budget = TRACE_BASE_LINES + TRACE_LINES_PER_KEY * min(len(data) // 3 + 1, MAX_PACKET_KEYS)
+    if lines > budget:
+        problems.append(f"工作量超出上限: {lines} 条语句 > {budget}")
+    return problems
+
+
+def fuzz(corpus, iterations, seed):
+    rng = random.Random(seed)
+    failures = []
+    kinds = {}
+    started = time.perf_counter()
+    for data in corpus:
+        for problem in check(data):
+            failures.append(("seed", data, problem))
+    for _ in range(iterations):
+        kind, data = mutate(rng.choice(corpus), corpus, rng)
+        # 一部分变异叠加在上一次的结果上
+        while rng.random() < 0.3:
+            kind, data = mutate(data, corpus, rng)
+        kinds[kind] = kinds.get(kind, 0) + 1
+        for problem in check(data):
+            failures.append((kind, data, problem))
+    for _ in range(iterations // 10):
+        data, expected = random_valid_packet(rng)
+        with contextlib.redirect_stdout(LogCounter()):
+            keys = parse_keys(data)
+        if keys != expected:
+            failures.append(("valid", data, f"合法数据包解析错误: {sorted(keys)} != {sorted(expected)}"))
+    return failures, kinds, time.perf_counter() - started
+
+
+# ------------------------------ 吞吐量 ------------------------------
+def pathological_cases(corpus, rng):
+    history = packet(b"1", [(0x03, (1760000000).to_bytes(4, "little") + (60).to_bytes(2, "little")
+                             + bytes(rng.randrange(256) for _ in range(6 * 10000)))])
+    return [
+        ("种子数据包", corpus),
+        ("1000个零长度键", [zero_length_keys(1000)]),
+        ("5000个零长度键", [zero_length_keys(5000)]),
+        ("21845个零长度键(64KB)", [zero_length_keys(0xFFFF // 3)]),
+        ("负载长度0xFFFF的短包", [b"CG4\xff\xff" + corpus[0][5:]]),
+        ("值长度0xFFFF的截断包", [packet(b"4", [(0x14, b"")])[:6] + b"\xff\xff" + bytes(64)]),
+        ("64KB随机数据", [b"CG4\xff\xff" + bytes(rng.randrange(256) for _ in range(0xFFFF))]),
+        ("10000条历史记录", [history]),
+    ]
+
+
+def measure(function, packets, min_time):
+    """返回 (每秒数据包数, 每秒字节数)"""
+    size = sum(len(data) for data in packets)
+    count = 0
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(LogCounter()):
+        while True:
+            for data in packets:
+                function(data)
+            count += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+    return count * len(packets) / elapsed, count * size / elapsed
+
+
+def bench(corpus, seed, min_time):
+    rng = random.Random(seed)
+    print(f"{'数据包':<24}{'字节':>8}{'parse_keys 包/秒':>20}{'MB/秒':>10}{'完整解析 包/秒':>18}{'MB/秒':>10}{'日志行':>8}")
+    for name, packets in pathological_cases(corpus, rng):
+        size = sum(len(data) for data in packets) // len(packets)
+        keys_rate, keys_bytes = measure(parse_keys, packets, min_time)
+        full_rate, full_bytes = measure(parse_mqtt_payload, packets, min_time)
+        log = LogCounter()
+        with contextlib.redirect_stdout(log):
+            parse_mqtt_payload(packets[0])
+        print(f"{name:<24}{size:>8}{keys_rate:>20.0f}{keys_bytes / 1e6:>10.1f}{full_rate:>18.0f}"
+              f"{full_bytes / 1e6:>10.1f}{log.lines:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="青萍数据包解析的模糊测试和吞吐量测试")
+    parser.add_argument("--iterations", type=int, default=20000, help="变异数据包数量")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--corpus", default=CORPUS_FILE, help="种子数据包文件")
+    parser.add_argument("--bench-time", type=float, default=0.3, help="每种数据包的吞吐量测量时间（秒）")
+    parser.add_argument("--skip-fuzz", action="store_true", help="只测吞吐量")
+    parser.add_argument("--skip-bench", action="store_true", help="只做模糊测试")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    failures = []
+    if not args.skip_fuzz:
+        failures, kinds, elapsed = fuzz(corpus, args.iterations, args.seed)
+        print(f"种子 {len(corpus)} 个，变异 {args.iterations} 个，耗时 {elapsed:.1f} 秒，问题 {len(failures)} 个")
+        print("变异方式: " + ", ".join(f"{kind} {count}" for kind, count in sorted(kinds.items())))
+        for kind, data, problem in failures[:20]:
+            hex_str = data.hex()
+            print(f"  [{kind}] {problem}\n    {hex_str[:160]}{'...' if len(hex_str) > 160 else ''} ({len(data)} 字节)")
+        print()
+    if not args.skip_bench:
+        bench(corpus, args.seed, args.bench_time)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
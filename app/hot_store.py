@@ -0,0 +1,191 @@
+import math
+import threading
+from array import array
+
+_numpy = None  # NumPy是可选依赖，第一次计算统计值时才导入（导入约需0.1秒）；False表示未安装
+
+HOT_COLUMNS = ("timestamp", "temperature", "humidity", "pressure", "battery", "rssi")
+HOT_FIELDS = HOT_COLUMNS[1:]
+HOT_STORE_CAPACITY = 8640  # 每台设备保留的读数（10秒一条时为24小时）
+NAN = float("nan")
+
+
+class DeviceColumns:
+    """
+    单台设备的列式环形缓冲区
+    每列一个预分配的 array('d')，缺失值为NaN；写满后覆盖最旧的读数
+    时间戳要求不递减，这样可以二分查找时间窗口
+    """
+
+    def __init__(self, capacity=HOT_STORE_CAPACITY):
+        self.capacity = capacity
+        self.columns = {name: array('d', [NAN]) * capacity for name in HOT_COLUMNS}
+        self._views = {name: memoryview(column) for name, column in self.columns.items()}
+        self.head = 0   # 下一条写入的位置
+        self.count = 0  # 有效读数数量
+
+    def append(self, timestamp, values):
+        """O(1) 追加一条读数，values 为 {字段: 数值}"""
+        head = self.head
+        self.columns["timestamp"][head] = timestamp
+        for name in HOT_FIELDS:
+            value = values.get(name)
+            self.columns[name][head] = NAN if value is None else value
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def last_timestamp(self):
+        if not self.count:
+            return None
+        return self.columns["timestamp"][(self.head - 1) % self.capacity]
+
+    def _physical(self, index):
+        """逻辑下标（0为最旧）转换为数组下标"""
+        return (self.head - self.count + index) % self.capacity
+
+    def _first_index_since(self, since):
+        """二分查找第一条时间戳 >= since 的逻辑下标"""
+        timestamps = self.columns["timestamp"]
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if timestamps[self._physical(mid)] < since:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def segments(self, name, since=None):
+        """
+        返回时间窗口内某一列的数据，为1到2段 memoryview（环形缓冲区回绕时分为两段），不复制数据
+        """
+        first = 0 if since is None else self._first_index_since(since)
+        length = self.count - first
+        if length <= 0:
+            return []
+        view = self._views[name]
+        start = self._physical(first)
+        end = start + length
+        if end <= self.capacity:
+            return [view[start:end]]
+        return [view[start:], view[:end - self.capacity]]
+
+
+def _load_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+
+def _window_stats(segments):
+    """计算最小值、最大值、平均值、最新值和数量，忽略NaN"""
+    numpy = _load_numpy()
+    if numpy:
+        # frombuffer 直接引用缓冲区，只有回绕成两段时才拼接
+        arrays = [numpy.frombuffer(segment, dtype=numpy.float64) for segment in segments]
+        values = arrays[0] if len(arrays) == 1 else numpy.concatenate(arrays)
+        values = values[~numpy.isnan(values)]
+        if not len(values):
+            return None
+        return {
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": round(float(values.mean()), 3),
+            "last": float(values[-1]),
+            "count": int(len(values)),
+        }
+
+    low = high = last = None
+    total = 0.0
+    count = 0
+    for segment in segments:
+        values = [value for value in segment if value == value]  # 过滤NaN
+        if not values:
+            continue
+        segment_low = min(values)
+        segment_high = max(values)
+        low = segment_low if low is None else min(low, segment_low)
+        high = segment_high if high is None else max(high, segment_high)
+        total += math.fsum(values)
+        count += len(values)
+        last = values[-1]
+    if not count:
+        return None
+    return {"min": low, "max": high, "mean": round(total / count, 3), "last": last, "count": count}
+
+
+class HotStore:
+    """
+    最近读数的列式内存存储，按设备（主题）分开
+    每条读数占 6 列 x 8 字节 = 48 字节，追加 O(1)，时间窗口二分查找
+    """
+
+    def __init__(self, capacity=HOT_STORE_CAPACITY):
+        self.capacity = capacity
+        self._devices = {}  # 设备 -> DeviceColumns
+        self._lock = threading.Lock()
+        self.appended = 0
+        self.skipped = 0  # 时间早于该设备最新读数而被跳过的数量（这些数据只保存在数据库中）
+
+    def append(self, device, timestamp, values):
+        """追加一条读数，返回是否写入"""
+        with self._lock:
+            columns = self._devices.get(device)
+            if columns is None:
+                columns = self._devices[device] = DeviceColumns(self.capacity)
+            last = columns.last_timestamp()
+            if last is not None and timestamp < last:
+                self.skipped += 1
+                return False
+            columns.append(timestamp, values)
+            self.appended += 1
+            return True
+
+    def devices(self):
+        with self._lock:
+            return list(self._devices)
+
+    def window_stats(self, device, field, since=None):
+        """时间窗口内某个字段的最小值、最大值、平均值、最新值，没有数据时返回None"""
+        if field not in HOT_FIELDS:
+            raise ValueError(f"不支持的字段: {field}，可选: {', '.join(HOT_FIELDS)}")
+        with self._lock:
+            columns = self._devices.get(device)
+            if columns is None:
+                return None
+            segments = columns.segments(field, since)
+            return _window_stats(segments) if segments else None
+
+    def series(self, device, field, since=None):
+        """时间窗口内的 (时间戳列表, 数值列表)，在这里才从缓冲区复制出来"""
+        if field not in HOT_FIELDS:
+            raise ValueError(f"不支持的字段: {field}，可选: {', '.join(HOT_FIELDS)}")
+        with self._lock:
+            columns = self._devices.get(device)
+            if columns is None:
+                return [], []
+            times = [value for segment in columns.segments("timestamp", since) for value in segment]
+            values = [None if value != value else value
+                      for segment in columns.segments(field, since) for value in segment]
+            return times, values
+
+    def stats(self):
+        with self._lock:
+            readings = sum(columns.count for columns in self._devices.values())
+            memory = sum(columns.capacity * len(HOT_COLUMNS) * 8 for columns in self._devices.values())
+            return {
+                "devices": len(self._devices),
+                "readings": readings,
+                "capacity_per_device": self.capacity,
+                "memory_bytes": memory,
+                "bytes_per_reading": len(HOT_COLUMNS) * 8,
+                "appended": self.appended,
+                "skipped": self.skipped,
+                "numpy": bool(_numpy)
+            }
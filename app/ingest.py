@@ -0,0 +1,101 @@
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+
+from sensor_parser import MIN_DEVICE_TIMESTAMP, MAX_CLOCK_SKEW
+
+DEDUP_MAX_ENTRIES = 4096    # 去重集合最多记住的数据包数量
+UNTIMED_DEDUP_WINDOW = 60   # 没有传感器时间戳的数据包只在此时间（秒）内去重
+DEADBAND_THRESHOLDS = {"temperature": 0.1, "humidity": 0.5}  # 变化超过阈值才保存
+DEADBAND_HEARTBEAT = 600    # 数值没有变化时，至少每隔多少秒保存一条
+
+_sequence = itertools.count(1)
+
+
+def next_sequence() -> int:
+    """本进程内单调递增的记录序号（从1开始）"""
+    return next(_sequence)
+
+
+def event_time(sensor_timestamp, received_at) -> int:
+    """
+    读数的时间（整数Unix时间戳）
+    设备上报的时间戳可信时使用设备时间，否则使用接收时间
+    """
+    if sensor_timestamp is not None and MIN_DEVICE_TIMESTAMP <= sensor_timestamp <= received_at + MAX_CLOCK_SKEW:
+        return int(sensor_timestamp)
+    return int(received_at)
+
+
+def payload_digest(payload) -> bytes:
+    return hashlib.blake2b(bytes(payload), digest_size=8).digest()
+
+
+class DedupStage:
+    """
+    数据包去重
+    - 按 (设备, 传感器时间戳, 负载哈希) 判断是否已经处理过：传感器重发的相同读数、
+      MQTT保留消息和重复投递的数据包只处理一次
+    - 去重集合有上限，超过后淘汰最早的记录
+    - 没有传感器时间戳的数据包，相同负载只在 UNTIMED_DEDUP_WINDOW 秒内视为重复
+    """
+
+    def __init__(self, max_entries=DEDUP_MAX_ENTRIES, untimed_window=UNTIMED_DEDUP_WINDOW):
+        self.max_entries = max_entries
+        self.untimed_window = untimed_window
+        self._seen = OrderedDict()  # (设备, 传感器时间戳, 哈希) -> 接收时间
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "duplicates": 0, "evictions": 0}
+
+    def seen(self, device, sensor_timestamp, payload, received_at):
+        """已经处理过返回True；否则记录下来并返回False"""
+        key = (device, sensor_timestamp, payload_digest(payload))
+        with self._lock:
+            self.stats["checked"] += 1
+            first_seen = self._seen.get(key)
+            if first_seen is not None and (
+                    sensor_timestamp is not None or received_at - first_seen < self.untimed_window):
+                self.stats["duplicates"] += 1
+                return True
+            self._seen[key] = received_at
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+                self.stats["evictions"] += 1
+            return False
+
+
+class Deadband:
+    """
+    死区压缩（可选）
+    只有温度或湿度的变化超过阈值、或距离上次保存超过心跳间隔时才保存到数据库；
+    阈值为0时只跳过数值完全相同的读数，按阶梯曲线还原不损失信息
+    """
+
+    def __init__(self, thresholds=None, heartbeat=DEADBAND_HEARTBEAT):
+        self.thresholds = dict(DEADBAND_THRESHOLDS if thresholds is None else thresholds)
+        self.heartbeat = heartbeat
+        self._last = {}  # 设备 -> (保存时间, {字段: 值})
+        self._lock = threading.Lock()
+        self.stats = {"stored": 0, "suppressed": 0}
+
+    def should_store(self, device, timestamp, values):
+        with self._lock:
+            last = self._last.get(device)
+            store = last is None or timestamp - last[0] >= self.heartbeat
+            if not store:
+                for field, threshold in self.thresholds.items():
+                    value, previous = values.get(field), last[1].get(field)
+                    if value is None or previous is None:
+                        store = value is not previous
+                    elif abs(value - previous) > threshold:
+                        store = True
+                    if store:
+                        break
+            if store:
+                self._last[device] = (timestamp, {field: values.get(field) for field in self.thresholds})
+                self.stats["stored"] += 1
+            else:
+                self.stats["suppressed"] += 1
+            return store
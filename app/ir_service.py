@@ -0,0 +1,179 @@
+import os
+import sys
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 红外解码器位于仓库的 ir_receiver 目录
+IR_RECEIVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ir_receiver')
+if IR_RECEIVER_DIR not in sys.path:
+    sys.path.append(IR_RECEIVER_DIR)
+
+from gree_ir_decoder import GreeIRDecoder, TimingCalibrator
+
+QUANTUM_US = 50          # 缓存键量化步长（微秒），同一按键的多次捕获落到同一个键
+MAX_CAPTURE_LENGTH = 1024  # 单次捕获最多的脉冲数量（与接收器缓冲区大小一致）
+
+
+def parse_binary_captures(body: bytes) -> list:
+    """
+    解析紧凑二进制请求体
+    格式: 重复的 [脉冲数量(uint16, 小端序)] + [脉冲宽度(uint16, 小端序) * 数量]
+    """
+    captures = []
+    offset = 0
+    while offset < len(body):
+        if offset + 2 > len(body):
+            raise ValueError("二进制数据不完整: 缺少脉冲数量")
+        (count,) = struct.unpack_from('<H', body, offset)
+        offset += 2
+        if count > MAX_CAPTURE_LENGTH:
+            raise ValueError(f"脉冲数量过多: {count}")
+        if offset + count * 2 > len(body):
+            raise ValueError("二进制数据不完整: 脉冲数据长度不足")
+        captures.append(list(struct.unpack_from(f'<{count}H', body, offset)))
+        offset += count * 2
+    return captures
+
+
+def parse_json_captures(captures) -> list:
+    """
+    校验JSON请求中的捕获数据：每组是脉冲宽度数组，长度不超过 MAX_CAPTURE_LENGTH，
+    脉冲宽度必须是有限的数值（1e400 之类解析为inf的值视为无效）
+    """
+    if not isinstance(captures, list):
+        raise ValueError("captures 必须是数组")
+    result = []
+    for raw in captures:
+        if not isinstance(raw, list):
+            raise ValueError("脉冲数据必须是数组")
+        if len(raw) > MAX_CAPTURE_LENGTH:
+            raise ValueError(f"脉冲数量过多: {len(raw)}")
+        try:
+            result.append([int(v) for v in raw])
+        except OverflowError:
+            raise ValueError("脉冲宽度超出范围")
+    return result
+
+
+def binary_to_bytes(binary_str: str) -> bytes:
+    """将LSB优先的二进制序列转换为字节"""
+    out = bytearray()
+    for i in range(0, len(binary_str) - len(binary_str) % 8, 8):
+        out.append(int(binary_str[i:i + 8][::-1], 2))
+    return bytes(out)
+
+
+class IRDecodeService:
+    """
+    红外解码服务：共享解码器实例 + 线程池 + 按量化脉冲哈希的LRU缓存
+    指定接收器ID时使用该接收器的校准阈值自适应解码，解码失败时用同一批捕获重新校准，
+    校准结果保存在 calibration_file 中，重启后继续使用
+    """
+
+    def __init__(self, max_workers=4, cache_size=256, calibration_file=None):
+        # 关闭逐位日志，批量解码时打印是主要开销
+        self.decoder = GreeIRDecoder(verbose=False, calibrator=TimingCalibrator(cache_file=calibration_file))
+        # 重新校准会修改并保存接收器阈值，不能在多个解码线程中同时进行
+        self._calibration_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ir-decode')
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_key(self, raw_data, receiver_id=None) -> str:
+        """
+        按量化后的脉冲数组和解码使用的阈值计算缓存键
+        使用相同阈值的接收器（包括都未校准的）共用缓存条目，接收器重新校准后阈值变化，自然使用新的键
+        """
+        quantized = [min(0xFFFF, (abs(int(v)) + QUANTUM_US // 2) // QUANTUM_US) for v in raw_data]
+        digest = hashlib.sha1(struct.pack(f'<{len(quantized)}H', *quantized))
+        if receiver_id is not None:
+            calibrated = self.decoder.calibrator.get(receiver_id)
+            if calibrated:
+                digest.update(repr(sorted(calibrated.items())).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _decode_one(self, raw_data, receiver_id, captures):
+        """解码单个捕获，错误作为结果返回而不是抛出"""
+        try:
+            if receiver_id is None:
+                binary = self.decoder.decode_raw_data(raw_data)
+            else:
+                with self._calibration_lock:
+                    binary = self.decoder.decode_adaptive(raw_data, receiver_id, captures)
+        except ValueError as e:
+            return {"error": str(e)}
+        result = {
+            "binary": binary,
+            "hex": binary_to_bytes(binary).hex(),
+        }
+        try:
+            result["protocol"] = self.decoder.parse_protocol(binary)
+        except ValueError as e:
+            result["protocol_error"] = str(e)
+        return result
+
+    def _cache_get(self, key):
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return result
+
+    def _cache_put(self, key, result):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def decode_batch(self, captures, receiver_id=None) -> list:
+        """
+        批量解码
+        先查缓存，同一批次内重复的捕获只解码一次，其余提交到线程池并行解码
+        指定接收器ID时，同一批次的其他捕获用于解码失败时重新校准该接收器
+        """
+        keys = [self.cache_key(raw, receiver_id) for raw in captures]
+        results = [None] * len(captures)
+        pending = {}  # 缓存键 -> (Future, 结果下标列表)
+
+        for idx, (key, raw) in enumerate(zip(keys, captures)):
+            if key in pending:
+                pending[key][1].append(idx)
+                continue
+            cached = self._cache_get(key)
+            if cached is not None:
+                results[idx] = dict(cached, cached=True)
+                continue
+            others = [other for other_idx, other in enumerate(captures) if other_idx != idx]
+            future = self.executor.submit(self._decode_one, raw, receiver_id, others)
+            pending[key] = (future, [idx])
+
+        for key, (future, indexes) in pending.items():
+            result = future.result()
+            # 解码失败的结果不缓存，方便重新校准后再次解码
+            if "error" not in result:
+                # 解码时可能重新校准了接收器，按解码实际使用的阈值重新计算缓存键
+                self._cache_put(self.cache_key(captures[indexes[0]], receiver_id), result)
+            for idx in indexes:
+                results[idx] = dict(result, cached=False)
+
+        return results
+
+    def stats(self) -> dict:
+        """缓存统计"""
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "capacity": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
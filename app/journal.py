@@ -0,0 +1,222 @@
+import os
+import mmap
+import time
+import zlib
+import struct
+import threading
+
+# 记录格式: [长度 uint32][CRC32 uint32][接收时间 float64][主题长度 uint16][主题][负载]，小端序
+# 长度为头部之后（主题+负载）的字节数，CRC32 覆盖接收时间、主题长度、主题和负载
+RECORD_HEADER = struct.Struct('<IIdH')
+SEGMENT_SUFFIX = ".wal"
+CHECKPOINT_FILE = "checkpoint"
+SEGMENT_SIZE = 16 * 1024 * 1024  # 单个分段文件的大小上限，超过后切换到新分段
+FSYNC_INTERVAL = 0.2             # 批量fsync的间隔（秒）
+MAX_RECORD_SIZE = 1024 * 1024    # 单条记录的上限，回放时超过此长度视为损坏
+
+
+class PacketJournal:
+    """
+    原始MQTT数据包的预写日志
+    - 只追加，每条记录带长度前缀和CRC32，进程崩溃时已写入的记录都在页缓存中不会丢失
+    - 后台线程每 FSYNC_INTERVAL 秒批量fsync一次，不为每条消息单独刷盘，fsync在锁外进行，不阻塞写入
+    - 分段文件超过 SEGMENT_SIZE 后切换到新分段
+    - 数据写入数据库后调用 checkpoint 记录位置，之前的分段会被删除
+    - 启动时用mmap读取检查点之后的记录并回放；最后一个分段末尾写了一半的记录会被截掉，
+      已写满的分段中间损坏时跳过损坏的字节继续回放，不修改文件
+    数据库提交和检查点之间崩溃时会重复回放这部分记录（至少一次）
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, fsync_interval=FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._fd = None
+        self._segment = None   # 当前分段编号
+        self._offset = 0       # 当前分段的写入位置
+        self._dirty = False
+        self._running = False
+        self._thread = None
+        self.stats = {
+            "appended": 0,
+            "bytes": 0,
+            "fsyncs": 0,
+            "rotations": 0,
+            "replayed": 0,
+            "truncated": 0,    # 最后一个分段末尾截掉的字节
+            "corrupted": 0     # 已写满的分段中跳过的损坏字节
+        }
+
+    # ---------------- 分段文件 ----------------
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        """按编号排序的分段列表"""
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                numbers.append(int(name[:-len(SEGMENT_SUFFIX)]))
+        return sorted(numbers)
+
+    def _open_segment(self, segment):
+        self._fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segment = segment
+        self._offset = os.fstat(self._fd).st_size
+
+    def _rotate(self):
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._open_segment(self._segment + 1)
+        self.stats["rotations"] += 1
+
+    # ---------------- 写入 ----------------
+
+    def open(self):
+        """打开最新的分段继续写入，并启动批量fsync线程（应在 replay 之后调用）"""
+        segments = self.segments()
+        self._open_segment(segments[-1] if segments else 1)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="journal-fsync", daemon=True)
+        self._thread.start()
+
+    def append(self, topic, payload, received_at=None):
+        """追加一条记录，返回写入后的位置 (分段编号, 偏移)，用于之后的检查点"""
+        received_at = time.time() if received_at is None else received_at
+        topic_bytes = topic.encode("utf-8")
+        body = struct.pack('<dH', received_at, len(topic_bytes)) + topic_bytes + bytes(payload)
+        record = struct.pack('<II', len(topic_bytes) + len(payload), zlib.crc32(body)) + body
+        with self._lock:
+            if self._offset and self._offset + len(record) > self.segment_size:
+                self._rotate()
+            os.write(self._fd, record)
+            self._offset += len(record)
+            self._dirty = True
+            self.stats["appended"] += 1
+            self.stats["bytes"] += len(record)
+            return self._segment, self._offset
+
+    def _run(self):
+        while True:
+            fd = None
+            with self._cond:
+                self._cond.wait(timeout=self.fsync_interval)
+                running = self._running
+                if self._dirty and self._fd is not None:
+                    # 复制描述符后在锁外fsync，刷盘期间 append 不会被阻塞（切换分段会关闭原来的描述符）
+                    fd = os.dup(self._fd)
+                    self._dirty = False
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                self.stats["fsyncs"] += 1
+            if not running:
+                return
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+
+    # ---------------- 检查点 ----------------
+
+    def read_checkpoint(self):
+        """已写入数据库的位置 (分段编号, 偏移)，没有检查点时返回 (0, 0)"""
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def checkpoint(self, position):
+        """记录该位置之前的数据都已写入数据库，并删除更早的分段"""
+        segment, offset = position
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{segment} {offset}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        for number in self.segments():
+            if number < segment:
+                os.remove(self._segment_path(number))
+
+    # ---------------- 回放 ----------------
+
+    def _read_segment(self, segment, start, sealed=False):
+        """
+        用mmap读取分段中从 start 开始的记录
+        - 最后一个分段（继续写入的分段）：末尾损坏或不完整的记录是崩溃时写了一半的，截掉
+        - 已经写满的分段：文件不修改，跳过损坏的字节，从下一条校验通过的记录继续回放
+        """
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        if size <= start:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = start
+            corrupt_at = None  # 当前损坏区域的开始位置
+            while offset + RECORD_HEADER.size <= size:
+                length, crc, received_at, topic_length = RECORD_HEADER.unpack_from(data, offset)
+                body_start = offset + 8
+                end = offset + RECORD_HEADER.size + length
+                if (length > MAX_RECORD_SIZE or topic_length > length or end > size
+                        or zlib.crc32(data[body_start:end]) != crc):
+                    if not sealed:
+                        break
+                    if corrupt_at is None:
+                        corrupt_at = offset
+                    offset += 1
+                    continue
+                if corrupt_at is not None:
+                    self._skip_corrupt(segment, corrupt_at, offset)
+                    corrupt_at = None
+                topic_start = offset + RECORD_HEADER.size
+                topic = data[topic_start:topic_start + topic_length].decode("utf-8", errors="replace")
+                payload = data[topic_start + topic_length:end]
+                offset = end
+                yield topic, payload, received_at, (segment, offset)
+        if sealed:
+            if corrupt_at is not None or offset < size:
+                self._skip_corrupt(segment, offset if corrupt_at is None else corrupt_at, size)
+        elif offset < size:
+            # 崩溃时写了一半的记录
+            print(f"预写日志分段 {segment} 在偏移 {offset} 处损坏，截掉 {size - offset} 字节")
+            os.truncate(path, offset)
+            self.stats["truncated"] += size - offset
+
+    def _skip_corrupt(self, segment, start, end):
+        print(f"预写日志分段 {segment} 的 {start}-{end} 字节损坏，已跳过（文件未修改）")
+        self.stats["corrupted"] += end - start
+
+    def replay(self):
+        """
+        依次产出检查点之后的记录 (主题, 负载, 接收时间, 位置)
+        应在 open 之前调用
+        """
+        checkpoint_segment, checkpoint_offset = self.read_checkpoint()
+        segments = self.segments()
+        for segment in segments:
+            if segment < checkpoint_segment:
+                continue
+            start = checkpoint_offset if segment == checkpoint_segment else 0
+            # 只有最后一个分段（open 之后继续追加的分段）可能有写了一半的记录
+            for record in self._read_segment(segment, start, sealed=segment != segments[-1]):
+                self.stats["replayed"] += 1
+                yield record
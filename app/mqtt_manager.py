@@ -0,0 +1,184 @@
+import time
+import threading
+
+
+class ManagedMQTTClient:
+    """
+    托管的MQTT客户端
+    - clean_session=False 持久会话，断线期间QoS1/2消息由服务器保留，重连后补发
+    - 每个主题可单独配置QoS
+    - 使用paho内置的指数退避自动重连（包括启动时服务器不可用的情况）
+    - 限制在途消息窗口和本地排队消息数量，重连后不会一次性冲击服务器
+    - 记录连接、断线和重连耗时等指标
+    """
+
+    def __init__(self, broker, port=1883, client_id="qingping-monitor", keepalive=30,
+                 min_reconnect_delay=1, max_reconnect_delay=60,
+                 max_inflight=20, max_queued=1000, default_qos=1):
+        self.broker = broker
+        self.port = port
+        self.keepalive = keepalive
+        self.default_qos = default_qos
+        self.topics = {}            # 主题 -> QoS
+        self.on_message = None      # 消息回调 on_message(client, userdata, msg)
+
+        self.client_id = client_id
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        # paho客户端在第一次使用时才创建（通常是start），导入本模块不加载paho，不拖慢应用启动
+        self._mqtt = None
+        self._client = None
+        self._client_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self._connected = False
+        self._started_at = None
+        self._disconnected_at = None
+        self.metrics = {
+            "connected": False,
+            "connects": 0,                   # 成功连接次数
+            "disconnects": 0,                # 断线次数
+            "failed_attempts": 0,            # 连接失败次数
+            "session_present": None,         # 服务器是否保留了会话
+            "first_connect_seconds": None,   # 启动到首次连接的耗时
+            "last_reconnect_seconds": None,  # 最近一次断线到重连的耗时
+            "max_reconnect_seconds": None,   # 最长的重连耗时
+            "total_downtime_seconds": 0.0,   # 累计断线时间
+            "messages_received": 0,
+            "messages_published": 0,
+            "publish_failures": 0
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            # 告警、调度线程可能在start之前发布消息，创建过程加锁避免重复创建
+            with self._client_lock:
+                if self._client is None:
+                    self._create_client()
+        return self._client
+
+    def _create_client(self):
+        import paho.mqtt.client as mqtt
+        # 持久会话需要固定的客户端ID
+        client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION1,
+            client_id=self.client_id,
+            clean_session=False
+        )
+        client.reconnect_delay_set(min_delay=self.min_reconnect_delay, max_delay=self.max_reconnect_delay)
+        client.max_inflight_messages_set(self.max_inflight)
+        client.max_queued_messages_set(self.max_queued)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_connect_fail = self._on_connect_fail
+        client.on_message = self._on_message
+        self._mqtt = mqtt
+        self._client = client
+
+    def subscribe(self, topic, qos=None):
+        """添加订阅，已连接时立即订阅，重连后自动恢复"""
+        qos = self.default_qos if qos is None else qos
+        with self._lock:
+            self.topics[topic] = qos
+            connected = self._connected
+        if connected:
+            self.client.subscribe(topic, qos)
+
+    def publish(self, topic, payload, qos=None, retain=False):
+        """
+        发布消息，返回消息是否已交给客户端
+        断线时QoS>0的消息由paho排队，重连后发送
+        """
+        qos = self.topics.get(topic, self.default_qos) if qos is None else qos
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        mqtt = self._mqtt
+        ok = info.rc == mqtt.MQTT_ERR_SUCCESS or (qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN)
+        with self._lock:
+            if ok:
+                self.metrics["messages_published"] += 1
+            else:
+                self.metrics["publish_failures"] += 1
+        return ok
+
+    def start(self):
+        """异步连接并启动网络线程，连接失败时自动退避重试"""
+        self._started_at = time.monotonic()
+        self._disconnected_at = self._started_at
+        self.client.connect_async(self.broker, self.port, self.keepalive)
+        self.client.loop_start()
+        print(f"正在连接MQTT服务器 {self.broker}:{self.port}")
+
+    def stop(self):
+        if self._client is None:
+            return
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def is_connected(self):
+        with self._lock:
+            return self._connected
+
+    def has_connected(self):
+        """是否曾经成功连接过"""
+        with self._lock:
+            return self.metrics["connects"] > 0
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            if not self._connected and self._disconnected_at is not None:
+                metrics["current_downtime_seconds"] = round(time.monotonic() - self._disconnected_at, 3)
+            return metrics
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"MQTT连接被拒绝，返回码: {rc}")
+            with self._lock:
+                self.metrics["failed_attempts"] += 1
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._connected = True
+            metrics = self.metrics
+            metrics["connected"] = True
+            metrics["connects"] += 1
+            metrics["session_present"] = bool(flags.get("session present"))
+            if self._disconnected_at is not None:
+                downtime = round(now - self._disconnected_at, 3)
+                if metrics["connects"] == 1:
+                    metrics["first_connect_seconds"] = downtime
+                else:
+                    metrics["last_reconnect_seconds"] = downtime
+                    metrics["max_reconnect_seconds"] = max(metrics["max_reconnect_seconds"] or 0, downtime)
+                    metrics["total_downtime_seconds"] = round(metrics["total_downtime_seconds"] + downtime, 3)
+                self._disconnected_at = None
+            topics = list(self.topics.items())
+
+        print(f"已连接到MQTT服务器 {self.broker}:{self.port}，会话保留: {bool(flags.get('session present'))}")
+        # 服务器保留会话时订阅仍然有效，重复订阅也是幂等的，这里统一恢复一次
+        if topics:
+            client.subscribe(topics)
+            print(f"已订阅主题: {', '.join(topic for topic, _ in topics)}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            if self._connected:
+                self._disconnected_at = time.monotonic()
+                self.metrics["disconnects"] += 1
+            self._connected = False
+            self.metrics["connected"] = False
+        print(f"MQTT连接断开，返回码: {rc}，将自动重连")
+
+    def _on_connect_fail(self, client, userdata):
+        with self._lock:
+            self.metrics["failed_attempts"] += 1
+
+    def _on_message(self, client, userdata, msg):
+        with self._lock:
+            self.metrics["messages_received"] += 1
+        if self.on_message:
+            self.on_message(client, userdata, msg)
@@ -0,0 +1,141 @@
+import sys
+import time
+import threading
+from collections import OrderedDict, deque
+
+RECENT_INVALIDATIONS = 1024  # 记住最近的失效时间点，用于判断查询期间是否有数据写入
+
+
+def estimate_size(value):
+    """估算缓存值占用的字节数（递归统计列表、元组和字典）"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item)
+    return size
+
+
+class QueryCache:
+    """
+    时间范围查询结果缓存
+    - LRU，同时限制条目数量和估算的总字节数
+    - 已结束的时间窗口（end早于当前时间）结果不会再变化，永久缓存直到被LRU淘汰
+    - 包含当前时间的窗口按TTL过期
+    - 写入新数据时只失效时间范围覆盖该时间点的条目（通常是包含当前时间的窗口）
+    - 查询数据库之前读取 generation 并传给 put：查询期间有覆盖该范围的数据写入时不缓存，
+      避免把写入之前读到的旧结果缓存下来（已结束的窗口会被永久缓存）
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, ttl=10.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl                # 未结束窗口的有效期（秒）
+        self._entries = OrderedDict()  # 键 -> (值, 字节数, 过期时间或None, 开始时间, 结束时间)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0       # 超出容量被淘汰
+        self.expirations = 0     # TTL过期
+        self.invalidations = 0   # 写入新数据时失效
+        self.discarded = 0       # 查询期间数据被更新，结果没有缓存
+        self.generation = 0      # 每次 invalidate/clear 加1
+        self._recent = deque(maxlen=RECENT_INVALIDATIONS)  # (代数, 时间点)，clear 的时间点为None
+
+    def get(self, key):
+        """返回缓存值，不存在或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at = entry[2]
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, start=None, end=None, closed=False, generation=None):
+        """
+        缓存查询结果
+        start/end 为查询的时间范围（None表示不限），closed=True 表示窗口已经结束，不设置过期时间
+        未结束的窗口按到当前时间之后都有效处理，之后写入的新数据都会使其失效
+        generation 为查询数据库之前读取的 self.generation，之后有覆盖该范围的失效时不缓存
+        """
+        if not closed:
+            end = None
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires_at = None if closed else time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and self._invalidated_since(generation, start, end):
+                self.discarded += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at, start, end)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _invalidated_since(self, generation, start, end):
+        """代数 generation 之后是否有落在 [start, end] 内的失效"""
+        if generation == self.generation:
+            return False
+        if not self._recent or self._recent[0][0] > generation + 1:
+            return True  # 记录已经被覆盖，无法判断，按已失效处理
+        for number, timestamp in self._recent:
+            if number > generation and (timestamp is None or (
+                    (start is None or start <= timestamp) and (end is None or timestamp <= end))):
+                return True
+        return False
+
+    def invalidate(self, timestamp):
+        """写入时间为 timestamp 的新数据后，失效时间范围包含该时间点的条目，返回失效数量"""
+        with self._lock:
+            self.generation += 1
+            self._recent.append((self.generation, timestamp))
+            stale = [
+                key for key, (_, _, _, start, end) in self._entries.items()
+                if (start is None or start <= timestamp) and (end is None or timestamp <= end)
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._recent.append((self.generation, None))
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "discarded": self.discarded
+            }
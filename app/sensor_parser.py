@@ -1,10 +1,19 @@
+import time
 import struct
 import binascii
 from typing import Dict, List, Optional, Any, Tuple
 
+SENSOR_RECORD_SIZE = 6  # 434731 键0x03中每条传感器记录的字节数（温湿度3字节、气压2字节、电量1字节）
+MAX_PACKET_KEYS = 256   # 一个数据包最多解析的键值对数量（真实数据包只有几个）
+LOG_HEX_LIMIT = 512     # 日志中打印的十六进制字符数上限
+MAX_HISTORY_RECORDS = 1440  # 键0x03中最多解析的历史记录数（1分钟间隔时为一天），更早的记录丢弃
+MIN_DEVICE_TIMESTAMP = 1577836800  # 早于2020-01-01的设备时间戳视为无效（设备时钟未同步）
+MAX_CLOCK_SKEW = 300        # 设备时间最多允许比接收时间快多少秒
+
 
 class SensorData:
     def __init__(self):
+        self.timestamp: Optional[int] = None
         self.temperature: float = 0.0
         self.humidity: float = 0.0
         self.pressure: Optional[float] = None
@@ -21,6 +30,7 @@ class SensorData:
         
     def to_dict(self) -> Dict[str, Any]:
         return {
+            "timestamp": self.timestamp,
             "temperature": self.temperature,
             "humidity": self.humidity,
             "pressure": self.pressure,
@@ -71,6 +81,51 @@ def parse_robb_sensor_data(data: bytes) -> SensorData:
     return out
 
 
+def decode_sensor_record(record: bytes) -> SensorData:
+    """
+    解析一条6字节的传感器记录
+    - 前3个字节小端序组合，高12位是温度 (raw - 500) / 10，低12位是湿度 raw / 10
+    - 第4-5字节是气压 raw / 100 (hPa)
+    - 第6字节是电池电量
+    """
+    out = SensorData()
+    combined_data = record[0] | (record[1] << 8) | (record[2] << 16)
+    out.temperature = ((combined_data >> 12) - 500.0) / 10.0
+    out.humidity = (combined_data & 0xFFF) / 10.0
+    out.pressure = (record[3] | (record[4] << 8)) / 100.0
+    out.battery = record[5]
+    return out
+
+
+def parse_history_block(data: bytes, now: Optional[float] = None) -> MessagePod:
+    """
+    解析434731键0x03中的传感器记录
+    格式: [基准时间戳 4字节][存储间隔 2字节][记录1][记录2]...，每条记录6字节
+    第k条记录（从0开始）的时间戳为 基准时间戳 + k * 间隔
+    传感器离线后会把缓存的历史数据一次补传上来，结果按时间顺序放在 MessagePod.history 中
+    - 最多保留最新的 MAX_HISTORY_RECORDS 条，一个数据包产生的数据库写入有上限
+    - 多条记录但间隔为0、基准时间戳早于 MIN_DEVICE_TIMESTAMP 或晚于当前时间时整块丢弃（返回空的history）
+    """
+    pod = MessagePod()
+    if len(data) < 6:
+        return pod
+    base = int.from_bytes(data[0:4], byteorder='little')
+    interval = int.from_bytes(data[4:6], byteorder='little')
+    count = (len(data) - 6) // SENSOR_RECORD_SIZE
+    now = time.time() if now is None else now
+    if count > 1 and (interval == 0 or not MIN_DEVICE_TIMESTAMP <= base <= now + MAX_CLOCK_SKEW):
+        print(f"键0x03中的历史数据无效（基准时间戳 {base}，间隔 {interval} 秒，{count} 条记录），已忽略")
+        return pod
+    if count > MAX_HISTORY_RECORDS:
+        print(f"键0x03中有 {count} 条历史记录，只保留最新的 {MAX_HISTORY_RECORDS} 条")
+    for k in range(max(count - MAX_HISTORY_RECORDS, 0), count):
+        start = 6 + k * SENSOR_RECORD_SIZE
+        sample = decode_sensor_record(data[start:start + SENSOR_RECORD_SIZE])
+        sample.timestamp = base + k * interval
+        pod.history.append(sample)
+    return pod
+
+
 def hex_to_bytes(hex_str: str) -> bytes:
     """
     将十六进制字符串转换为字节数组
@@ -96,21 +151,18 @@ def parse_keys(data: bytes) -> dict:
       - 键（1字节）
       - 长度（2字节，小端序）
       - 值（长度由前面指定）
+    
+    数据包来自网络，长度字段不可信：每个数据项至少前进3个字节，最多解析 MAX_PACKET_KEYS 个数据项，
+    截断或长度超出范围时停止并只打印一行，畸形数据包的解析开销和日志量都与包长无关
     """
     # 检查数据包长度是否足够，至少需要5个字节
     if len(data) < 5:
         print("数据包太短，无法解析")
         return {}  # 返回空字典而不是None
     
-    # 检查数据是否以434734开头
-    if data[0] == 0x43 and data[1] == 0x47 and data[2] == 0x34:
-        # 434734格式的数据
-        print("检测到434734格式的数据")
-    
     # 获取负载长度（第3和第4个字节，小端序）
     # 第3个字节是低位，第4个字节是高位，使用位运算组合
     payload_length = data[3] | (data[4] << 8)
-    print(f"负载长度: {payload_length}")
     
     # 初始化结果字典，用于存储解析出的键值对
     result = {}
@@ -120,46 +172,44 @@ def parse_keys(data: bytes) -> dict:
     i = 5
     # 循环直到处理完所有数据或达到负载长度
     # payload_length + 3是因为前3个字节是协议头
-    while i < len(data) and i < payload_length + 3:
-        try:
-            # 获取键（1字节）
-            key = data[i]
-            # 检查是否有足够的字节来读取长度
-            if i + 2 >= len(data):
-                break
-                
-            # 获取值的长度（2字节，小端序）
-            # 第一个字节是低位，第二个字节是高位
-            length = data[i + 1] | (data[i + 2] << 8)
-            
-            # 检查是否有足够的字节来读取值
-            if i + 3 + length > len(data):
-                print(f"数据长度超出范围: 键={hex(key)}, 长度={length}, 当前位置={i}, 数据总长={len(data)}")
-                break
-                
-            # 获取值（长度由前面指定）
-            value = data[i + 3:i + 3 + length]
-            
-            # 使用十六进制格式的键作为字典的键
-            # 格式为0x后跟两位十六进制数
-            hex_key = f"0x{key:02x}"
-            result[hex_key] = value
-            
-            # 打印调试信息
-            print(f"解析到键值对: {hex_key} = {bytes_to_hex(value)} (长度: {length})")
-            
-            # 移动到下一个键值对
-            # 当前位置 + 3(键和长度) + 值的长度
-            i += 3 + length
-        except Exception as e:
-            # 捕获并打印解析过程中的任何错误
-            print(f"解析键值对时出错: {e}")
+    end = min(len(data), payload_length + 3)
+    items = 0
+    while i < end:
+        if items >= MAX_PACKET_KEYS:
+            print(f"键值对数量超过{MAX_PACKET_KEYS}，忽略剩余数据: 当前位置={i}, 数据总长={len(data)}")
+            break
+        # 检查是否有足够的字节来读取长度
+        if i + 2 >= len(data):
+            break
+        
+        # 获取键（1字节）和值的长度（2字节，小端序）
+        key = data[i]
+        length = data[i + 1] | (data[i + 2] << 8)
+        
+        # 检查是否有足够的字节来读取值
+        if i + 3 + length > len(data):
+            print(f"数据长度超出范围: 键={hex(key)}, 长度={length}, 当前位置={i}, 数据总长={len(data)}")
             break
+        
+        # 使用十六进制格式的键作为字典的键，同一个键出现多次时保留最后一个值
+        result[f"0x{key:02x}"] = data[i + 3:i + 3 + length]
+        items += 1
+        
+        # 移动到下一个键值对
+        # 当前位置 + 3(键和长度) + 值的长度
+        i += 3 + length
     
     # 返回解析结果
     return result
 
 
+def _hex_preview(hex_str: str) -> str:
+    """日志中只打印十六进制字符串的开头部分"""
+    if len(hex_str) <= LOG_HEX_LIMIT:
+        return hex_str
+    return f"{hex_str[:LOG_HEX_LIMIT]}...（共{len(hex_str) // 2}字节）"
+
+
 def parse_mqtt_payload(payload: bytes) -> Tuple[Dict[str, Any], str]:
     """
     解析MQTT消息负载
@@ -167,11 +217,11 @@ def parse_mqtt_payload(payload: bytes) -> Tuple[Dict[str, Any], str]:
     """
     # 将二进制数据转换为十六进制字符串，方便调试和显示
     hex_str = bytes_to_hex(payload)
-    print(f"收到MQTT消息: {hex_str}")
+    print(f"收到MQTT消息: {_hex_preview(hex_str)}")
     
     # 检查数据是否以434734开头，只解析这种格式的数据
     if not (hex_str.startswith("434734") or hex_str.startswith("434731")):
-        print(f"数据不是434734或434731开头，跳过解析: {hex_str}")
+        print(f"数据不是434734或434731开头，跳过解析: {_hex_preview(hex_str)}")
         return {"error": "数据格式不匹配，只解析434734或434731开头的数据", "_raw_hex": hex_str}, hex_str
     
     # 记录数据格式
@@ -181,7 +231,6 @@ def parse_mqtt_payload(payload: bytes) -> Tuple[Dict[str, Any], str]:
     try:
         # 直接使用原始数据，不进行转义处理
         data = payload
-        print(f"原始数据: {bytes_to_hex(data)}")
         
         # 解析数据包中的键值对结构
         keys_data = parse_keys(data)
@@ -203,7 +252,7 @@ def parse_mqtt_payload(payload: bytes) -> Tuple[Dict[str, Any], str]:
         if data_format == "434731" and "0x03" in keys_data:
             # 获取0x03键的数据
             data_0x03 = keys_data["0x03"]
-            print(f"解析键0x03: {bytes_to_hex(data_0x03)}")
+            print(f"解析键0x03: {_hex_preview(bytes_to_hex(data_0x03))}")
             
             # 解析时间戳（前4个字节，小端序）
             if len(data_0x03) >= 4:
@@ -266,12 +315,30 @@ def parse_mqtt_payload(payload: bytes) -> Tuple[Dict[str, Any], str]:
                 result["_0x03_sensor_data"] = bytes_to_hex(sensor_bytes)
                 
                 print(f"解析结果: 温度={result.get('temperature')}°C, 湿度={result.get('humidity')}%")
+
+            # 离线后补传的历史数据：键0x03中有多条记录时全部解析，由调用方一次批量写入数据库
+            pod = parse_history_block(data_0x03)
+            if len(pod.history) > 1:
+                # 超过 MAX_HISTORY_RECORDS 时丢弃的是最早的记录
+                first = (len(data_0x03) - 6) // SENSOR_RECORD_SIZE - len(pod.history)
+                result["_history"] = [
+                    {
+                        "timestamp": sample.timestamp,
+                        "temperature": sample.temperature,
+                        "humidity": sample.humidity,
+                        "pressure": sample.pressure,
+                        "battery": sample.battery,
+                        "_record": bytes_to_hex(data_0x03[6 + k * SENSOR_RECORD_SIZE:6 + (k + 1) * SENSOR_RECORD_SIZE])
+                    }
+                    for k, sample in enumerate(pod.history, first)
+                ]
+                print(f"键0x03中共有 {len(pod.history)} 条历史记录，间隔 {result.get('_interval')} 秒")
         
         # 如果是434734格式的数据，解析0x14键
         if data_format == "434734" and "0x14" in keys_data:
             # 获取0x14键的数据
             data_0x14 = keys_data["0x14"]
-            print(f"解析键0x14: {bytes_to_hex(data_0x14)}")
+            print(f"解析键0x14: {_hex_preview(bytes_to_hex(data_0x14))}")
             
             # 解析时间戳（前4个字节，小端序）
             if len(data_0x14) >= 4:
@@ -283,7 +350,7 @@ def parse_mqtt_payload(payload: bytes) -> Tuple[Dict[str, Any], str]:
             if len(data_0x14) >= 5:  # 至少有一个字节的传感器数据
                 # 获取传感器数据
                 sensor_bytes = data_0x14[4:]
-                print(f"键0x14中的传感器数据: {bytes_to_hex(sensor_bytes)}")
+                print(f"键0x14中的传感器数据: {_hex_preview(bytes_to_hex(sensor_bytes))}")
                 
                 # 如果有足够的字节，解析温湿度
                 if len(sensor_bytes) >= 3:
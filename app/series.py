@@ -0,0 +1,143 @@
+from array import array
+from datetime import datetime, timedelta
+
+from query_cache import QueryCache
+
+SERIES_FIELDS = ("temperature", "humidity", "pressure", "battery", "rssi")
+SERIES_METHODS = ("minmax", "lttb")
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+DEFAULT_RANGE = timedelta(hours=24)  # 没有指定 start 时默认最近24小时
+
+OUTPUT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _format_epoch(seconds):
+    return datetime.fromtimestamp(seconds).strftime(OUTPUT_TIME_FORMAT)
+
+
+def bucket_series(storage, field, start, end, points):
+    """
+    按时间分桶聚合，每个桶返回最小值、最大值、平均值和数量
+    聚合由存储引擎完成（storage.aggregate），返回的桶数不超过 points
+    """
+    start_epoch = int(start.timestamp())
+    end_epoch = int(end.timestamp())
+    span = max(end_epoch - start_epoch, 1)
+    bucket_seconds = max(-(-span // points), 1)  # 向上取整，保证桶数不超过points
+
+    result = {"t": [], "min": [], "max": [], "avg": [], "count": []}
+    for bucket_start, low, high, avg, count in storage.aggregate(field, start_epoch, end_epoch, bucket_seconds):
+        result["t"].append(_format_epoch(bucket_start))
+        result["min"].append(low)
+        result["max"].append(high)
+        result["avg"].append(round(avg, 3))
+        result["count"].append(count)
+    result["bucket_seconds"] = bucket_seconds
+    return result
+
+
+def _load_columns(storage, field, start, end):
+    """按列读取时间和数值，存入 array('d')，每个点只占16字节"""
+    times = array('d')
+    values = array('d')
+    for ts, value in storage.range_query(int(start.timestamp()), int(end.timestamp()), columns=(field,)):
+        if value is not None:
+            times.append(ts)
+            values.append(value)
+    return times, values
+
+
+def lttb_indices(times, values, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留的点的下标
+    保留首尾两点，中间每个桶选出与前一个选中点、下一个桶平均点构成三角形面积最大的点
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的平均点
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        count = next_end - next_start
+        avg_t = sum(times[next_start:next_end]) / count
+        avg_v = sum(values[next_start:next_end]) / count
+
+        # 当前桶中面积最大的点
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        at, av = times[a], values[a]
+        best = start
+        best_area = -1.0
+        for j in range(start, end):
+            area = abs((at - avg_t) * (values[j] - av) - (at - times[j]) * (avg_v - av))
+            if area > best_area:
+                best_area = area
+                best = j
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def lttb_series(storage, field, start, end, points):
+    times, values = _load_columns(storage, field, start, end)
+    indices = lttb_indices(times, values, points)
+    return {
+        "t": [_format_epoch(int(times[i])) for i in indices],
+        "value": [values[i] for i in indices],
+        "source_points": len(values),
+    }
+
+
+class SeriesService:
+    """
+    图表序列查询，结果按 (字段, 时间范围, 点数, 方法) 缓存在 QueryCache 中
+    已经结束的时间范围永久缓存，包含当前时间的范围按TTL缓存，写入新数据时失效
+    """
+
+    def __init__(self, storage, cache=None):
+        self.storage = storage
+        self.cache = cache or QueryCache()
+
+    def query(self, field, start=None, end=None, points=DEFAULT_POINTS, method="minmax"):
+        if field not in SERIES_FIELDS:
+            raise ValueError(f"不支持的字段: {field}，可选: {', '.join(SERIES_FIELDS)}")
+        if method not in SERIES_METHODS:
+            raise ValueError(f"不支持的降采样方法: {method}，可选: {', '.join(SERIES_METHODS)}")
+        if not 2 < points <= MAX_POINTS:
+            raise ValueError(f"points 需要在 3-{MAX_POINTS} 之间: {points}")
+
+        now = datetime.now()
+        closed = end is not None and end < now
+        # 未指定结束时间时以当前时间为准，缓存键中用None表示“到现在”
+        key = ("series", field, start, end if closed else None, points, method)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return dict(cached, cached=True)
+
+        end = end if closed else now
+        start = start or end - DEFAULT_RANGE
+        if start >= end:
+            raise ValueError("start 需要早于 end")
+
+        generation = self.cache.generation
+        if method == "lttb":
+            result = lttb_series(self.storage, field, start, end, points)
+        else:
+            result = bucket_series(self.storage, field, start, end, points)
+        result.update({
+            "field": field,
+            "method": method,
+            "start": start.strftime(OUTPUT_TIME_FORMAT),
+            "end": end.strftime(OUTPUT_TIME_FORMAT),
+            "points": len(result["t"]),
+        })
+
+        self.cache.put(key, result, start, end, closed, generation)
+        return dict(result, cached=False)
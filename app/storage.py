@@ -0,0 +1,360 @@
+import time
+import bisect
+import sqlite3
+import threading
+
+STORAGE_ENGINES = ("sqlite", "duckdb", "memory")
+STORAGE_FIELDS = ("temperature", "humidity", "pressure", "battery", "rssi")
+# 每行为 (ts, topic, temperature, humidity, pressure, battery, rssi, raw_data, data_format)，ts 为整数Unix时间戳
+STORAGE_COLUMNS = ("topic",) + STORAGE_FIELDS + ("raw_data", "data_format")
+_COLUMN_INDEX = {name: i + 1 for i, name in enumerate(STORAGE_COLUMNS)}
+DATA_FORMATS = ("434734", "434731")
+
+
+def row_from_record(record):
+    """内存记录转换为存储的行"""
+    parsed_data = record["parsed_data"]
+    raw_hex = parsed_data.get("_raw_hex", "")
+    data_format = parsed_data.get("_format") or (raw_hex[:6] if raw_hex[:6] in DATA_FORMATS else None)
+    return (
+        int(record["ts"]),
+        record.get("topic", ""),
+        parsed_data.get("temperature", 0.0),
+        parsed_data.get("humidity", 0.0),
+        parsed_data.get("pressure"),
+        parsed_data.get("battery"),
+        parsed_data.get("rssi"),
+        raw_hex,
+        data_format
+    )
+
+
+def _check_columns(columns):
+    columns = STORAGE_COLUMNS if columns is None else tuple(columns)
+    for name in columns:
+        if name not in STORAGE_COLUMNS:
+            raise ValueError(f"不支持的列: {name}，可选: {', '.join(STORAGE_COLUMNS)}")
+    return columns
+
+
+def _check_field(field):
+    if field not in STORAGE_FIELDS:
+        raise ValueError(f"不支持的字段: {field}，可选: {', '.join(STORAGE_FIELDS)}")
+
+
+class Storage:
+    """
+    传感器数据存储接口，时间参数和返回的时间都是整数Unix时间戳
+    - append_batch(rows): 在一次事务中写入多行，返回写入的行数
+    - range_query(start, end, columns, limit, newest_first): 时间在 [start, end] 内的行，
+      返回 (ts, *columns) 元组列表，默认按时间正序
+    - aggregate(field, start, end, bucket_seconds): 按时间等宽分桶，
+      返回 (桶开始时间, 最小值, 最大值, 平均值, 数量) 列表，跳过没有数据的桶
+    - retention(before): 删除早于 before 的数据，返回删除的行数
+    """
+
+    name = None
+
+    def append_batch(self, rows):
+        raise NotImplementedError
+
+    def range_query(self, start, end, columns=None, limit=None, newest_first=False):
+        raise NotImplementedError
+
+    def aggregate(self, field, start, end, bucket_seconds):
+        raise NotImplementedError
+
+    def retention(self, before):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# ---------------- SQLite ----------------
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    id INTEGER NOT NULL,
+    timestamp DATETIME,
+    temperature FLOAT,
+    humidity FLOAT,
+    pressure FLOAT,
+    battery INTEGER,
+    rssi INTEGER,
+    raw_data TEXT,
+    topic VARCHAR(100),
+    data_format VARCHAR(10),
+    ts INTEGER,
+    PRIMARY KEY (id)
+);
+CREATE INDEX IF NOT EXISTS ix_sensor_data_timestamp ON sensor_data (timestamp);
+"""
+# 早期版本的表没有 ts 列：添加后用 timestamp 列换算一次（本地时间字符串，夏令时切换前后的一小时无法区分）
+SQLITE_MIGRATE_TS = """
+ALTER TABLE sensor_data ADD COLUMN ts INTEGER;
+UPDATE sensor_data SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER);
+"""
+SQLITE_TS_INDEX = "CREATE INDEX IF NOT EXISTS ix_sensor_data_ts ON sensor_data (ts)"
+
+
+def _db_time(ts):
+    """整数Unix时间戳转换为数据库中的本地时间字符串（与 export.DB_TIME_FORMAT 相同）"""
+    return time.strftime("%Y-%m-%d %H:%M:%S.000000", time.localtime(ts))
+
+
+class SQLiteStorage(Storage):
+    """
+    直接使用sqlite3的存储引擎，表结构兼容早期版本用Flask-SQLAlchemy创建的表，已有的数据库文件可以直接使用
+    - executemany 一次事务写入，没有ORM逐行创建对象的开销
+    - WAL 模式，写入时不阻塞导出等只读连接
+    - 查询、聚合和清理都按整数Unix时间戳列 ts（带索引），夏令时切换时不会有重复或跳过的时间；
+      timestamp 列仍然写入本地时间字符串，供导出和早期版本读取
+    - 打开早期版本的数据库时添加 ts 列并由 timestamp 换算（只做一次）
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sensor_data)")]
+        if "ts" not in columns:
+            started = time.monotonic()
+            # 在一个事务中添加并填充，中途退出时下次打开会重新迁移
+            self._conn.executescript("BEGIN;" + SQLITE_MIGRATE_TS + "COMMIT;")
+            print(f"数据库已添加 ts 列，耗时 {time.monotonic() - started:.1f} 秒")
+        self._conn.execute(SQLITE_TS_INDEX)
+        self._insert_sql = (
+            f"INSERT INTO sensor_data (ts, timestamp, {', '.join(STORAGE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * (len(STORAGE_COLUMNS) + 2))})"
+        )
+
+    def append_batch(self, rows):
+        params = [(row[0], _db_time(row[0])) + tuple(row[1:]) for row in rows]
+        with self._lock, self._conn:
+            self._conn.executemany(self._insert_sql, params)
+        return len(params)
+
+    def range_query(self, start, end, columns=None, limit=None, newest_first=False):
+        columns = _check_columns(columns)
+        order = " DESC" if newest_first else ""
+        sql = (
+            f"SELECT {', '.join(('ts',) + columns)} FROM sensor_data "
+            f"WHERE ts >= ? AND ts <= ? ORDER BY ts{order}, id{order}"
+        )
+        params = [start, end]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def aggregate(self, field, start, end, bucket_seconds):
+        _check_field(field)
+        sql = (
+            f"SELECT (ts - ?) / ? AS bucket, "
+            f"MIN({field}), MAX({field}), AVG({field}), COUNT({field}) "
+            f"FROM sensor_data WHERE ts >= ? AND ts <= ? AND {field} IS NOT NULL "
+            f"GROUP BY bucket ORDER BY bucket"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, (start, bucket_seconds, start, end)).fetchall()
+        return [(start + bucket * bucket_seconds, low, high, avg, count) for bucket, low, high, avg, count in rows]
+
+    def retention(self, before):
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sensor_data WHERE ts < ?", (before,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------------- DuckDB ----------------
+
+DUCKDB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    ts BIGINT,
+    topic VARCHAR,
+    temperature DOUBLE,
+    humidity DOUBLE,
+    pressure DOUBLE,
+    battery INTEGER,
+    rssi INTEGER,
+    raw_data VARCHAR,
+    data_format VARCHAR
+)
+"""
+
+
+def _import_duckdb():
+    """duckdb是可选依赖，只有使用DuckDB存储引擎时才需要"""
+    try:
+        import duckdb
+        return duckdb
+    except ImportError:
+        raise ValueError("DuckDB 存储引擎需要安装 duckdb")
+
+
+class DuckDBStorage(Storage):
+    """
+    DuckDB 存储引擎，列式存储，长时间范围的扫描和聚合比SQLite快
+    - 时间列直接保存整数Unix时间戳
+    - 安装了 pyarrow 时每批数据先转换为Arrow表再一次插入；
+      DuckDB逐行绑定参数很慢（每行约1毫秒），没有pyarrow时写入吞吐量很低
+    """
+
+    name = "duckdb"
+
+    def __init__(self, path):
+        duckdb = _import_duckdb()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = duckdb.connect(path)
+        self._conn.execute(DUCKDB_SCHEMA)
+        try:
+            import pyarrow
+            self._pa = pyarrow
+        except ImportError:
+            self._pa = None
+        self._insert_sql = f"INSERT INTO sensor_data VALUES ({', '.join('?' * (len(STORAGE_COLUMNS) + 1))})"
+
+    def append_batch(self, rows):
+        if not rows:
+            return 0
+        with self._lock:
+            if self._pa is None:
+                self._conn.executemany(self._insert_sql, rows)
+                return len(rows)
+            columns = zip(("ts",) + STORAGE_COLUMNS, zip(*rows))
+            batch = self._pa.table({name: list(values) for name, values in columns})
+            self._conn.register("incoming_batch", batch)
+            try:
+                self._conn.execute("INSERT INTO sensor_data SELECT * FROM incoming_batch")
+            finally:
+                self._conn.unregister("incoming_batch")
+        return len(rows)
+
+    def range_query(self, start, end, columns=None, limit=None, newest_first=False):
+        columns = _check_columns(columns)
+        order = " DESC" if newest_first else ""
+        sql = (
+            f"SELECT {', '.join(('ts',) + columns)} FROM sensor_data "
+            f"WHERE ts >= ? AND ts <= ? ORDER BY ts{order}"
+        )
+        params = [start, end]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def aggregate(self, field, start, end, bucket_seconds):
+        _check_field(field)
+        sql = (
+            f"SELECT (ts - ?) // ? AS bucket, MIN({field}), MAX({field}), AVG({field}), COUNT({field}) "
+            f"FROM sensor_data WHERE ts >= ? AND ts <= ? AND {field} IS NOT NULL "
+            f"GROUP BY bucket ORDER BY bucket"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, (start, bucket_seconds, start, end)).fetchall()
+        return [(start + bucket * bucket_seconds, low, high, avg, count) for bucket, low, high, avg, count in rows]
+
+    def retention(self, before):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM sensor_data WHERE ts < ?", (before,)).fetchone()[0]
+            self._conn.execute("DELETE FROM sensor_data WHERE ts < ?", (before,))
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------------- 内存 ----------------
+
+class MemoryStorage(Storage):
+    """
+    内存存储引擎（用于测试和基准对比），进程退出后数据丢失
+    行按时间排序保存在列表中，时间范围用二分查找
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._times = []
+        self._rows = []
+
+    def append_batch(self, rows):
+        with self._lock:
+            for row in rows:
+                ts = row[0]
+                if not self._times or ts >= self._times[-1]:
+                    self._times.append(ts)
+                    self._rows.append(tuple(row))
+                else:
+                    index = bisect.bisect_right(self._times, ts)
+                    self._times.insert(index, ts)
+                    self._rows.insert(index, tuple(row))
+        return len(rows)
+
+    def _slice(self, start, end):
+        low = bisect.bisect_left(self._times, start)
+        high = bisect.bisect_right(self._times, end)
+        return self._rows[low:high]
+
+    def range_query(self, start, end, columns=None, limit=None, newest_first=False):
+        indexes = [_COLUMN_INDEX[name] for name in _check_columns(columns)]
+        with self._lock:
+            rows = self._slice(start, end)
+        if newest_first:
+            rows.reverse()
+        if limit is not None:
+            rows = rows[:limit]
+        return [(row[0],) + tuple(row[i] for i in indexes) for row in rows]
+
+    def aggregate(self, field, start, end, bucket_seconds):
+        _check_field(field)
+        index = _COLUMN_INDEX[field]
+        with self._lock:
+            rows = self._slice(start, end)
+        buckets = {}
+        for row in rows:
+            value = row[index]
+            if value is None:
+                continue
+            bucket = (row[0] - start) // bucket_seconds
+            stats = buckets.get(bucket)
+            if stats is None:
+                buckets[bucket] = [value, value, value, 1]
+            else:
+                stats[0] = min(stats[0], value)
+                stats[1] = max(stats[1], value)
+                stats[2] += value
+                stats[3] += 1
+        return [(start + bucket * bucket_seconds, low, high, total / count, count)
+                for bucket, (low, high, total, count) in sorted(buckets.items())]
+
+    def retention(self, before):
+        with self._lock:
+            index = bisect.bisect_left(self._times, before)
+            del self._times[:index]
+            del self._rows[:index]
+        return index
+
+
+def open_storage(engine, path=None):
+    """按配置创建存储引擎；sqlite 和 duckdb 需要数据库文件路径"""
+    if engine == "sqlite":
+        return SQLiteStorage(path)
+    if engine == "duckdb":
+        return DuckDBStorage(path)
+    if engine == "memory":
+        return MemoryStorage()
+    raise ValueError(f"不支持的存储引擎: {engine}，可选: {', '.join(STORAGE_ENGINES)}")
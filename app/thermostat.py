@@ -0,0 +1,246 @@
+import time
+import threading
+from collections import deque
+
+from ac_control import MIN_TEMP, MAX_TEMP
+
+THERMOSTAT_MODES = ("hysteresis", "pid")
+DEFAULT_HYSTERESIS = 0.5    # 开关机回差（°C）：高于设定温度+回差开机，低于设定温度-回差关机
+DEFAULT_MIN_ON = 600        # 开机后至少运行多少秒才允许关机
+DEFAULT_MIN_OFF = 300       # 关机后至少停多少秒才允许再开机
+DEFAULT_MIN_ADJUST = 300    # pid 模式两次调整空调设定温度的最短间隔（秒）
+PID_STEP_HYSTERESIS = 0.75  # pid 模式空调设定温度的换挡回差（°C）
+FEEDBACK_GRACE = 60         # 发出指令后这么多秒内，不采信与之不一致的状态反馈（空调尚未回报新状态）
+MAX_READING_AGE = 120       # 比接收时间早这么多秒以上的读数（补传的历史数据）不参与控制
+LATENCY_SAMPLES = 1000      # 保留最近多少次决策耗时
+
+
+class PIDController:
+    """
+    PID控制器，输出限制在 ±output_limit
+    积分项按输出限制截断，避免长时间偏差导致积分饱和
+    """
+
+    def __init__(self, kp=1.0, ki=0.002, kd=0.0, output_limit=4.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_limit = output_limit
+        self.reset()
+
+    def reset(self):
+        self._integral = 0.0
+        self._last_error = None
+        self._last_ts = None
+
+    def update(self, error, ts):
+        derivative = 0.0
+        if self._last_ts is not None and ts > self._last_ts:
+            dt = ts - self._last_ts
+            self._integral += error * dt
+            if self.ki:
+                limit = self.output_limit / self.ki
+                self._integral = max(-limit, min(limit, self._integral))
+            derivative = (error - self._last_error) / dt
+        self._last_error = error
+        self._last_ts = ts
+        output = self.kp * error + self.ki * self._integral + self.kd * derivative
+        return max(-self.output_limit, min(self.output_limit, output))
+
+
+class RoomThermostat:
+    """
+    单个房间的恒温控制（制冷）：一个青萍传感器（主题）对应一台空调
+    - 开关机按回差判断，并遵守最短开机/关机时间，避免压缩机频繁启停
+    - hysteresis 模式开机后把空调设为设定温度；pid 模式根据室温偏差调整空调设定温度
+    - 只在目标变化时产生指令，相同的指令不会重复发送；pid 模式调整设定温度至少间隔 min_adjust 秒
+    时间均使用读数时间（整数Unix时间戳），可以用模拟数据按虚拟时间驱动
+    """
+
+    def __init__(self, room, device, unit, setpoint, mode="hysteresis", hysteresis=DEFAULT_HYSTERESIS,
+                 min_on=DEFAULT_MIN_ON, min_off=DEFAULT_MIN_OFF, min_adjust=DEFAULT_MIN_ADJUST, pid=None,
+                 enabled=True):
+        if mode not in THERMOSTAT_MODES:
+            raise ValueError(f"不支持的控制方式: {mode}，可选: {', '.join(THERMOSTAT_MODES)}")
+        self.room = room
+        self.device = device
+        self.unit = unit
+        self.setpoint = float(setpoint)
+        self.mode = mode
+        self.hysteresis = hysteresis
+        self.min_on = min_on
+        self.min_off = min_off
+        self.min_adjust = min_adjust
+        self.enabled = enabled
+        self.pid = PIDController(**(pid or {})) if mode == "pid" else None
+
+        self.power = None            # 最近一次发出的电源指令（on/off），未知为None
+        self.power_changed_at = None
+        self.commanded_at = None     # 最近一次发出电源指令的时间
+        self.ac_temp = None          # 最近一次发出的空调设定温度
+        self.temp_commanded_at = None
+        self.last_temperature = None
+        self.last_decision_at = None
+
+    def decide(self, ts, temperature, actual_power=None, actual_temp=None):
+        """
+        根据一条读数决定要发送的指令，返回 [(类型, 值), ...]
+        actual_power/actual_temp 为空调状态反馈中的电源状态和设定温度（已知时以它为准，例如有人用遥控器
+        关了空调或调了温度；刚发出指令、空调还没回报新状态时除外）
+        """
+        if not self.enabled or temperature is None:
+            return []
+        self.last_temperature = temperature
+        self.last_decision_at = ts
+        awaiting_feedback = self.commanded_at is not None and ts - self.commanded_at < FEEDBACK_GRACE
+        if actual_power is not None and actual_power != self.power and not awaiting_feedback:
+            self.power = actual_power
+            self.power_changed_at = ts
+        awaiting_temp = self.temp_commanded_at is not None and ts - self.temp_commanded_at < FEEDBACK_GRACE
+        if actual_temp is not None and self.ac_temp is not None and actual_temp != self.ac_temp and not awaiting_temp:
+            self.ac_temp = actual_temp
+
+        commands = []
+        since_change = None if self.power_changed_at is None else ts - self.power_changed_at
+        if self.power != "on" and temperature >= self.setpoint + self.hysteresis:
+            if since_change is None or self.power is None or since_change >= self.min_off:
+                commands.append(("power", "on"))
+                self.power = "on"
+                self.power_changed_at = self.commanded_at = ts
+                if self.pid:
+                    self.pid.reset()
+        elif self.power != "off" and temperature <= self.setpoint - self.hysteresis:
+            if since_change is None or self.power is None or since_change >= self.min_on:
+                commands.append(("power", "off"))
+                self.power = "off"
+                self.power_changed_at = self.commanded_at = ts
+                self.ac_temp = None
+
+        if self.power == "on":
+            if self.pid:
+                output = self.pid.update(temperature - self.setpoint, ts)
+                target = self.setpoint - output
+                # 取整加回差：输出越过当前空调温度 ±PID_STEP_HYSTERESIS 才换挡
+                if self.ac_temp is not None and abs(target - self.ac_temp) < PID_STEP_HYSTERESIS:
+                    target = self.ac_temp
+                target = round(target)
+            else:
+                target = round(self.setpoint)
+            target = max(MIN_TEMP, min(MAX_TEMP, target))
+            # pid 输出在取整边界附近来回变化时，不要每条读数都调一次空调
+            adjusting = self.pid and self.ac_temp is not None and self.temp_commanded_at is not None
+            if adjusting and ts - self.temp_commanded_at < self.min_adjust:
+                target = self.ac_temp
+            if target != self.ac_temp:
+                commands.append(("temp", target))
+                self.ac_temp = target
+                self.temp_commanded_at = ts
+        return commands
+
+    def status(self):
+        return {
+            "room": self.room,
+            "device": self.device,
+            "unit": self.unit,
+            "mode": self.mode,
+            "enabled": self.enabled,
+            "setpoint": self.setpoint,
+            "hysteresis": self.hysteresis,
+            "temperature": self.last_temperature,
+            "power": self.power,
+            "ac_temp": self.ac_temp,
+            "power_changed_at": self.power_changed_at,
+            "last_decision_at": self.last_decision_at
+        }
+
+
+class ThermostatService:
+    """
+    根据实时读数驱动各房间的恒温控制，指令交给空调指令调度器（合并同类指令、限制发送频率）
+    - submit(unit, kind, value) 提交指令，通常为 CommandDispatcher.submit
+    - ac_state(unit) 返回空调状态反馈 {"power": on/off/None, "temp": N/None}，通常为 ACStateCache.get
+    - 记录从收到读数到提交指令的决策耗时；clock 为取当前时间的函数（模拟时可换成虚拟时钟）
+    """
+
+    def __init__(self, rooms, submit, ac_state=None, max_reading_age=MAX_READING_AGE, clock=time.time):
+        self._submit = submit
+        self._ac_state = ac_state
+        self._clock = clock
+        self.max_reading_age = max_reading_age
+        self._lock = threading.Lock()
+        self.rooms = {}
+        self._by_device = {}
+        for config in rooms:
+            room = RoomThermostat(**config)
+            if room.room in self.rooms:
+                raise ValueError(f"房间名称重复: {room.room}")
+            self.rooms[room.room] = room
+            self._by_device.setdefault(room.device, []).append(room)
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)  # 决策耗时（毫秒）
+        self.stats = {"readings": 0, "decisions": 0, "commands": 0, "skipped_stale": 0}
+
+    def observe(self, device, ts, values, received_at=None):
+        """处理一条读数；received_at 为收到消息的时间（与 clock 相同的时钟），用于统计决策耗时"""
+        rooms = self._by_device.get(device)
+        if not rooms:
+            return []
+        received_at = self._clock() if received_at is None else received_at
+        if received_at - ts > self.max_reading_age:
+            self.stats["skipped_stale"] += 1
+            return []
+
+        submitted = []
+        with self._lock:
+            self.stats["readings"] += 1
+            for room in rooms:
+                state = self._ac_state(room.unit) if self._ac_state else {}
+                commands = room.decide(ts, values.get("temperature"), state.get("power"), state.get("temp"))
+                self.stats["decisions"] += 1
+                for kind, value in commands:
+                    result = self._submit(room.unit, kind, value)
+                    submitted.append((room.room, kind, value, result))
+                    self.stats["commands"] += 1
+            if submitted:
+                self._latencies.append((self._clock() - received_at) * 1000)
+        for room_name, kind, value, _ in submitted:
+            print(f"恒温控制 {room_name}: {kind} {value}")
+        return submitted
+
+    def update_room(self, room_name, setpoint=None, enabled=None):
+        """修改设定温度或启用/停用某个房间的恒温控制"""
+        with self._lock:
+            room = self.rooms.get(room_name)
+            if room is None:
+                raise KeyError(room_name)
+            # "false"、"0" 之类的字符串用bool()转换会变成True，只接受JSON布尔值（先检查，参数无效时不修改任何设置）
+            if enabled is not None and not isinstance(enabled, bool):
+                raise ValueError(f"enabled 需要是布尔值(true/false): {enabled!r}")
+            if setpoint is not None:
+                setpoint = float(setpoint)
+                if not MIN_TEMP <= setpoint <= MAX_TEMP:
+                    raise ValueError(f"设定温度超出范围({MIN_TEMP}-{MAX_TEMP}): {setpoint}")
+                room.setpoint = setpoint
+                if room.pid:
+                    room.pid.reset()
+            if enabled is not None:
+                room.enabled = enabled
+            return room.status()
+
+    def latency_stats(self):
+        """决策耗时（从收到读数到提交指令，毫秒）的分位数"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": len(samples),
+            "p50_ms": round(samples[len(samples) // 2], 3),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            "max_ms": round(samples[-1], 3)
+        }
+
+    def status(self):
+        with self._lock:
+            rooms = [room.status() for room in self.rooms.values()]
+            stats = dict(self.stats)
+        return {"rooms": rooms, "stats": stats, "latency": self.latency_stats()}
@@ -0,0 +1,35 @@
+import time
+
+from ingest import MAX_CLOCK_SKEW, next_sequence
+
+WARM_FIELDS = ("temperature", "humidity", "pressure", "battery", "rssi")
+WARM_WINDOW = 24 * 3600  # 预热最近24小时的数据
+
+
+def load_recent(storage, limit, window=WARM_WINDOW):
+    """
+    从存储引擎读取最近的读数（按时间倒序，最多 limit 条，不早于 window 秒之前）
+    只有一次按时间倒序的范围查询，不重新解析原始数据
+    返回 [(读数时间（整数Unix时间戳）, 主题, 原始十六进制, {字段: 值}), ...]，最新的在前
+    """
+    now = int(time.time())
+    rows = storage.range_query(now - window, now + MAX_CLOCK_SKEW, columns=("topic", "raw_data") + WARM_FIELDS,
+                               limit=limit, newest_first=True)
+    readings = []
+    for ts, topic, raw_hex, *values in rows:
+        fields = {name: value for name, value in zip(WARM_FIELDS, values) if value is not None}
+        readings.append((ts, topic, raw_hex or "", fields))
+    return readings
+
+
+def history_record(ts, topic, raw_hex, fields):
+    """把数据库中的读数还原为内存历史记录的格式，并分配新的序号"""
+    parsed_data = dict(fields)
+    parsed_data["_raw_hex"] = raw_hex
+    return {
+        "ts": ts,
+        "seq": next_sequence(),
+        "topic": topic,
+        "hex_data": raw_hex,
+        "parsed_data": parsed_data
+    }
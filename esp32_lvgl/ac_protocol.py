@@ -0,0 +1,203 @@
+# 空调控制消息协议（面板 main.py 和服务器 app.py 共用，需要与 main.py 一起上传到ESP32）
+#
+# 二进制帧（版本1，固定7字节）:
+#   [0]   0xAC 魔数（不是可打印字符，不会与旧的文本消息混淆）
+#   [1]   高4位: 协议版本，低4位: 消息类型（1=指令，2=状态）
+#   [2]   发送方节点编号
+#   [3:5] 序号（uint16，大端序），重发时保持不变，接收方据此去重
+#   [5]   操作: 0=关机，1=开机，2=设置温度，3=查询状态（状态消息中为电源状态）
+#   [6]   温度值（状态消息中0表示未知）
+#
+# 状态消息的序号为所确认指令的序号，主动上报时为0
+#
+# 旧格式文本（"on"、"set 25"、"api/temp/25"、"ONON"、{"status":"on","temp":25} 等）
+# 通过 parse_legacy / to_legacy 兼容，红外发射端固件仍然使用文本指令
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+MAGIC = 0xAC
+VERSION = 1
+FRAME_SIZE = 7
+
+# 消息类型
+MSG_COMMAND = 1
+MSG_STATE = 2
+
+# 操作
+OP_OFF = 0
+OP_ON = 1
+OP_TEMP = 2
+OP_STATUS = 3
+
+# 节点编号
+NODE_UNKNOWN = 0   # 旧格式文本消息没有发送方
+NODE_SERVER = 1    # 服务器 app.py
+NODE_PANEL = 2     # 触摸屏面板 esp32_lvgl
+NODE_STICKC = 3    # 红外发射端 stickc_ac_con
+
+# 红外发射端（stickc_ac_con.ino）的文本指令
+API_POWER_ON = "api/power/on"
+API_POWER_OFF = "api/power/off"
+API_TEMP_PREFIX = "api/temp/"
+API_STATUS = "api/status"
+
+# 旧格式文本方言
+DIALECT_PANEL = "panel"        # on / off / set N，确认为 ONON / OFFOFF
+DIALECT_FIRMWARE = "firmware"  # api/...，状态为JSON
+
+SEQ_MASK = 0xFFFF
+SEQ_WINDOW = 64  # 落后超过此数量的序号视为发送方重启，重新同步
+
+
+def encode(msg_type, node, seq, op, value=0):
+    """编码二进制帧"""
+    return bytes((MAGIC, (VERSION << 4) | msg_type, node, (seq >> 8) & 0xFF, seq & 0xFF, op, value))
+
+
+def encode_into(buf, msg_type, node, seq, op, value=0):
+    """编码到预先分配的缓冲区（长度至少为FRAME_SIZE），发送循环中不产生新对象"""
+    buf[0] = MAGIC
+    buf[1] = (VERSION << 4) | msg_type
+    buf[2] = node
+    buf[3] = (seq >> 8) & 0xFF
+    buf[4] = seq & 0xFF
+    buf[5] = op
+    buf[6] = value
+    return buf
+
+
+def is_frame(payload):
+    return len(payload) > 0 and payload[0] == MAGIC
+
+
+def decode(payload):
+    """
+    解码二进制帧，返回 (消息类型, 节点编号, 序号, 操作, 值)
+    不是二进制帧时返回None，版本或长度不对时抛出ValueError
+    只按下标读取，不复制数据
+    """
+    if not is_frame(payload):
+        return None
+    if len(payload) != FRAME_SIZE:
+        raise ValueError("frame length {}".format(len(payload)))
+    header = payload[1]
+    if header >> 4 != VERSION:
+        raise ValueError("frame version {}".format(header >> 4))
+    msg_type = header & 0x0F
+    if msg_type not in (MSG_COMMAND, MSG_STATE):
+        raise ValueError("frame type {}".format(msg_type))
+    return msg_type, payload[2], (payload[3] << 8) | payload[4], payload[5], payload[6]
+
+
+def parse_legacy(message):
+    """
+    解析旧格式文本，返回 (消息类型, 操作, 值)，无法识别时返回None
+    温度值不是整数时抛出ValueError
+    """
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        message = bytes(message).decode()
+    message = message.strip().lower()
+    if message in ("on", API_POWER_ON):
+        return MSG_COMMAND, OP_ON, 0
+    if message in ("off", API_POWER_OFF):
+        return MSG_COMMAND, OP_OFF, 0
+    if message == API_STATUS:
+        return MSG_COMMAND, OP_STATUS, 0
+    if message.startswith(API_TEMP_PREFIX):
+        return MSG_COMMAND, OP_TEMP, int(message[len(API_TEMP_PREFIX):])
+    if message.startswith("set "):
+        return MSG_COMMAND, OP_TEMP, int(message[4:])
+    if message == "onon":
+        return MSG_STATE, OP_ON, 0
+    if message == "offoff":
+        return MSG_STATE, OP_OFF, 0
+    if message.startswith("{"):
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or data.get("status") not in ("on", "off"):
+            return None
+        try:
+            temp = int(data.get("temp", 0))
+        except (TypeError, ValueError):
+            temp = 0
+        return MSG_STATE, OP_ON if data["status"] == "on" else OP_OFF, temp
+    return None
+
+
+def decode_any(payload):
+    """
+    解码二进制帧或旧格式文本，返回 (消息类型, 节点编号, 序号, 操作, 值)
+    旧格式文本的节点编号为NODE_UNKNOWN，序号为None；无法识别时返回None
+    """
+    message = decode(payload)
+    if message is not None:
+        return message
+    legacy = parse_legacy(payload)
+    if legacy is None:
+        return None
+    return legacy[0], NODE_UNKNOWN, None, legacy[1], legacy[2]
+
+
+def to_legacy(msg_type, op, value=0, dialect=DIALECT_PANEL):
+    """把消息转换为旧格式文本（bytes）"""
+    if msg_type == MSG_STATE:
+        if dialect == DIALECT_PANEL:
+            return b"ONON" if op == OP_ON else b"OFFOFF"
+        status = "on" if op == OP_ON else "off"
+        if value:
+            return '{{"status":"{}","temp":{}}}'.format(status, value).encode()
+        return '{{"status":"{}"}}'.format(status).encode()
+
+    if dialect == DIALECT_PANEL:
+        if op == OP_ON:
+            return b"on"
+        if op == OP_OFF:
+            return b"off"
+        if op == OP_TEMP:
+            return "set {}".format(value).encode()
+        raise ValueError("panel dialect has no status command")
+    if op == OP_ON:
+        return API_POWER_ON.encode()
+    if op == OP_OFF:
+        return API_POWER_OFF.encode()
+    if op == OP_TEMP:
+        return (API_TEMP_PREFIX + str(value)).encode()
+    return API_STATUS.encode()
+
+
+def next_seq(seq):
+    """下一个序号，跳过0（0保留给主动上报的状态消息）"""
+    seq = (seq + 1) & SEQ_MASK
+    return seq or 1
+
+
+class SeqFilter:
+    """
+    按发送方记录最近处理的序号，重复的指令只确认不重复执行
+    序号按16位回绕比较；落后超过SEQ_WINDOW时认为发送方已重启，重新接受
+    """
+
+    def __init__(self, window=SEQ_WINDOW):
+        self.window = window
+        self._last = {}  # 节点编号 -> 最近处理的序号
+
+    def accept(self, node, seq):
+        """序号是新的返回True并记录，重复或过期返回False"""
+        if seq is None:
+            # 旧格式文本没有序号，无法去重
+            return True
+        last = self._last.get(node)
+        if last is not None:
+            behind = (last - seq) & SEQ_MASK
+            if behind < self.window:
+                return False
+        self._last[node] = seq
+        return True
+
+    def last(self, node):
+        return self._last.get(node)
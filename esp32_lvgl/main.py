@@ -1,11 +1,54 @@
 import lvgl as lv
+import sys
 import time
-from espidf import VSPI_HOST
-from ili9XXX import ili9488
-from ft6x36 import ft6x36 
-from machine import Pin, I2C
+import json
 import network
 from umqtt.simple import MQTTClient
+import ac_protocol
+
+try:
+    from ubinascii import hexlify, unhexlify
+except ImportError:
+    from binascii import hexlify, unhexlify
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio  # 在Linux上使用桩模块调试时
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    # CPython没有ticks系列函数
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(new, old):
+        return new - old
+
+
+async def sleep_ms(ms):
+    """协程内休眠（毫秒），兼容uasyncio和asyncio"""
+    if hasattr(asyncio, "sleep_ms"):
+        await asyncio.sleep_ms(ms)
+    else:
+        await asyncio.sleep(ms / 1000)
+
+
+if sys.implementation.name == "micropython":
+    def wait_readable(sock):
+        # 把socket挂到uasyncio的IO队列上，调度器在select/poll中休眠，可读时唤醒当前任务
+        yield asyncio.core._io_queue.queue_read(sock)
+else:
+    async def wait_readable(sock):
+        # CPython：用事件循环的reader回调等待socket可读
+        loop = asyncio.get_event_loop()
+        readable = asyncio.Event()
+        loop.add_reader(sock, readable.set)
+        try:
+            await readable.wait()
+        finally:
+            loop.remove_reader(sock)
 
 # ------------------------------ 全局变量 ------------------------------
 current_temp = 25                 # 当前温度
@@ -19,9 +62,262 @@ WIFI_CONFIGS = [
     {"ssid": "office", "password": "gdzsam632"},
     {"ssid": "office_2.4", "password": "gdzsam632"}
 ]
+WIFI_PASSWORDS = {config["ssid"]: config["password"] for config in WIFI_CONFIGS}
+WIFI_CACHE_FILE = "wifi_cache.json"  # 上次成功连接的SSID/BSSID/信道缓存
 MQTT_SERVER = "192.168.1.59"     # MQTT服务器地址
 MQTT_TOPIC = b"aircon"           # MQTT主题
+MQTT_STATUS_TOPIC = b"stickc/up" # 红外发射端发布JSON状态的主题，用于确认发件箱中的指令（None表示不订阅）
+MQTT_BINARY_PROTOCOL = False     # 发送二进制指令帧（ac_protocol），主题上的接收端都支持二进制帧后再设为True
 mqtt_client = None               # MQTT客户端实例
+mqtt_ready = asyncio.Event()     # MQTT连接建立时置位，唤醒接收任务
+ui_event = asyncio.Event()       # 有界面工作时置位，唤醒界面任务
+outbox_event = asyncio.Event()   # 发件箱有新指令、收到确认或MQTT重连时置位
+
+# MQTT接收统计（用于评估消息到界面的延迟）
+mqtt_stats = {
+    "messages": 0,          # 处理的消息数量
+    "duplicates": 0,        # 按序号去重的重复指令数量
+    "last_latency_ms": 0,   # 最近一条消息从socket可读到界面任务提交更新的耗时（不更新界面时到处理完成）
+    "max_latency_ms": 0     # 最大耗时
+}
+
+# 各协程任务被唤醒的次数（用于评估空闲时每秒的唤醒次数）
+task_wakeups = {"ui": 0, "wifi": 0, "mqtt": 0, "ping": 0, "outbox": 0}
+
+def record_mqtt_latency(start):
+    """记录一条消息从socket可读（start）到界面更新完成的耗时"""
+    latency = ticks_diff(ticks_ms(), start)
+    mqtt_stats["last_latency_ms"] = latency
+    if latency > mqtt_stats["max_latency_ms"]:
+        mqtt_stats["max_latency_ms"] = latency
+
+# ------------------------------ 任务调度设置 ------------------------------
+LVGL_REFRESH_HZ = 30             # LVGL刷新频率（帧/秒）
+UI_TASK_INTERVAL_MS = 500        # 显示状态文本期间的淡出检查间隔
+STATUS_BAR_SHOW_SECONDS = True   # 状态栏时间是否显示秒（设为False时每分钟只重绘一次）
+WIFI_CHECK_INTERVAL_MS = 5000    # Wi-Fi信号和MQTT连接检查间隔
+WIFI_LINK_CHECK_INTERVAL_MS = 1000  # Wi-Fi断线检测间隔
+WIFI_CONNECT_TIMEOUT_MS = 15000  # 单个SSID连接超时
+WIFI_FAST_CONNECT_TIMEOUT_MS = 3000  # 快速重连（缓存的BSSID）超时，超时后只按SSID连接
+WIFI_SSID_CONNECT_TIMEOUT_MS = 8000  # 只按SSID连接的超时（驱动在后台寻找接入点），超时后回退到扫描
+WIFI_POLL_INTERVAL_MS = 100      # 等待连接时的检查间隔
+WIFI_ROAM_RSSI_THRESHOLD = -75   # 信号低于此值时检查是否有更好的接入点
+WIFI_ROAM_HYSTERESIS_DB = 10     # 新接入点至少强这么多才切换
+WIFI_ROAM_SCAN_INTERVAL_MS = 300000  # 漫游扫描最小间隔（5分钟）
+WIFI_ROAM_IDLE_MS = 30000       # 最近这段时间内有触摸操作时不做漫游扫描（扫描会阻塞界面）
+MQTT_PING_INTERVAL_MS = 60000    # MQTT心跳间隔
+OUTBOX_ACK_TIMEOUT_MS = 5000     # 指令确认超时
+OUTBOX_MAX_RETRIES = 2           # 指令最多重发次数
+
+def load_wifi_cache():
+    """读取Wi-Fi连接缓存"""
+    try:
+        with open(WIFI_CACHE_FILE) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_wifi_cache(cache):
+    """保存Wi-Fi连接缓存"""
+    try:
+        with open(WIFI_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print("保存WiFi缓存失败:", str(e))
+
+# ------------------------------ 指令发件箱 ------------------------------
+class CommandOutbox:
+    """
+    面板指令发件箱
+    - 每种指令只保留最新的一条（电源以最后一次开关为准，温度以最后一次设置为准），队列天然有界
+    - MQTT断开时指令留在发件箱中，重连后再发送，不会丢失用户操作
+    - 发送窗口为1：发出一条后等待带相同序号的状态帧（或旧格式的ONON/OFFOFF、JSON状态）确认，再发送下一条
+    - 超时未确认时用同一序号重发，接收方按序号去重，重发不会重复执行；超过重试次数后放弃这一条
+    - 还没有收到过其他节点的状态消息时不重发（没有节点会确认，重发只会增加MQTT流量），超时后直接放弃
+    - 确认或放弃时调用 on_result(指令类型, 操作, 值, 是否确认)，界面据此显示结果
+    """
+    KINDS = ("power", "temp")  # 发送顺序：先电源后温度
+
+    def __init__(self, ack_timeout_ms=OUTBOX_ACK_TIMEOUT_MS, max_retries=OUTBOX_MAX_RETRIES):
+        self.ack_timeout_ms = ack_timeout_ms
+        self.max_retries = max_retries
+        self.pending = {}      # 指令类型 -> (操作, 值)
+        self.inflight = None   # [指令类型, 操作, 值, 序号, 发送时间, 已重发次数]
+        # 重启后从随机位置开始编号，避免接收方把新指令当成重复
+        self.seq = ticks_ms() & ac_protocol.SEQ_MASK
+        self._frame = bytearray(ac_protocol.FRAME_SIZE)  # 复用的发送缓冲区
+        self.peer_seen = False  # 是否收到过其他节点的状态消息
+        self.on_result = None
+        self.stats = {"queued": 0, "coalesced": 0, "sent": 0, "acked": 0, "retried": 0, "expired": 0}
+
+    def put(self, kind, op, value=0):
+        """加入发件箱，同类指令覆盖旧值"""
+        if kind in self.pending:
+            self.stats["coalesced"] += 1
+        self.pending[kind] = (op, value)
+        self.stats["queued"] += 1
+        outbox_event.set()
+
+    def has_pending(self):
+        return bool(self.pending) or self.inflight is not None
+
+    def ack(self, seq, op, value):
+        """
+        处理状态消息，返回是否确认了在途指令
+        二进制状态帧按序号确认；旧格式消息（seq为None）按电源状态或温度值确认
+        """
+        self.peer_seen = True
+        if self.inflight is None:
+            return False
+        kind, sent_op, sent_value, sent_seq = self.inflight[:4]
+        if seq is not None:
+            acked = seq == sent_seq
+        elif kind == "power":
+            acked = op == sent_op
+        else:
+            acked = value == sent_value
+        if acked:
+            self.inflight = None
+            self.stats["acked"] += 1
+            outbox_event.set()
+            self._report(kind, sent_op, sent_value, True)
+        return acked
+
+    def _report(self, kind, op, value, acked):
+        if self.on_result:
+            self.on_result(kind, op, value, acked)
+
+    def flush(self, network_manager):
+        """
+        发送下一条指令
+        返回距离在途指令确认超时的毫秒数，没有在途指令时返回None
+        """
+        client = network_manager.mqtt_client
+        if self.inflight is not None:
+            kind, op, value, seq, sent_at, retries = self.inflight
+            waited = ticks_diff(ticks_ms(), sent_at)
+            if waited < self.ack_timeout_ms:
+                return self.ack_timeout_ms - waited
+            if retries >= self.max_retries or kind in self.pending or not self.peer_seen:
+                # 放弃这一条（或已有更新的同类指令），继续发送后面的指令
+                self.inflight = None
+                self.stats["expired"] += 1
+                if kind not in self.pending:
+                    self._report(kind, op, value, False)
+            elif client:
+                self.stats["retried"] += 1
+                self._send(network_manager, kind, op, value, seq, retries + 1)
+                return self.ack_timeout_ms if self.inflight else None
+            else:
+                # 断线时放回发件箱，重连后重新发送
+                self.pending[kind] = (op, value)
+                self.inflight = None
+
+        if not client or not self.pending:
+            return None
+        for kind in self.KINDS:
+            if kind in self.pending:
+                op, value = self.pending.pop(kind)
+                self.seq = ac_protocol.next_seq(self.seq)
+                self._send(network_manager, kind, op, value, self.seq, 0)
+                break
+        return self.ack_timeout_ms if self.inflight else None
+
+    def _send(self, network_manager, kind, op, value, seq, retries):
+        if MQTT_BINARY_PROTOCOL:
+            payload = ac_protocol.encode_into(self._frame, ac_protocol.MSG_COMMAND,
+                                              ac_protocol.NODE_PANEL, seq, op, value)
+        else:
+            payload = ac_protocol.to_legacy(ac_protocol.MSG_COMMAND, op, value)
+        try:
+            network_manager.mqtt_client.publish(MQTT_TOPIC, payload)
+        except Exception as e:
+            print("发送指令失败:", str(e))
+            # 放回发件箱，等待重连
+            if kind not in self.pending:
+                self.pending[kind] = (op, value)
+            self.inflight = None
+            network_manager.drop_mqtt()
+            return
+        self.inflight = [kind, op, value, seq, ticks_ms(), retries]
+        self.stats["sent"] += 1
+        print("已发送指令:", kind, value if kind == "temp" else op, "seq", seq)
+
+command_outbox = CommandOutbox()  # 全局指令发件箱
+
+# ------------------------------ 界面更新层 ------------------------------
+class UIUpdater:
+    """
+    界面更新层
+    - 缓存每个控件最后一次渲染的文本和颜色，内容没变时不调用LVGL，避免无效的重绘和SPI传输
+    - 同一帧内对同一控件的多次更新合并，由界面任务统一提交
+    - 统计请求次数、跳过次数和每秒重绘次数
+    """
+
+    def __init__(self):
+        self._rendered = {}   # (控件id, 属性) -> 已渲染的值
+        self._pending = {}    # (控件id, 属性) -> (控件, 属性, 值)
+        self.message_since = None  # 最早一条等待提交的MQTT消息的接收时间，提交时记录延迟
+        self.stats = {"requested": 0, "skipped": 0, "redraws": 0, "redraws_per_sec": 0}
+        self._window_start = ticks_ms()
+        self._window_redraws = 0
+
+    def set_text(self, widget, text):
+        self._queue(widget, "text", text)
+
+    def set_text_color(self, widget, color):
+        """color为0xRRGGBB整数"""
+        self._queue(widget, "color", color)
+
+    def get_text(self, widget):
+        """返回控件的文本（包括尚未提交的更新）"""
+        key = (id(widget), "text")
+        if key in self._pending:
+            return self._pending[key][2]
+        return self._rendered.get(key, "")
+
+    def _queue(self, widget, attr, value):
+        self.stats["requested"] += 1
+        key = (id(widget), attr)
+        if key not in self._pending and self._rendered.get(key) == value:
+            self.stats["skipped"] += 1
+            return
+        self._pending[key] = (widget, attr, value)
+        ui_event.set()
+
+    def has_pending(self):
+        return bool(self._pending)
+
+    def commit(self):
+        """把合并后的更新提交给LVGL"""
+        if self._pending:
+            pending = self._pending
+            self._pending = {}
+            for key, (widget, attr, value) in pending.items():
+                if self._rendered.get(key) == value:
+                    # 同一帧内改了又改回原值
+                    self.stats["skipped"] += 1
+                    continue
+                if attr == "text":
+                    widget.set_text(value)
+                else:
+                    widget.set_style_text_color(lv.color_hex(value), 0)
+                self._rendered[key] = value
+                self.stats["redraws"] += 1
+                self._window_redraws += 1
+        if self.message_since is not None:
+            record_mqtt_latency(self.message_since)
+            self.message_since = None
+
+        # 每秒统计一次重绘次数
+        elapsed = ticks_diff(ticks_ms(), self._window_start)
+        if elapsed >= 1000:
+            self.stats["redraws_per_sec"] = self._window_redraws * 1000 // elapsed
+            self._window_start = ticks_ms()
+            self._window_redraws = 0
+
+ui_updater = UIUpdater()  # 全局界面更新层
 
 # ------------------------------ 状态栏类 ------------------------------
 class StatusBar:
@@ -50,7 +346,7 @@ class StatusBar:
         self.status_label = lv.label(self.container)
         self.status_label.set_style_text_color(lv.color_hex(0xFFFFFF), 0)  # 白色文字
         self.status_label.align(lv.ALIGN.CENTER, 0, 0)
-        self.status_label.set_text("Initializing...")
+        ui_updater.set_text(self.status_label, "Initializing...")
         
         # 创建时间更新定时器
         self.time_timer = lv.timer_create(self.timer_cb, 1000, None)  # 每秒更新一次
@@ -60,10 +356,13 @@ class StatusBar:
         self.update_time()
     
     def update_time(self):
-        # 获取当前时间并格式化
+        # 获取当前时间并格式化，内容未变化时不会重绘
         current_time = time.localtime()
-        time_str = "{:02d}:{:02d}:{:02d}".format(current_time[3], current_time[4], current_time[5])
-        self.time_label.set_text(time_str)
+        if STATUS_BAR_SHOW_SECONDS:
+            time_str = "{:02d}:{:02d}:{:02d}".format(current_time[3], current_time[4], current_time[5])
+        else:
+            time_str = "{:02d}:{:02d}".format(current_time[3], current_time[4])
+        ui_updater.set_text(self.time_label, time_str)
     
     def update_signal(self, rssi):
         # 更新信号强度显示
@@ -73,11 +372,13 @@ class StatusBar:
             signal_text = "Signal: Medium"
         else:
             signal_text = "Signal: Weak"
-        self.signal_label.set_text(signal_text)
+        ui_updater.set_text(self.signal_label, signal_text)
+        # 信号弱时用橙色提示
+        ui_updater.set_text_color(self.signal_label, 0xFFA500 if rssi < -65 else 0xFFFFFF)
     
     def set_status(self, text):
-        # 直接设置状态文本
-        self.status_label.set_text(text)
+        # 设置状态文本（与当前显示相同时跳过）
+        ui_updater.set_text(self.status_label, text)
 
 # ------------------------------ 主界面类 ------------------------------
 class MainScreen:
@@ -158,6 +459,8 @@ class ControlPanel:
         self.power_time_label.align_to(self.power_label, lv.ALIGN.OUT_RIGHT_MID, 10, 0)
         self.power_time_label.add_flag(lv.obj.FLAG.HIDDEN)  # 初始状态隐藏
         
+        self.last_elapsed = -1  # 上次显示的开机时长（秒）
+        
         # 创建开机时间更新定时器
         self.power_timer = lv.timer_create(self.update_power_time, 1000, None)  # 每秒更新一次
         
@@ -219,10 +522,16 @@ class ControlPanel:
         if not is_power_on:
             # 初始状态为关闭时，隐藏温度控制容器
             self.temp_cont.add_flag(lv.obj.FLAG.HIDDEN)
+
+        # 发件箱确认或放弃指令时显示结果
+        command_outbox.on_result = self.show_command_result
+        # 最近一次触摸操作的时间，用户正在操作时不做阻塞的漫游扫描
+        self.last_input_ms = ticks_ms()
         
     def on_power_clicked(self, evt):
         # 声明使用全局变量
         global is_power_on, mqtt_client, power_on_time
+        self.last_input_ms = ticks_ms()
         
         # 获取触发事件的按钮对象
         btn = evt.get_target()
@@ -280,21 +589,14 @@ class ControlPanel:
                 # 启动动画
                 lv.anim_t.start(anim)
             
-            # 尝试发送MQTT消息
-            if mqtt_client:
-                try:
-                    # 根据开关状态发送"on"或"off"
-                    message = b"on" if is_power_on else b"off"
-                    mqtt_client.publish(MQTT_TOPIC, message)
-                    # 显示发送状态
-                    self.show_status("Sent: " + message.decode())
-                except Exception as e:
-                    # 如果发送失败，显示错误
-                    self.show_status("Send failed")
+            # 根据开关状态发送开机或关机指令，由发件箱负责发送和确认，确认后再显示 Sent
+            command_outbox.put("power", ac_protocol.OP_ON if is_power_on else ac_protocol.OP_OFF)
+            self.show_status("Queued: " + ("on" if is_power_on else "off"))
     
     def on_temp_changed(self, evt):
         # 声明使用全局变量
         global current_temp
+        self.last_input_ms = ticks_ms()
         
         # 获取触发事件的滑块对象
         slider = evt.get_target()
@@ -303,36 +605,26 @@ class ControlPanel:
         if evt.get_code() == lv.EVENT.VALUE_CHANGED:
             # 更新当前温度值
             current_temp = slider.get_value()
-            # 更新温度显示标签
-            self.temp_label.set_text(f"{current_temp}°C")
+            # 更新温度显示标签（拖动滑块时同一帧内的多次更新会合并）
+            ui_updater.set_text(self.temp_label, f"{current_temp}°C")
     
     def on_set_temp_clicked(self, evt):
         # 声明使用全局变量
-        global current_temp, mqtt_client, is_power_on
+        global current_temp, is_power_on
+        self.last_input_ms = ticks_ms()
         
         # 检查是否是点击事件
         if evt.get_code() == lv.EVENT.CLICKED:
-            # 尝试发送MQTT消息
-            if mqtt_client:
-                try:
-                    # 只有在开机状态下才发送温度设置命令
-                    if is_power_on:
-                        # 发送温度设置命令
-                        message = f"set {current_temp}".encode()
-                        mqtt_client.publish(MQTT_TOPIC, message)
-                        self.show_status(f"Sent: set {current_temp}")
-                        
-                        # 禁用按钮3秒
-                        self.set_temp_btn.add_state(lv.STATE.DISABLED)  # 禁用按钮
-                        
-                        # 创建定时器，3秒后恢复按钮状态
-                        def enable_button(timer):
-                            self.set_temp_btn.clear_state(lv.STATE.DISABLED)  # 恢复按钮状态
-                        
-                        # 使用定时器延迟恢复按钮状态
-                        lv.timer_create(enable_button, 3000, None)  # 3000ms后执行
-                except Exception as e:
-                    self.show_status("Send failed")
+            # 只有在开机状态下才发送温度设置命令
+            if is_power_on:
+                # 加入发件箱，连续点击只发送最后一次设置的温度
+                command_outbox.put("temp", ac_protocol.OP_TEMP, current_temp)
+                self.show_status(f"Queued: set {current_temp}")
+
+    def show_command_result(self, kind, op, value, acked):
+        """发件箱确认或放弃一条指令时显示结果"""
+        text = f"set {value}" if kind == "temp" else ("on" if op == ac_protocol.OP_ON else "off")
+        self.show_status(("Sent: " if acked else "No ack: ") + text)
     
     def update_power_time(self, timer):
         global is_power_on, power_on_time
@@ -341,6 +633,10 @@ class ControlPanel:
         if is_power_on:
             # 计算已开机时间（秒）
             elapsed = int(time.time() - power_on_time)
+            # 秒数没变时不重新格式化
+            if elapsed == self.last_elapsed:
+                return
+            self.last_elapsed = elapsed
             
             # 转换为时:分:秒格式
             hours = elapsed // 3600
@@ -353,8 +649,15 @@ class ControlPanel:
             else:
                 time_text = "{:02d}:{:02d}".format(minutes, seconds)
                 
-            self.power_time_label.set_text(time_text)
+            ui_updater.set_text(self.power_time_label, time_text)
     
+    def set_temperature(self, temp):
+        # 远程设置温度时同步滑块和温度标签
+        global current_temp
+        current_temp = temp
+        self.temp_slider.set_value(temp, lv.ANIM.OFF)
+        ui_updater.set_text(self.temp_label, f"{temp}°C")
+
     def set_power_state(self, state):
         global power_on_time
         
@@ -362,6 +665,7 @@ class ControlPanel:
             self.power_btn.add_state(lv.STATE.CHECKED)
             # 记录开机时间
             power_on_time = time.time()
+            self.last_elapsed = -1
             # 显示开机时间标签
             self.power_time_label.clear_flag(lv.obj.FLAG.HIDDEN)
             self.update_power_time(None)  # 立即更新显示
@@ -378,7 +682,9 @@ class ControlPanel:
     
     def show_status(self, text):
         # 显示状态文本
-        self.status_label.set_text(text)
+        ui_updater.set_text(self.status_label, text)
+        # 唤醒界面任务处理淡出
+        ui_event.set()
         
         # 先设置透明度为0，避免闪烁
         self.status_label.set_style_text_opa(lv.OPA._0, 0)
@@ -404,7 +710,7 @@ class ControlPanel:
     
     def check_status_timeout(self):
         # 检查是否需要清除状态显示
-        if self.status_label.get_text() != "":  # 如果状态标签有文本
+        if ui_updater.get_text(self.status_label) != "":  # 如果状态标签有文本
             if time.time() - self.last_status_time > 3:  # 3秒后开始淡出
                 # 防止重复触发动画
                 if self.last_status_time == 0:
@@ -424,7 +730,7 @@ class ControlPanel:
                 
                 # 设置动画结束回调
                 def anim_ready_cb(anim):
-                    self.status_label.set_text("")  # 动画完成后清空文本
+                    ui_updater.set_text(self.status_label, "")  # 动画完成后清空文本
                 
                 # 设置回调函数
                 anim_out.set_custom_exec_cb(lambda a, val: cb_set_opacity(self.status_label, val))
@@ -436,44 +742,124 @@ class ControlPanel:
 
 # ------------------------------ 网络管理器类 ------------------------------
 class NetworkManager:
-    def __init__(self, status_bar):
-        # 保存状态栏引用
+    def __init__(self, status_bar, control_panel=None):
+        # 保存状态栏和控制面板引用
         self.status_bar = status_bar
+        self.control_panel = control_panel
         self.wlan = network.WLAN(network.STA_IF)
         self.mqtt_client = None
         self.connected_ssid = None  # 记录已连接的SSID
         self.connection_attempts = 0  # 连接尝试次数
         self.last_connection_time = 0  # 上次连接尝试时间
-    
-    def connect_wifi(self):
-        # 记录当前时间
-        current_time = time.time()
-        
-        # 如果短时间内尝试次数过多，延迟重试
-        if self.connection_attempts > 5 and current_time - self.last_connection_time < 60:
-            if self.status_bar:
-                self.status_bar.set_status("WiFi retry in 60s...")
+        self.wifi_cache = load_wifi_cache()  # 上次成功连接的接入点
+        self.last_reconnect_ms = None  # 最近一次连接耗时
+        self.last_roam_scan = None  # 上次漫游扫描时间
+        self.seq_filter = ac_protocol.SeqFilter()  # 按发送方去重收到的指令
+
+    async def _wait_connected(self, ssid, timeout_ms):
+        """等待连接建立或超时，等待期间让出CPU给界面任务"""
+        start = ticks_ms()
+        last_shown = -1
+        while True:
+            if self.wlan.isconnected():
+                return True
+            elapsed = ticks_diff(ticks_ms(), start)
+            if elapsed >= timeout_ms:
+                return False
+            remaining = (timeout_ms - elapsed) // 1000
+            if self.status_bar and remaining != last_shown:
+                self.status_bar.set_status(f"Connecting to {ssid}... {remaining}s")
+                last_shown = remaining
+            await sleep_ms(WIFI_POLL_INTERVAL_MS)
+
+    def _on_wifi_connected(self, ssid, bssid=None, channel=None, rssi=None):
+        """连接成功后更新状态并写入缓存"""
+        global wifi_connected
+
+        # 获取IP地址
+        ip = self.wlan.ifconfig()[0]
+        print(f"已连接到 {ssid}, IP: {ip}")
+
+        # 更新全局WiFi连接状态
+        wifi_connected = True
+        self.connected_ssid = ssid
+
+        # 重置连接尝试计数
+        self.connection_attempts = 0
+
+        if rssi is None:
+            try:
+                rssi = self.wlan.status('rssi')
+            except Exception:
+                rssi = -100
+
+        if self.status_bar:
+            self.status_bar.set_status(f"Connected: {ssid}")
+            # 更新信号强度显示
+            self.status_bar.update_signal(rssi)
+
+        # 记住这次连接的接入点，下次先直接连接
+        if bssid is not None:
+            self.wifi_cache["bssid"] = bssid
+            self.wifi_cache["channel"] = channel
+        elif self.wifi_cache.get("ssid") != ssid:
+            self.wifi_cache.pop("bssid", None)
+            self.wifi_cache.pop("channel", None)
+        self.wifi_cache["ssid"] = ssid
+        self.wifi_cache["rssi"] = rssi
+        save_wifi_cache(self.wifi_cache)
+
+    async def _fast_connect(self):
+        """
+        快速重连：直接连接上次成功的SSID/BSSID，不扫描；
+        BSSID失效（接入点更换）时只按SSID连接，由驱动在后台寻找接入点，等待期间界面照常响应
+        都失败时返回False，由调用者回退到阻塞的扫描
+        """
+        ssid = self.wifi_cache.get("ssid")
+        password = WIFI_PASSWORDS.get(ssid)
+        if not ssid or password is None:
             return False
-        
-        # 更新连接尝试记录
-        self.connection_attempts += 1
-        self.last_connection_time = current_time
-        
-        # 确保WiFi接口已激活
-        if not self.wlan.active():
-            self.wlan.active(True)
-            time.sleep(1)  # 等待接口激活
-        
-        # 如果已连接，先断开
-        if self.wlan.isconnected():
-            self.wlan.disconnect()
-            time.sleep(1)  # 等待断开连接
-        
-        # 更新状态栏
+
+        bssid = self.wifi_cache.get("bssid")
+        if bssid:
+            print(f"快速重连 {ssid} (BSSID: {bssid})")
+            if await self._try_connect(ssid, password, bssid, WIFI_FAST_CONNECT_TIMEOUT_MS):
+                self._on_wifi_connected(ssid, bssid, self.wifi_cache.get("channel"))
+                return True
+            print(f"快速重连 {ssid} 超时，按SSID重新连接")
+
+        if await self._try_connect(ssid, password, None, WIFI_SSID_CONNECT_TIMEOUT_MS):
+            self._on_wifi_connected(ssid)
+            return True
+        print(f"连接 {ssid} 超时，回退到扫描")
+        return False
+
+    async def _try_connect(self, ssid, password, bssid, timeout_ms):
+        """发起连接（立即返回）并轮询等待，失败时断开"""
         if self.status_bar:
-            self.status_bar.set_status("Scanning WiFi...")
-        
-        # 扫描可用网络
+            self.status_bar.set_status(f"Connecting to {ssid}...")
+        try:
+            if bssid:
+                self.wlan.connect(ssid, password, bssid=unhexlify(bssid))
+            else:
+                self.wlan.connect(ssid, password)
+        except Exception as e:
+            print(f"连接 {ssid} 失败: {str(e)}")
+            return False
+
+        if await self._wait_connected(ssid, timeout_ms):
+            return True
+        try:
+            self.wlan.disconnect()
+        except:
+            pass
+        return False
+
+    def _scan(self):
+        """
+        扫描已配置的网络，按信号强度从高到低返回
+        [{"ssid", "password", "bssid", "channel", "rssi"}, ...]
+        """
         try:
             networks = self.wlan.scan()
             print(f"扫描到 {len(networks)} 个WiFi网络")
@@ -482,88 +868,116 @@ class NetworkManager:
             if self.status_bar:
                 self.status_bar.set_status("WiFi scan failed")
             networks = []
-        
-        # 创建SSID到信号强度的映射
-        available_networks = {}
+
+        # 同一SSID有多个接入点时保留信号最强的
+        candidates = {}
         for net in networks:
             try:
                 ssid = net[0].decode('utf-8')
                 rssi = net[3]
-                available_networks[ssid] = rssi
                 print(f"找到网络: {ssid}, 信号强度: {rssi} dBm")
             except:
-                pass  # 忽略无法解码的SSID
-        
-        # 按信号强度排序我们的配置网络
-        sorted_configs = []
-        for config in WIFI_CONFIGS:
-            ssid = config["ssid"]
-            if ssid in available_networks:
-                sorted_configs.append({
+                continue  # 忽略无法解码的SSID
+            if ssid not in WIFI_PASSWORDS:
+                continue
+            if ssid not in candidates or rssi > candidates[ssid]["rssi"]:
+                candidates[ssid] = {
                     "ssid": ssid,
-                    "password": config["password"],
-                    "rssi": available_networks[ssid]
-                })
-        
+                    "password": WIFI_PASSWORDS[ssid],
+                    "bssid": hexlify(net[1]).decode(),
+                    "channel": net[2],
+                    "rssi": rssi
+                }
+
+        # 按信号强度从高到低排序
+        sorted_configs = list(candidates.values())
+        sorted_configs.sort(key=lambda x: x["rssi"], reverse=True)
+        return sorted_configs
+
+    async def connect_wifi(self):
+        global wifi_connected
+
+        # 已经连接时不再断开重连
+        if self.wlan.isconnected():
+            wifi_connected = True
+            return True
+
+        # 记录当前时间
+        current_time = time.time()
+        start = ticks_ms()
+
+        # 如果短时间内尝试次数过多，延迟重试
+        if self.connection_attempts > 5 and current_time - self.last_connection_time < 60:
+            if self.status_bar:
+                self.status_bar.set_status("WiFi retry in 60s...")
+            return False
+
+        # 更新连接尝试记录
+        self.connection_attempts += 1
+        self.last_connection_time = current_time
+
+        # 确保WiFi接口已激活
+        if not self.wlan.active():
+            self.wlan.active(True)
+            await sleep_ms(100)  # 等待接口激活
+
+        # 先尝试直接连接上次成功的接入点
+        if await self._fast_connect():
+            self.last_reconnect_ms = ticks_diff(ticks_ms(), start)
+            print(f"WiFi重连耗时: {self.last_reconnect_ms}ms（快速重连）")
+            return True
+
+        # 缓存的SSID也连不上（网络不存在或从未连接过）才扫描；
+        # MicroPython的 wlan.scan() 没有异步版本，扫描期间（约2.5秒）界面无法响应
+        if self.status_bar:
+            self.status_bar.set_status("Scanning WiFi...")
+        # 让出一次，先把状态显示出来再开始阻塞的扫描
+        await sleep_ms(0)
+
+        sorted_configs = self._scan()
+        if sorted_configs:
+            # 记录信号强度排序，扫描失败时按此顺序直接尝试
+            self.wifi_cache["order"] = [config["ssid"] for config in sorted_configs]
+        else:
+            sorted_configs = [
+                {"ssid": ssid, "password": WIFI_PASSWORDS[ssid], "bssid": None, "channel": None, "rssi": -100}
+                for ssid in self.wifi_cache.get("order", []) if ssid in WIFI_PASSWORDS
+            ]
+
         # 如果没有找到任何已知网络
         if not sorted_configs:
             print("未找到任何已配置的WiFi网络")
+            wifi_connected = False
             if self.status_bar:
                 self.status_bar.set_status("No known WiFi found")
             return False
-        
-        # 按信号强度从高到低排序
-        sorted_configs.sort(key=lambda x: x["rssi"], reverse=True)
-        
+
         # 尝试连接信号最强的网络
-        connected = False
         for config in sorted_configs:
             ssid = config["ssid"]
-            password = config["password"]
             rssi = config["rssi"]
-            
+
             if self.status_bar:
                 self.status_bar.set_status(f"Connecting to {ssid}...")
-            
+
             print(f"尝试连接到 {ssid} (信号强度: {rssi} dBm)")
             try:
                 # 连接WiFi
-                self.wlan.connect(ssid, password)
-                
-                # 等待连接或超时
-                max_wait = 15  # 增加等待时间
-                while max_wait > 0:
-                    if self.wlan.isconnected():
-                        connected = True
-                        self.connected_ssid = ssid
-                        break
-                    max_wait -= 1
-                    if self.status_bar:
-                        self.status_bar.set_status(f"Connecting to {ssid}... {max_wait}s")
-                    time.sleep(1)
-                
-                if connected:
-                    # 获取IP地址
-                    ip = self.wlan.ifconfig()[0]
-                    print(f"已连接到 {ssid}, IP: {ip}")
-                    
-                    # 更新全局WiFi连接状态
-                    global wifi_connected
-                    wifi_connected = True
-                    
-                    # 重置连接尝试计数
-                    self.connection_attempts = 0
-                    
-                    if self.status_bar:
-                        self.status_bar.set_status(f"Connected: {ssid}")
-                        # 更新信号强度显示
-                        self.status_bar.update_signal(rssi)
-                    break
+                if config["bssid"]:
+                    self.wlan.connect(ssid, config["password"], bssid=unhexlify(config["bssid"]))
                 else:
-                    print(f"连接到 {ssid} 超时")
-                    # 确保断开连接
-                    self.wlan.disconnect()
-                    time.sleep(1)
+                    self.wlan.connect(ssid, config["password"])
+
+                if await self._wait_connected(ssid, WIFI_CONNECT_TIMEOUT_MS):
+                    self._on_wifi_connected(ssid, config["bssid"], config["channel"], None if config["bssid"] is None else rssi)
+                    self.last_reconnect_ms = ticks_diff(ticks_ms(), start)
+                    print(f"WiFi重连耗时: {self.last_reconnect_ms}ms（扫描）")
+                    return True
+
+                print(f"连接到 {ssid} 超时")
+                # 确保断开连接
+                self.wlan.disconnect()
+                await sleep_ms(1000)
             except Exception as e:
                 print(f"连接到 {ssid} 失败: {str(e)}")
                 # 确保断开连接
@@ -571,25 +985,56 @@ class NetworkManager:
                     self.wlan.disconnect()
                 except:
                     pass
-                time.sleep(1)
-        
+                await sleep_ms(1000)
+
         # 如果所有网络都连接失败
-        if not connected:
-            print("无法连接到任何已知网络")
-            # 更新全局WiFi连接状态
-            global wifi_connected
-            wifi_connected = False
-            if self.status_bar:
-                self.status_bar.set_status("No WiFi Connection")
-        
-        return connected
-    
+        print("无法连接到任何已知网络")
+        # 更新全局WiFi连接状态
+        wifi_connected = False
+        if self.status_bar:
+            self.status_bar.set_status("No WiFi Connection")
+        return False
+
+    async def check_roaming(self, current_rssi):
+        """
+        信号较弱时在后台检查是否有更好的接入点
+        MicroPython的扫描本身是阻塞的，因此限制扫描频率，只在信号弱、并且用户一段时间没有操作时扫描
+        """
+        if current_rssi >= WIFI_ROAM_RSSI_THRESHOLD:
+            return
+        now = ticks_ms()
+        if self.last_roam_scan is not None and ticks_diff(now, self.last_roam_scan) < WIFI_ROAM_SCAN_INTERVAL_MS:
+            return
+        if self.control_panel and ticks_diff(now, self.control_panel.last_input_ms) < WIFI_ROAM_IDLE_MS:
+            return
+        self.last_roam_scan = now
+
+        await sleep_ms(0)
+        candidates = self._scan()
+        if not candidates:
+            return
+        best = candidates[0]
+        current_bssid = self.wifi_cache.get("bssid")
+        if best["bssid"] == current_bssid or best["rssi"] < current_rssi + WIFI_ROAM_HYSTERESIS_DB:
+            return
+
+        print(f"切换到信号更强的接入点 {best['ssid']} ({best['rssi']} dBm)")
+        self.wifi_cache.update({
+            "ssid": best["ssid"],
+            "bssid": best["bssid"],
+            "channel": best["channel"],
+            "order": [config["ssid"] for config in candidates]
+        })
+        self.wlan.disconnect()
+        if not await self._fast_connect():
+            await self.connect_wifi()
+
     def connect_mqtt(self):
         global mqtt_client
         if not wifi_connected:
             self.status_bar.set_status("No WiFi Connection")
             return False
-            
+
         try:
             # 如果已经有连接，先断开
             if self.mqtt_client:
@@ -597,11 +1042,11 @@ class NetworkManager:
                     self.mqtt_client.disconnect()
                 except:
                     pass
-                
+
             # 创建新的MQTT客户端
-            client_id = f'esp32_lvgl_{time.ticks_ms()}'
+            client_id = f'esp32_lvgl_{ticks_ms()}'
             self.status_bar.set_status("Connecting MQTT...")
-            
+
             # 创建MQTT客户端实例，增加keepalive时间
             self.mqtt_client = MQTTClient(
                 client_id=client_id,
@@ -609,75 +1054,127 @@ class NetworkManager:
                 port=1883,
                 keepalive=120  # 增加到120秒
             )
-            
+
             # 设置回调并连接
             self.mqtt_client.set_callback(self.on_mqtt_message)
             self.mqtt_client.connect()
-            time.sleep(0.1)
-            
+
             # 订阅主题
             self.mqtt_client.subscribe(MQTT_TOPIC)
+            if MQTT_STATUS_TOPIC:
+                self.mqtt_client.subscribe(MQTT_STATUS_TOPIC)
             mqtt_client = self.mqtt_client
-            
+            mqtt_ready.set()
+            # 重连后发送断线期间积压的指令
+            outbox_event.set()
+
             # 发送上线消息
             self.mqtt_client.publish(MQTT_TOPIC, b"device online")
-            
+
             self.status_bar.set_status("MQTT Connected")
             return True
-            
+
         except Exception as e:
             print(f"MQTT Error: {str(e)}")
             self.mqtt_client = None
             mqtt_client = None
             self.status_bar.set_status("MQTT Failed")
             return False
-    
+
+    def drop_mqtt(self):
+        """MQTT连接异常时清除客户端"""
+        global mqtt_client
+        if self.mqtt_client:
+            try:
+                self.mqtt_client.sock.close()
+            except:
+                pass
+        self.mqtt_client = None
+        mqtt_client = None
+        mqtt_ready.clear()
+        self.status_bar.set_status("MQTT Connection Lost")
+
     def on_mqtt_message(self, topic, msg):
         global is_power_on
+        mqtt_stats["messages"] += 1
         try:
-            if topic == MQTT_TOPIC:
-                message = msg.decode().lower()  # 转换为小写
-                if message == "on" and not is_power_on:
+            if topic != MQTT_TOPIC and topic != MQTT_STATUS_TOPIC:
+                return
+            # 二进制帧和旧格式文本统一解码为 (类型, 节点, 序号, 操作, 值)
+            message = ac_protocol.decode_any(msg)
+            if message is None:
+                return
+            msg_type, node, seq, op, value = message
+            if node == ac_protocol.NODE_PANEL:
+                return  # 自己发出的消息
+            if topic == MQTT_STATUS_TOPIC:
+                # 红外发射端的状态只用于确认指令
+                if msg_type == ac_protocol.MSG_STATE:
+                    command_outbox.ack(seq, op, value)
+                return
+
+            if msg_type == ac_protocol.MSG_STATE:
+                # 确认发件箱中的在途指令
+                command_outbox.ack(seq, op, value)
+                return
+
+            # 重复的指令（重发）只回复状态，不重复执行
+            changed = False
+            if self.seq_filter.accept(node, seq):
+                if op == ac_protocol.OP_ON and not is_power_on:
                     is_power_on = True
                     self.control_panel.set_power_state(True)
-                    self.mqtt_client.publish(MQTT_TOPIC, b"ONON")
-                elif message == "off" and is_power_on:
+                    changed = True
+                elif op == ac_protocol.OP_OFF and is_power_on:
                     is_power_on = False
                     self.control_panel.set_power_state(False)
-                    self.mqtt_client.publish(MQTT_TOPIC, b"OFFOFF")
+                    changed = True
+                elif op == ac_protocol.OP_TEMP and 16 <= value <= 30:
+                    self.control_panel.set_temperature(value)
+            else:
+                mqtt_stats["duplicates"] += 1
+
+            power = ac_protocol.OP_ON if is_power_on else ac_protocol.OP_OFF
+            if seq is not None:
+                self.mqtt_client.publish(MQTT_TOPIC, ac_protocol.encode(
+                    ac_protocol.MSG_STATE, ac_protocol.NODE_PANEL, seq, power, current_temp))
+            elif changed:
+                # 旧格式指令用ONON/OFFOFF回复
+                self.mqtt_client.publish(MQTT_TOPIC, ac_protocol.to_legacy(ac_protocol.MSG_STATE, power))
         except Exception as e:
             print("MQTT Message Error:", str(e))
-    
-    def check_connections(self):
+
+    async def check_connections(self):
+        global wifi_connected
+
         # 检查WiFi连接
         if not self.wlan.isconnected():
             # 如果WiFi断开，尝试重新连接
             if self.status_bar:
                 self.status_bar.set_status("WiFi Reconnecting...")
-            
+
             # 更新全局WiFi连接状态
-            global wifi_connected
             wifi_connected = False
-            
+
+            # 链路断开后原来的TCP连接已经失效，清除MQTT客户端，不必等到心跳失败
+            if self.mqtt_client:
+                self.drop_mqtt()
+
             # 尝试重新连接WiFi
-            wifi_connected = self.connect_wifi()
-            
-            # 如果WiFi重新连接成功，尝试重新连接MQTT
-            if wifi_connected and not self.mqtt_client:
+            wifi_connected = await self.connect_wifi()
+
+            # 如果WiFi重新连接成功，重新连接MQTT
+            if wifi_connected:
                 self.connect_mqtt()
-            elif not wifi_connected:
-                # 清除MQTT客户端
-                self.mqtt_client = None
         else:
             # 更新全局WiFi连接状态
-            global wifi_connected
             wifi_connected = True
-            
+
             # WiFi已连接，检查信号强度
             try:
                 # 获取当前连接的信号强度
                 current_rssi = self.wlan.status('rssi')
-                
+
                 # 更新状态栏信号强度显示
                 if self.status_bar:
                     # 确保状态栏显示连接状态
@@ -687,15 +1184,151 @@ class NetworkManager:
                         self.status_bar.set_status("WiFi Connected")
                     # 更新信号强度
                     self.status_bar.update_signal(current_rssi)
-                
+
                 # 检查MQTT连接
                 if not self.mqtt_client:
                     self.connect_mqtt()
+
+                # 信号弱时检查是否需要漫游
+                await self.check_roaming(current_rssi)
             except Exception as e:
                 print("获取WiFi状态失败:", str(e))
-                
+
+# ------------------------------ 协程任务 ------------------------------
+async def wifi_task(network_manager):
+    """Wi-Fi连接任务：启动时连接（最多重试3次），之后定期检查连接"""
+    global wifi_connected
+
+    retry_count = 0
+    while not wifi_connected and retry_count < 3:
+        wifi_connected = await network_manager.connect_wifi()
+        if not wifi_connected:
+            retry_count += 1
+            await sleep_ms(2000)  # 短暂延时后重试
+
+    # 如果WiFi连接成功，尝试连接MQTT
+    if wifi_connected:
+        network_manager.connect_mqtt()
+
+    # 每秒检测一次断线（isconnected开销很小），信号和MQTT每5秒检查一次
+    last_check = ticks_ms()
+    while True:
+        await sleep_ms(WIFI_LINK_CHECK_INTERVAL_MS)
+        task_wakeups["wifi"] += 1
+        if network_manager.wlan.isconnected() and ticks_diff(ticks_ms(), last_check) < WIFI_CHECK_INTERVAL_MS:
+            continue
+        await network_manager.check_connections()
+        last_check = ticks_ms()
+
+async def mqtt_task(network_manager):
+    """
+    MQTT接收任务：在socket上等待可读后立即处理消息，
+    没有消息时任务一直挂起，不再每100ms轮询一次
+    """
+    while True:
+        client = network_manager.mqtt_client
+        if not client:
+            # 等待连接建立
+            mqtt_ready.clear()
+            await mqtt_ready.wait()
+            continue
+
+        await wait_readable(client.sock)
+        task_wakeups["mqtt"] += 1
+        if client is not network_manager.mqtt_client:
+            # 等待期间客户端已被替换
+            continue
+
+        start = ticks_ms()
+        try:
+            # socket可读时读取并分发一条消息；读到-1表示连接已被服务器关闭
+            client.check_msg()
+        except Exception as e:
+            print("MQTT接收失败:", str(e))
+            network_manager.drop_mqtt()
+            continue
+        if not ui_updater.has_pending():
+            record_mqtt_latency(start)
+        elif ui_updater.message_since is None:
+            # 界面更新由界面任务在下一次提交时完成，延迟记到那时
+            ui_updater.message_since = start
+
+async def mqtt_ping_task(network_manager):
+    """MQTT心跳任务：每60秒发送一次ping，保持连接活跃"""
+    while True:
+        await sleep_ms(MQTT_PING_INTERVAL_MS)
+        task_wakeups["ping"] += 1
+        client = network_manager.mqtt_client
+        if client:
+            try:
+                client.ping()
+            except:
+                # 如果ping失败，重置MQTT客户端
+                network_manager.drop_mqtt()
+
+async def outbox_task(network_manager):
+    """发件箱任务：有新指令、收到确认或MQTT重连时发送，等待确认超时后重发"""
+    while True:
+        task_wakeups["outbox"] += 1
+        delay = command_outbox.flush(network_manager)
+        outbox_event.clear()
+        if delay is None:
+            await outbox_event.wait()
+        else:
+            try:
+                await asyncio.wait_for(outbox_event.wait(), delay / 1000)
+            except asyncio.TimeoutError:
+                pass
+
+async def ui_task(control_panel):
+    """界面任务：提交合并后的界面更新，处理状态文本的淡出效果，没有界面工作时挂起等待唤醒"""
+    while True:
+        task_wakeups["ui"] += 1
+        ui_updater.commit()
+        control_panel.check_status_timeout()
+        if control_panel.last_status_time:
+            await sleep_ms(UI_TASK_INTERVAL_MS)
+        else:
+            ui_event.clear()
+            await ui_event.wait()
+
+def create_tasks(main_screen):
+    """
+    创建所有协程任务（需要在事件循环中调用），返回 (网络管理器, 任务列表)
+    在Linux上用桩模块测试时也从这里启动（见 simulation/panel_host.py）
+    """
+    control_panel = main_screen.control_panel
+    # 创建网络管理器实例，传入状态栏和控制面板引用
+    network_manager = NetworkManager(main_screen.status_bar, control_panel)
+
+    tasks = [
+        asyncio.create_task(ui_task(control_panel)),
+        asyncio.create_task(wifi_task(network_manager)),
+        asyncio.create_task(mqtt_task(network_manager)),
+        asyncio.create_task(mqtt_ping_task(network_manager)),
+        asyncio.create_task(outbox_task(network_manager)),
+    ]
+    return network_manager, tasks
+
+async def run(main_screen):
+    """创建并运行所有协程任务"""
+    _, tasks = create_tasks(main_screen)
+    await asyncio.gather(*tasks)
+
 # ------------------------------ 主程序 ------------------------------
-def main():
+def init_hardware():
+    # 硬件驱动只在设备上可用，放在这里导入，方便在Linux上用桩模块调试界面和网络逻辑
+    from espidf import VSPI_HOST
+    from ili9XXX import ili9488
+    from ft6x36 import ft6x36
+    from machine import Pin
+    import lv_utils
+
+    # 先创建异步事件循环，LVGL刷新作为协程按固定帧率运行，
+    # 显示驱动检测到事件循环已存在时不会再创建阻塞式的定时器循环
+    if not lv_utils.event_loop.is_running():
+        lv_utils.event_loop(freq=LVGL_REFRESH_HZ, asynchronous=True)
+
     # 初始化GPIO16引脚为输出模式
     p16 = Pin(16, Pin.OUT)
     # 设置GPIO16引脚为高电平，用于控制屏幕电源
@@ -720,7 +1353,8 @@ def main():
         invert=False,      # 不反转颜色
         double_buffer=True, # 使用双缓冲
         half_duplex=False, # 不使用半双工模式
-        rot=-2             # 屏幕旋转角度
+        rot=-2,            # 屏幕旋转角度
+        asynchronous=True  # 使用异步事件循环
     )
 
     # 初始化FT6X36触摸控制器
@@ -733,78 +1367,19 @@ def main():
         inv_y=False,       # Y轴不反转
         swap_xy=True       # 交换X和Y坐标
     )
+    return disp, touch
+
+def main():
+    # 初始化显示屏和触摸屏
+    init_hardware()
 
     # 创建主界面
     main_screen = MainScreen()
-    
-    # 创建网络管理器实例，传入状态栏引用
-    network_manager = NetworkManager(main_screen.status_bar)
-    
-    # 连接WiFi网络 - 增加重试逻辑
-    wifi_connected = False
-    retry_count = 0
-    
-    while not wifi_connected and retry_count < 3:
-        wifi_connected = network_manager.connect_wifi()
-        if not wifi_connected:
-            retry_count += 1
-            time.sleep(2)  # 短暂延时后重试
-    
-    # 如果WiFi连接成功，尝试连接MQTT
-    if wifi_connected:
-        network_manager.connect_mqtt()
 
-    # 初始化主循环计时器
-    last_wifi_check = 0    # 上次WiFi检查时间
-    last_mqtt_ping = 0     # 上次MQTT ping时间
-    
-    # 主循环
-    while True:
-        # 短暂延时，避免CPU占用过高
-        time.sleep(0.1)
-        
-        # 获取当前时间戳
-        current_time = time.time()
-        
-        # 每5秒检查一次WiFi和MQTT连接状态
-        if current_time - last_wifi_check > 5:
-            # 调用连接检查函数
-            network_manager.check_connections()
-            # 更新上次检查时间
-            last_wifi_check = current_time
-        
-        # 每60秒发送一次MQTT ping，保持连接活跃
-        if current_time - last_mqtt_ping > 60:
-            # 检查MQTT客户端是否存在
-            if network_manager.mqtt_client:
-                try:
-                    # 发送ping命令
-                    network_manager.mqtt_client.ping()
-                    # 更新上次ping时间
-                    last_mqtt_ping = current_time
-                except:
-                    # 如果ping失败，重置MQTT客户端
-                    network_manager.mqtt_client = None
-                    # 更新状态栏显示连接丢失信息
-                    network_manager.status_bar.set_status("MQTT Connection Lost")
-        
-        # 检查MQTT消息
-        if network_manager.mqtt_client:
-            try:
-                # 检查是否有新消息
-                network_manager.mqtt_client.check_msg()
-            except Exception as e:
-                # 忽略常见的-1错误（无消息可读）
-                if str(e) != "-1":
-                    # 其他错误则重置MQTT客户端
-                    network_manager.mqtt_client = None
-                    # 更新状态栏显示连接丢失信息
-                    network_manager.status_bar.set_status("MQTT Connection Lost")
-        
-        # 检查状态显示超时，处理状态文本的淡出效果
-        main_screen.control_panel.check_status_timeout()
+    # 运行协程调度器（Wi-Fi、MQTT和界面任务协作运行，网络重连不再冻结触摸屏）
+    asyncio.run(run(main_screen))
 
 # 程序入口点
 if __name__ == '__main__':
     # 调用主函数
-    main() 
\ No newline at end of file
+    main()
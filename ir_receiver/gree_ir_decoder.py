@@ -1,17 +1,147 @@
 import sys
 import re
+import json
+import os
+
+
+class TimingCalibrator:
+    """
+    红外接收器时序自动校准
+    不同接收器的解调器存在偏差，固定阈值容易导致解码失败。
+    这里对一批捕获数据的高/低电平做一维k-means聚类，
+    推导出每个接收器专属的时序阈值，并按接收器ID缓存。
+    """
+
+    # 默认聚类中心（微秒），与格力协议标称值一致
+    DEFAULT_SPACE_CENTERS = [540, 1600, 4500, 20000]  # 短低电平、长低电平、起始低电平、连接码
+
+    def __init__(self, tolerance=0.25, cache_file=None):
+        self.tolerance = tolerance        # 聚类中心两侧允许的相对偏差
+        self.cache_file = cache_file      # 校准结果持久化文件（可选）
+        self._cache = {}                  # 接收器ID -> 阈值字典
+        if cache_file and os.path.exists(cache_file):
+            self.load()
+
+    @staticmethod
+    def _kmeans_1d(values, centers, iterations=20):
+        """一维k-means，按初始中心顺序返回 [(中心, 成员列表), ...]，空聚类成员为空列表"""
+        centers = [float(c) for c in centers]
+        clusters = [[] for _ in centers]
+        for _ in range(iterations):
+            clusters = [[] for _ in centers]
+            for v in values:
+                # 找到最近的聚类中心
+                idx = min(range(len(centers)), key=lambda j: abs(v - centers[j]))
+                clusters[idx].append(v)
+            new_centers = [sum(c) / len(c) if c else centers[j] for j, c in enumerate(clusters)]
+            if new_centers == centers:
+                break
+            centers = new_centers
+        return list(zip(centers, clusters))
+
+    def _window(self, center, lower_neighbor=None, upper_neighbor=None):
+        """以聚类中心为基准计算阈值窗口，不越过相邻聚类的中点"""
+        low = center * (1 - self.tolerance)
+        high = center * (1 + self.tolerance)
+        if lower_neighbor is not None:
+            low = max(low, (center + lower_neighbor) / 2)
+        if upper_neighbor is not None:
+            high = min(high, (center + upper_neighbor) / 2)
+        return (int(low), int(high))
+
+    def calibrate(self, captures):
+        """根据一批原始捕获数据计算时序阈值"""
+        start_marks = []
+        marks = []
+        spaces = []
+        for raw_data in captures:
+            if len(raw_data) < 4:
+                continue
+            start_marks.append(abs(raw_data[0]))
+            # 起始低电平与其他低电平一起聚类，便于区分连接码
+            spaces.append(abs(raw_data[1]))
+            for i in range(2, len(raw_data) - 1, 2):
+                marks.append(abs(raw_data[i]))
+                spaces.append(abs(raw_data[i + 1]))
+
+        if not start_marks or not marks:
+            raise ValueError("没有可用于校准的捕获数据")
+
+        thresholds = {}
+
+        # 起始高电平：取所有捕获的平均值
+        start_center = sum(start_marks) / len(start_marks)
+        thresholds['start_mark'] = self._window(start_center)
+
+        # 数据位高电平只有一种宽度，直接取平均值
+        mark_center = sum(marks) / len(marks)
+        thresholds['short_mark'] = self._window(mark_center)
+
+        # 低电平聚类：短、长、起始、连接码（初始中心有序，聚类结果保持顺序）
+        clusters = self._kmeans_1d(spaces, self.DEFAULT_SPACE_CENTERS)
+        if not clusters[0][1] or not clusters[1][1]:
+            raise ValueError("低电平聚类失败，无法区分0和1")
+        present = [c for c, members in clusters if members]
+
+        # 没有样本的类型（如单块捕获中没有连接码）不输出阈值，沿用默认值
+        names = ['short_space', 'long_space', 'start_space', 'gap_space']
+        for name, (center, members) in zip(names, clusters):
+            if not members:
+                continue
+            idx = present.index(center)
+            lower = present[idx - 1] if idx > 0 else None
+            upper = present[idx + 1] if idx + 1 < len(present) else None
+            thresholds[name] = self._window(center, lower, upper)
+
+        return thresholds
+
+    def calibrate_receiver(self, receiver_id, captures):
+        """校准指定接收器并缓存结果"""
+        thresholds = self.calibrate(captures)
+        self.store(receiver_id, thresholds)
+        return thresholds
+
+    def store(self, receiver_id, thresholds):
+        """缓存接收器的阈值（配置了缓存文件时同时保存）"""
+        self._cache[receiver_id] = thresholds
+        if self.cache_file:
+            self.save()
+
+    def get(self, receiver_id):
+        """获取接收器的缓存阈值，不存在时返回None"""
+        return self._cache.get(receiver_id)
+
+    def load(self):
+        """从文件加载校准结果"""
+        with open(self.cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self._cache = {rid: {k: tuple(v) for k, v in t.items()} for rid, t in data.items()}
+
+    def save(self):
+        """保存校准结果到文件"""
+        with open(self.cache_file, 'w', encoding='utf-8') as f:
+            json.dump(self._cache, f, ensure_ascii=False, indent=2)
+
 
 class GreeIRDecoder:
-    def __init__(self):
+    MIN_BITS = 64  # 一次完整捕获至少包含的数据位（8字节，与 parse_protocol 的要求一致）
+
+    def __init__(self, verbose=True, calibrator=None):
         # 时序阈值（微秒单位）
         self.MARK_THRESHOLDS = {
             'start_mark': (8900, 9100),     # 起始高电平，放宽范围
             'start_space': (4300, 4600),    # 起始低电平，放宽范围
             'short_mark': (480, 700),       # 短高电平
             'short_space': (480, 700),      # 短低电平
-            'long_space': (1500, 1800)      # 长低电平
+            'long_space': (1500, 1800),     # 长低电平
+            'gap_space': (19000, 21000)     # 连接码低电平
         }
         
+        # 是否打印逐位调试信息（批量解码时关闭以提高速度）
+        self.verbose = verbose
+        # 接收器时序校准器
+        self.calibrator = calibrator or TimingCalibrator()
+        
         # 协议字段定义
         self.MODE_MAP = {
             0: '自动',
@@ -28,39 +158,97 @@ class GreeIRDecoder:
             3: '高速'
         }
 
+    def _log(self, *args):
+        """调试输出"""
+        if self.verbose:
+            print(*args)
+
     def _is_in_range(self, value, threshold_range):
         """检查值是否在指定范围内"""
         return threshold_range[0] <= abs(value) <= threshold_range[1]
 
-    def decode_raw_data(self, raw_data):
+    def _thresholds_for(self, receiver_id):
+        """获取接收器对应的阈值，未校准时使用默认阈值"""
+        if receiver_id is not None:
+            calibrated = self.calibrator.get(receiver_id)
+            if calibrated:
+                thresholds = dict(self.MARK_THRESHOLDS)
+                thresholds.update(calibrated)
+                return thresholds
+        return self.MARK_THRESHOLDS
+
+    def calibrate(self, receiver_id, captures):
+        """使用一批捕获数据校准接收器时序"""
+        return self.calibrator.calibrate_receiver(receiver_id, captures)
+
+    def decode_raw_data(self, raw_data, receiver_id=None):
         """解码原始数据，使用LSB解码，忽略B010分隔符"""
+        binary_result, _ = self._decode(raw_data, self._thresholds_for(receiver_id))
+        return binary_result
+
+    def decode_adaptive(self, raw_data, receiver_id, captures=None):
+        """
+        自适应解码：先使用已有阈值解码，出现无效起始码、未知数据位或数据位不足 MIN_BITS 时，
+        用当前捕获（及额外提供的捕获批次）计算一组临时阈值再解码一次；
+        只有重新解码成功时才替换并保存接收器的阈值，否则抛出ValueError，原有阈值不变
+        """
+        try:
+            binary_result, unknown = self._decode(raw_data, self._thresholds_for(receiver_id))
+            if self._is_complete(binary_result, unknown):
+                return binary_result
+        except ValueError:
+            pass
+        
+        batch = list(captures or []) + [raw_data]
+        calibrated = self.calibrator.calibrate(batch)
+        thresholds = dict(self.MARK_THRESHOLDS)
+        thresholds.update(calibrated)
+        binary_result, unknown = self._decode(raw_data, thresholds)
+        if not self._is_complete(binary_result, unknown):
+            raise ValueError(f"重新校准后仍无法解码: {len(binary_result)} 位, {unknown} 个未知数据位")
+        self.calibrator.store(receiver_id, calibrated)
+        self._log(f"接收器 {receiver_id} 已重新校准: {calibrated}")
+        return binary_result
+
+    def _is_complete(self, binary_result, unknown):
+        """没有未知数据位且数据位数量足够时认为解码成功"""
+        return unknown == 0 and len(binary_result) >= self.MIN_BITS
+
+    def _decode(self, raw_data, thresholds):
+        """按给定阈值解码，返回二进制序列和未知数据位数量"""
         # 验证数据长度
         if len(raw_data) < 4:
             raise ValueError("数据长度不足")
         
+        short_mark = thresholds['short_mark']
+        short_space = thresholds['short_space']
+        long_space = thresholds['long_space']
+        gap_space = thresholds['gap_space']
+        
         # 验证起始码
         start_mark = raw_data[0]
         start_space = raw_data[1]
         
-        print("原始数据长度:", len(raw_data))
-        print(f"起始高电平: {start_mark}")
-        print(f"起始低电平: {start_space}")
+        self._log("原始数据长度:", len(raw_data))
+        self._log(f"起始高电平: {start_mark}")
+        self._log(f"起始低电平: {start_space}")
         
-        if not (self._is_in_range(start_mark, self.MARK_THRESHOLDS['start_mark']) and 
-                self._is_in_range(start_space, self.MARK_THRESHOLDS['start_space'])):
+        if not (self._is_in_range(start_mark, thresholds['start_mark']) and 
+                self._is_in_range(start_space, thresholds['start_space'])):
             raise ValueError("无效的起始码")
         
         # 解码数据位
         binary_result = ""
         bit_count = 0
+        unknown = 0
         
         i = 2
         while i < len(raw_data) - 1:
             mark = raw_data[i]
             space = raw_data[i+1]
             
-            # 跳过连接码（480-700 us, 19000-21000 us）
-            if (480 <= mark <= 700 and 19000 <= space <= 21000):
+            # 跳过连接码（短高电平 + 约20ms低电平）
+            if self._is_in_range(mark, short_mark) and self._is_in_range(space, gap_space):
                 i += 2
                 continue
             
@@ -75,41 +263,46 @@ class GreeIRDecoder:
                     next_mark = raw_data[next_i]
                     next_space = raw_data[next_i + 1]
                     
-                    if 480 <= next_mark <= 700:
-                        if 1500 <= next_space <= 1800:
+                    if self._is_in_range(next_mark, short_mark):
+                        if self._is_in_range(next_space, long_space):
                             next_three_bits += "1"
-                        elif 480 <= next_space <= 700:
+                        elif self._is_in_range(next_space, short_space):
                             next_three_bits += "0"
                     next_i += 2
                 
                 if next_three_bits == "010":
-                    print("\n检测到块分隔符B010，跳过3位")
+                    self._log("\n检测到块分隔符B010，跳过3位")
                     i = next_i  # 跳过B010
                     bit_count = 0  # 重置位计数
                     continue
             
             # 解码位（LSB优先）
-            if 480 <= mark <= 700:
-                if 1500 <= space <= 1800:
+            if self._is_in_range(mark, short_mark):
+                if self._is_in_range(space, long_space):
                     # 长空白为1
                     binary_result += "1"
-                    print(f"位 {bit_count}: mark={mark}, space={space} -> 1")
-                elif 480 <= space <= 700:
+                    self._log(f"位 {bit_count}: mark={mark}, space={space} -> 1")
+                elif self._is_in_range(space, short_space):
                     # 短空白为0
                     binary_result += "0"
-                    print(f"位 {bit_count}: mark={mark}, space={space} -> 0")
+                    self._log(f"位 {bit_count}: mark={mark}, space={space} -> 0")
                 else:
-                    print(f"未知的数据位模式: mark={mark}, space={space}")
+                    unknown += 1
+                    self._log(f"未知的数据位模式: mark={mark}, space={space}")
                 
                 bit_count += 1
+            else:
+                # 高电平不在阈值范围内（例如解调器偏差），这一位无法解码
+                unknown += 1
+                self._log(f"未知的高电平: mark={mark}, space={space}")
             
             i += 2
         
         # 打印完整的二进制序列
-        print("\n完整二进制序列:")
-        print(binary_result)
+        self._log("\n完整二进制序列:")
+        self._log(binary_result)
         
-        return binary_result
+        return binary_result, unknown
 
     def parse_protocol(self, binary_str):
         """解析格力协议字段"""
@@ -0,0 +1,17 @@
+"""
+确定性仿真：在一个进程内用虚拟时间运行 传感器 -> MQTT -> 服务器 -> 红外发射端 / 触摸屏面板 的完整链路
+
+    python -m simulation.run --sensors 20 --hours 6
+
+不需要ESP32/M5StickC硬件和MQTT服务器；同样的参数和随机种子每次产生完全相同的消息序列
+"""
+import os
+import sys
+
+# 服务器模块位于 app 目录，消息协议和面板程序位于 esp32_lvgl 目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, 'app')
+ESP32_LVGL_DIR = os.path.join(ROOT_DIR, 'esp32_lvgl')
+for _path in (APP_DIR, ESP32_LVGL_DIR):
+    if _path not in sys.path:
+        sys.path.append(_path)
@@ -0,0 +1,72 @@
+import random
+import hashlib
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT主题过滤器匹配，支持 + 和 # 通配符"""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class SimBroker:
+    """
+    进程内的MQTT服务器替身（虚拟时间）
+    - 每条消息按 latency + 随机抖动 投递给所有匹配的订阅者（包括发送方自己，与真实服务器一致）
+    - 同一订阅者收到消息的顺序与发布顺序一致
+    - 每次投递按 “发送方->订阅者” 记录一跳的延迟和字节数（发送方自己收到的除外）
+    - trace_digest 为全部消息（时间、主题、负载）的摘要，相同参数的两次运行应当相同
+    """
+
+    def __init__(self, clock, metrics, latency=0.005, jitter=0.003, seed=0):
+        self.clock = clock
+        self.metrics = metrics
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._subscriptions = []    # [(过滤器, 订阅者名称, 回调)]
+        self._last_delivery = {}    # 订阅者名称 -> 最近一次投递时间
+        self._digest = hashlib.blake2b(digest_size=16)
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def subscribe(self, topic_filter, name, callback):
+        """callback(topic, payload)，payload 为 bytes"""
+        self._subscriptions.append((topic_filter, name, callback))
+
+    def publish(self, topic, payload, sender):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        payload = bytes(payload)
+        now = self.clock.time()
+        self.stats["published"] += 1
+        self._digest.update(f"{now:.6f} {topic} ".encode() + payload + b"\n")
+        matched = False
+        for topic_filter, name, callback in self._subscriptions:
+            if not topic_matches(topic_filter, topic):
+                continue
+            matched = True
+            deliver_at = now + self.latency + self._random.uniform(0, self.jitter)
+            deliver_at = max(deliver_at, self._last_delivery.get(name, 0))
+            self._last_delivery[name] = deliver_at
+            # 发送方收到自己发布的消息不计入链路统计
+            hop = None if name == sender else f"{sender}->{name}"
+            self.clock.call_at(deliver_at, self._deliver, hop, now, callback, topic, payload)
+        if not matched:
+            self.stats["dropped"] += 1
+        return True
+
+    def _deliver(self, hop, published_at, callback, topic, payload):
+        self.stats["delivered"] += 1
+        if hop is not None:
+            self.metrics.record(hop, self.clock.time() - published_at, size=len(payload))
+        callback(topic, payload)
+
+    def trace_digest(self):
+        return self._digest.hexdigest()
@@ -0,0 +1,53 @@
+import heapq
+import itertools
+
+SIM_EPOCH = 1735689600  # 虚拟时间起点：2025-01-01 00:00:00 UTC
+
+
+class VirtualClock:
+    """
+    虚拟时钟和事件调度器
+    所有组件通过 call_at / call_later 登记回调，run_until 按时间顺序执行，时间直接跳到下一个事件，
+    几小时的流量几秒内跑完；同一时刻的事件按登记顺序执行，结果与运行快慢无关
+    """
+
+    def __init__(self, start=SIM_EPOCH):
+        self.start = start
+        self._now = float(start)
+        self._events = []
+        self._order = itertools.count()
+        self.processed = 0
+
+    def time(self):
+        """虚拟的Unix时间（秒）"""
+        return self._now
+
+    def monotonic(self):
+        """从仿真开始经过的秒数，代替 time.monotonic"""
+        return self._now - self.start
+
+    def ticks_ms(self):
+        """代替MicroPython的 time.ticks_ms"""
+        return int(self.monotonic() * 1000)
+
+    def call_at(self, when, callback, *args):
+        """在虚拟时间 when 执行回调，早于当前时间的按当前时间执行"""
+        heapq.heappush(self._events, (max(when, self._now), next(self._order), callback, args))
+
+    def call_later(self, delay, callback, *args):
+        self.call_at(self._now + delay, callback, *args)
+
+    def run_until(self, when):
+        """执行 when 之前（含）的所有事件，然后把时间推进到 when"""
+        events = self._events
+        while events and events[0][0] <= when:
+            self._now, _, callback, args = heapq.heappop(events)
+            callback(*args)
+            self.processed += 1
+        self._now = max(self._now, when)
+
+    def run_for(self, seconds):
+        self.run_until(self._now + seconds)
+
+    def pending(self):
+        return len(self._events)
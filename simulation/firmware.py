@@ -0,0 +1,207 @@
+"""
+红外发射端 stickc_ac_con.ino 的Python模拟（指令处理、状态反馈和按键去抖）
+
+与固件保持一致的行为：
+- 只认文本指令（api/power/on、api/power/off、api/temp/N、api/status），二进制指令帧被忽略
+- 已经开机时收到开机指令（或已关机时收到关机指令）不做任何处理，也不回复状态
+- 每次发布状态后 publishMessage 阻塞2秒，蜂鸣器再阻塞约0.2秒，期间到达的消息排队等待 client.loop
+- 按钮B调温按 TEMP_SEND_DELAY 去抖，最后一次按键1秒后才发送红外指令
+"""
+import json
+
+from ac_control import command_topic, status_topic
+
+# 格力红外协议时序（微秒），与固件中的常量相同
+GREE_BIT_MARK = 620
+GREE_ONE_SPACE = 1600
+GREE_ZERO_SPACE = 540
+GREE_HDR_MARK = 9000
+GREE_HDR_SPACE = 4500
+GREE_GAP_SPACE = 19980
+
+TEMP_SEND_DELAY = 1.0      # 温度发送延迟（秒）
+PUBLISH_DISPLAY_DELAY = 2.0  # publishMessage 发布后在屏幕上显示结果的阻塞时间
+BEEP_DURATION = 0.2        # beepFeedback：50ms + 100ms + 50ms
+ONLINE_MESSAGE = '{"device":"stickc","status":"online"}'
+
+
+def checksum(block):
+    """与固件 calculateChecksum 相同"""
+    total = 10
+    for i in range(min(4, len(block) - 1)):
+        total += block[i] & 0b1111
+    for i in range(4, len(block) - 1):
+        total += block[i] >> 4
+    return total & 0b1111
+
+
+def gree_frames(power_on, temperature):
+    """固件 sendCommand 发送的两组8字节命令"""
+    temp_byte = (max(16, min(30, temperature)) - 16) & 0b1111
+    power = 0b00001001 if power_on else 0b00000001
+    first = bytearray((power, temp_byte, 0b00100000, 0b01010000, 0, 0b01000000, 0, 0))
+    second = bytearray((power, temp_byte, 0b00100000, 0b01110000, 0, 0, 0, 0))
+    for frame in (first, second):
+        frame[7] = checksum(frame) << 4
+    return bytes(first), bytes(second)
+
+
+def _bits_duration(data, bits):
+    ones = sum(bin(byte).count("1") for byte in data) if isinstance(data, bytes) else bin(data).count("1")
+    return bits * GREE_BIT_MARK + ones * GREE_ONE_SPACE + (bits - ones) * GREE_ZERO_SPACE
+
+
+def ir_duration(power_on, temperature):
+    """按 sendGeneric 的时序计算一次 sendCommand 的发射时长（秒）"""
+    total = 0
+    for frame in gree_frames(power_on, temperature):
+        total += GREE_HDR_MARK + GREE_HDR_SPACE + _bits_duration(frame[:4], 32)
+        total += _bits_duration(0b010, 3) + GREE_BIT_MARK + GREE_GAP_SPACE
+        total += _bits_duration(frame[4:], 32) + GREE_BIT_MARK + GREE_GAP_SPACE * 2
+    return total / 1e6
+
+
+class StickCEmulator:
+    """
+    单台红外发射端：订阅 <编号>/aircon，状态发布到 <编号>/up
+    主循环被阻塞时（发射红外、显示发布结果、蜂鸣）收到的消息和按键排队，空闲后按顺序处理
+    """
+
+    def __init__(self, clock, broker, metrics, unit="stickc"):
+        self.clock = clock
+        self.broker = broker
+        self.metrics = metrics
+        self.unit = unit
+        self.is_power_on = False
+        self.current_temp = 25
+        self.temp_to_send = 0
+        self.temp_set_time = 0.0
+        self.temp_changed = False
+        self._busy_until = 0.0   # 主循环阻塞到这个时间
+        self._cursor = None      # 正在处理的事件的虚拟时间（处理过程中逐步推进）
+        self.stats = {"commands": 0, "ignored": 0, "ir_sent": 0, "ir_seconds": 0.0,
+                      "status_published": 0, "button_presses": 0, "temp_debounced": 0}
+
+    def connect(self):
+        """连接MQTT：订阅指令主题并发送上线消息"""
+        self.broker.subscribe(command_topic(self.unit), self.unit, self._on_message)
+        self._run_in_loop(lambda: self._publish(ONLINE_MESSAGE))
+
+    # ------------------------------ 主循环 ------------------------------
+    def _run_in_loop(self, action, *args):
+        """主循环空闲时执行 action，执行期间的阻塞时间累加到 _busy_until"""
+        start = max(self.clock.time(), self._busy_until)
+        if start > self.clock.time():
+            self.clock.call_at(start, self._run_in_loop, action, *args)
+            return
+        self._cursor = start
+        action(*args)
+        self._busy_until = self._cursor
+        self._cursor = None
+
+    def _block(self, seconds):
+        self._cursor += seconds
+
+    def _publish(self, payload):
+        # 发布后在屏幕上显示2秒结果
+        self.clock.call_at(self._cursor, self.broker.publish, status_topic(self.unit), payload, self.unit)
+        self.stats["status_published"] += 1
+        self._block(PUBLISH_DISPLAY_DELAY)
+
+    def _state_payload(self):
+        return json.dumps({"status": "on" if self.is_power_on else "off", "temp": self.current_temp},
+                          separators=(",", ":"))
+
+    def _send_command(self):
+        duration = ir_duration(self.is_power_on, self.current_temp)
+        self.stats["ir_sent"] += 1
+        self.stats["ir_seconds"] += duration
+        self._block(duration)
+
+    def _beep(self):
+        self._block(BEEP_DURATION)
+
+    # ------------------------------ MQTT回调 ------------------------------
+    def _on_message(self, topic, payload):
+        self._run_in_loop(self._callback, payload, self.clock.time())
+
+    def _callback(self, payload, received_at):
+        """与固件 callback 相同的处理逻辑"""
+        try:
+            message = payload.decode()
+        except UnicodeDecodeError:
+            message = ""
+        handled_at = self._cursor
+        if message == "api/power/on" and not self.is_power_on:
+            self.is_power_on = True
+            self._send_command()
+            self._report(received_at)
+            self._beep()
+        elif message == "api/power/off" and self.is_power_on:
+            self.is_power_on = False
+            self._send_command()
+            self._report(received_at)
+            self._beep()
+        elif message.startswith("api/temp/"):
+            try:
+                temp = int(message[len("api/temp/"):])
+            except ValueError:
+                temp = 0  # 固件的 String.toInt() 无法转换时返回0
+            if 16 <= temp <= 30:
+                self.current_temp = temp
+                self._send_command()
+                self._report(received_at)
+                self._beep()
+            else:
+                self.stats["ignored"] += 1
+        elif message == "api/status":
+            self._report(received_at)
+        else:
+            self.stats["ignored"] += 1
+            return
+        self.stats["commands"] += 1
+        self.metrics.record("stickc queue wait", handled_at - received_at)
+
+    def _report(self, received_at):
+        self.metrics.record("stickc command->status", self._cursor - received_at)
+        self._publish(self._state_payload())
+
+    # ------------------------------ 按键 ------------------------------
+    def press_a(self):
+        """短按按钮A：切换电源（先发布状态再发射红外，与固件相同）"""
+        self.stats["button_presses"] += 1
+        self._run_in_loop(self._toggle_power)
+
+    def _toggle_power(self):
+        self.is_power_on = not self.is_power_on
+        self._publish(self._state_payload())
+        self._send_command()
+        self._beep()
+
+    def press_b(self):
+        """按钮B：开机时温度加1（16-30循环），TEMP_SEND_DELAY 后发送"""
+        self.stats["button_presses"] += 1
+        self._run_in_loop(self._increase_temp)
+
+    def _increase_temp(self):
+        if not self.is_power_on:
+            return
+        if not self.temp_changed:
+            self.temp_to_send = self.current_temp
+        else:
+            self.stats["temp_debounced"] += 1
+        self.temp_to_send += 1
+        if self.temp_to_send > 30:
+            self.temp_to_send = 16
+        self.temp_changed = True
+        self.temp_set_time = self._cursor
+        self._beep()
+        self.clock.call_at(self.temp_set_time + TEMP_SEND_DELAY, self._run_in_loop, self._check_and_send_temp)
+
+    def _check_and_send_temp(self):
+        """与固件 checkAndSendTemp 相同：最后一次按键后满 TEMP_SEND_DELAY 才发送"""
+        if self.temp_changed and self._cursor - self.temp_set_time >= TEMP_SEND_DELAY:
+            self.current_temp = self.temp_to_send
+            self._send_command()
+            self._publish(self._state_payload())
+            self.temp_changed = False
@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+
+def percentile(samples, fraction):
+    """samples 已排序"""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class HopMetrics:
+    """
+    记录链路上每一跳的延迟和吞吐量
+    - latency 为虚拟时间（网络、设备阻塞、调度器等待等）
+    - cpu 为真实的处理耗时（perf_counter），用于估算服务器每条消息的计算开销
+    """
+
+    def __init__(self):
+        self._latency = defaultdict(list)
+        self._cpu = defaultdict(float)
+        self._bytes = defaultdict(int)
+        self._order = []
+
+    def record(self, hop, latency=None, cpu=None, size=0):
+        if hop not in self._latency:
+            self._order.append(hop)
+        samples = self._latency[hop]
+        samples.append(latency)
+        if cpu is not None:
+            self._cpu[hop] += cpu
+        self._bytes[hop] += size
+
+    def report(self, duration):
+        """duration 为仿真的虚拟时长（秒），返回每一跳的统计"""
+        rows = []
+        for hop in self._order:
+            samples = self._latency[hop]
+            latencies = sorted(sample for sample in samples if sample is not None)
+            count = len(samples)
+            cpu = self._cpu.get(hop)
+            rows.append({
+                "hop": hop,
+                "count": count,
+                "per_sec": count / duration if duration else 0.0,
+                "bytes_per_sec": self._bytes[hop] / duration if duration else 0.0,
+                "p50_ms": None if not latencies else percentile(latencies, 0.5) * 1000,
+                "p95_ms": None if not latencies else percentile(latencies, 0.95) * 1000,
+                "max_ms": None if not latencies else latencies[-1] * 1000,
+                "cpu_us": None if cpu is None else cpu / count * 1e6
+            })
+        return rows
+
+
+def _display_width(text):
+    # 中文字符在终端中占两列
+    return sum(2 if ord(char) > 0x2E80 else 1 for char in text)
+
+
+def _pad(text, width, left=False):
+    padding = " " * max(width - _display_width(text), 0)
+    return text + padding if left else padding + text
+
+
+def format_report(rows):
+    """格式化为表格文本"""
+    def cell(value, digits=1):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    widths = (28, 8, 10, 10, 10, 10, 10, 10)
+    header = ("链路", "次数", "次/秒", "字节/秒", "p50(ms)", "p95(ms)", "最大(ms)", "CPU(us)")
+    lines = ["".join(_pad(text, width, i == 0) for i, (text, width) in enumerate(zip(header, widths)))]
+    for row in rows:
+        cells = (row["hop"], str(row["count"]), cell(row["per_sec"], 3), cell(row["bytes_per_sec"]),
+                 cell(row["p50_ms"]), cell(row["p95_ms"]), cell(row["max_ms"]), cell(row["cpu_us"]))
+        lines.append("".join(_pad(text, width, i == 0) for i, (text, width) in enumerate(zip(cells, widths))))
+    return "\n".join(lines)
@@ -0,0 +1,197 @@
+"""
+无界面运行的触摸屏面板：加载 esp32_lvgl/main.py，用桩模块代替 lvgl/network/umqtt，
+按虚拟时间驱动发件箱和界面提交，不运行 uasyncio 任务
+"""
+import os
+import math
+import time
+import types
+import contextlib
+import importlib.util
+
+from simulation import ESP32_LVGL_DIR, stubs
+import ac_protocol
+
+PANEL_MAIN = os.path.join(ESP32_LVGL_DIR, "main.py")
+
+
+class SimUMQTTClient:
+    """umqtt.simple.MQTTClient 的替身，收发都经过仿真MQTT服务器"""
+
+    def __init__(self, panel, client_id, server, port=1883, keepalive=0):
+        self._panel = panel
+        self.client_id = client_id
+        self.server = server
+        self._callback = None
+        self.sock = None
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def connect(self):
+        return 0
+
+    def disconnect(self):
+        pass
+
+    def ping(self):
+        pass
+
+    def check_msg(self):
+        pass
+
+    def subscribe(self, topic):
+        self._panel.broker.subscribe(topic.decode(), self._panel.name, self._deliver)
+
+    def publish(self, topic, msg):
+        self._panel.on_publish(bytes(msg))
+        self._panel.broker.publish(topic.decode(), bytes(msg), self._panel.name)
+
+    def _deliver(self, topic, payload):
+        self._panel.on_message(self._callback, topic.encode(), payload)
+
+
+class HeadlessPanel:
+    """
+    一块面板：topic 为面板收发指令的主题（main.py 中的 MQTT_TOPIC）
+    - 收到指令后界面更新在下一个LVGL刷新帧提交，记录消息到屏幕的延迟
+    - tap_power / set_temperature 模拟触摸操作，指令经面板自己的发件箱发送，记录触摸到发布的延迟
+    """
+
+    def __init__(self, clock, broker, metrics, topic="panel/aircon", name="panel", frame_hz=None):
+        self.clock = clock
+        self.broker = broker
+        self.metrics = metrics
+        self.name = name
+        self.module = self._load(topic)
+        self.frame_interval = 1.0 / (frame_hz or self.module.LVGL_REFRESH_HZ)
+        self._commit_scheduled = False
+        self._touched = {}   # 指令类型 -> 触摸时间
+        self._screen_waiting = []  # 等待下一帧显示的消息到达时间
+
+        module = self.module
+        with contextlib.redirect_stdout(None):
+            self.screen = module.MainScreen()
+        self.control_panel = self.screen.control_panel
+        self.network = module.NetworkManager(self.screen.status_bar, self.control_panel)
+
+    def _load(self, topic):
+        lv = stubs.install()
+        spec = importlib.util.spec_from_file_location(f"esp32_panel_{self.name}", PANEL_MAIN)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.lv = lv
+
+        # 时间函数换成虚拟时钟，发件箱和界面更新层重新创建（它们在导入时读取了真实时间）
+        clock = self.clock
+        module.ticks_ms = clock.ticks_ms
+        module.time = types.SimpleNamespace(time=clock.time, localtime=lambda: time.gmtime(clock.time()))
+        module.MQTT_TOPIC = topic.encode()
+        module.MQTT_STATUS_TOPIC = None  # 仿真中红外发射端的状态由服务器处理，面板不订阅
+        module.MQTTClient = lambda **kwargs: SimUMQTTClient(self, **kwargs)
+        module.command_outbox = module.CommandOutbox()
+        module.ui_updater = module.UIUpdater()
+        return module
+
+    # ------------------------------ 连接 ------------------------------
+    def connect(self):
+        """与 wifi_task 相同：Wi-Fi连接后连接MQTT（订阅主题、发送上线消息）"""
+        self.module.wifi_connected = True
+        self.network.connected_ssid = "office"
+        with contextlib.redirect_stdout(None):
+            self.network.connect_mqtt()
+        self._schedule_commit()
+        self._flush_outbox()
+
+    # ------------------------------ 触摸操作 ------------------------------
+    def tap_power(self, on):
+        """拨动电源开关"""
+        switch = self.control_panel.power_btn
+        if on:
+            switch.add_state(self.lv.STATE.CHECKED)
+        else:
+            switch.clear_state(self.lv.STATE.CHECKED)
+        self._touched["power"] = self.clock.time()
+        switch.send_event(self.lv.EVENT.VALUE_CHANGED)
+        self._after_touch()
+
+    def set_temperature(self, temp):
+        """拖动温度滑块后点击SET"""
+        panel = self.control_panel
+        panel.temp_slider.set_value(temp)
+        panel.temp_slider.send_event(self.lv.EVENT.VALUE_CHANGED)
+        if self.module.is_power_on:
+            self._touched["temp"] = self.clock.time()
+        panel.set_temp_btn.send_event(self.lv.EVENT.CLICKED)
+        self._after_touch()
+
+    def _after_touch(self):
+        self._schedule_commit()
+        self._flush_outbox()
+
+    # ------------------------------ 发件箱 ------------------------------
+    def _flush_outbox(self):
+        """代替 outbox_task：发送下一条指令，在确认超时时再检查一次"""
+        with contextlib.redirect_stdout(None):
+            delay = self.module.command_outbox.flush(self.network)
+        if delay is not None:
+            self.clock.call_later(delay / 1000, self._flush_outbox)
+
+    def on_publish(self, payload):
+        """记录发件箱发出的指令（二进制帧或旧格式文本）距离触摸操作的时间"""
+        try:
+            message = ac_protocol.decode_any(payload)
+        except ValueError:
+            return
+        if message is None or message[0] != ac_protocol.MSG_COMMAND:
+            return
+        kind = "temp" if message[3] == ac_protocol.OP_TEMP else "power"
+        touched = self._touched.pop(kind, None)
+        if touched is not None:
+            self.metrics.record("panel touch->publish", self.clock.time() - touched, size=len(payload))
+
+    # ------------------------------ 收到消息 ------------------------------
+    def on_message(self, callback, topic, payload):
+        outbox = self.module.command_outbox
+        inflight = outbox.inflight
+        acked = outbox.stats["acked"]
+        redraws = self.module.ui_updater.stats["requested"]
+        with contextlib.redirect_stdout(None):
+            callback(topic, payload)
+        if outbox.stats["acked"] != acked:
+            sent_at = inflight[4] / 1000
+            self.metrics.record("panel command->ack", self.clock.monotonic() - sent_at)
+            self._flush_outbox()
+        if self.module.ui_updater.stats["requested"] != redraws:
+            self._screen_waiting.append(self.clock.time())
+            self._schedule_commit()
+
+    # ------------------------------ 界面 ------------------------------
+    def _schedule_commit(self):
+        """界面更新在下一个LVGL刷新帧提交"""
+        if self._commit_scheduled:
+            return
+        self._commit_scheduled = True
+        now = self.clock.monotonic()
+        frame = math.floor(now / self.frame_interval + 1) * self.frame_interval
+        self.clock.call_later(frame - now, self._commit)
+
+    def _commit(self):
+        self._commit_scheduled = False
+        with contextlib.redirect_stdout(None):
+            self.module.ui_updater.commit()
+        now = self.clock.time()
+        for arrived in self._screen_waiting:
+            self.metrics.record("panel message->screen", now - arrived)
+        self._screen_waiting = []
+
+    def state(self):
+        panel = self.control_panel
+        return {
+            "power": "on" if self.module.is_power_on else "off",
+            "temp": self.module.current_temp,
+            "temp_label": panel.temp_label.get_text(),
+            "outbox": dict(self.module.command_outbox.stats),
+            "ui": dict(self.module.ui_updater.stats),
+            "mqtt": dict(self.module.mqtt_stats)
+        }
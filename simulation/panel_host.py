@@ -0,0 +1,599 @@
+"""
+在PC上用真实的asyncio事件循环运行触摸屏面板 esp32_lvgl/main.py 的全部协程任务
+
+    python -m simulation.panel_host            # 运行全部场景
+    python -m simulation.panel_host churn      # 只运行指定场景
+
+lvgl、network、umqtt 为桩模块（simulation/stubs.py）：
+- LVGL刷新由 _lvgl_task 代替 lv_utils.event_loop，按 LVGL_REFRESH_HZ 运行lvgl定时器并处理触摸输入
+- 触摸由另一个线程按固定间隔产生，在下一个刷新帧中处理，事件循环被阻塞时触摸延迟随之增加
+- 桩WLAN按接入点模拟连接、断线和阻塞的扫描
+- MQTT经过进程内的回环服务器，每个客户端有一对本地socket，有消息时socket可读，接收任务在socket上等待
+
+场景：
+- churn: Wi-Fi反复断线重连（快速重连、按SSID连接和回退到扫描）期间的触摸延迟
+- reconnect: Wi-Fi断线后经快速重连（缓存的BSSID）和按SSID连接两条路径恢复Wi-Fi和MQTT的时间
+- idle: 空闲时各任务每秒的唤醒次数，收到指令时从socket可读到界面提交的延迟
+- redraw: 开机状态下拖动温度滑块时，界面缓存和合并前后的重绘次数和估算的SPI传输量
+- outbox: 没有节点确认时发件箱不重发；红外发射端在状态主题上回复时指令被确认
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import importlib.util
+from collections import deque
+
+from simulation import ESP32_LVGL_DIR, stubs
+from simulation.metrics import percentile
+import ac_protocol
+
+PANEL_MAIN = os.path.join(ESP32_LVGL_DIR, "main.py")
+
+
+def load_panel(name="esp32_panel_host"):
+    """导入一份新的 main.py（模块级的发件箱、界面更新层和事件都是新的）"""
+    lv = stubs.install()
+    del lv.timers[:]
+    spec = importlib.util.spec_from_file_location(name, PANEL_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_access_point(ssid, index, channel=6, rssi=-60):
+    return stubs.AccessPoint(ssid, bytes((0x02, 0, 0, 0, 0, index)), channel, rssi)
+
+
+# ------------------------------ MQTT ------------------------------
+class LoopbackBroker:
+    """进程内的MQTT服务器：按主题精确匹配，消息经过 latency 秒后投递给所有订阅者（包括发送方）"""
+
+    def __init__(self, latency=0.002):
+        self.latency = latency
+        self._subscribers = []   # [(主题, 回调(主题, 负载))]
+        self.published = []      # [(时间, 主题, 负载)]
+
+    def subscribe(self, topic, callback):
+        self._subscribers.append((bytes(topic), callback))
+
+    def unsubscribe(self, callback):
+        self._subscribers = [item for item in self._subscribers if item[1] != callback]
+
+    def publish(self, topic, payload):
+        topic = bytes(topic)
+        payload = bytes(payload)
+        self.published.append((time.monotonic(), topic, payload))
+        loop = asyncio.get_running_loop()
+        for subscribed, callback in list(self._subscribers):
+            if subscribed == topic:
+                loop.call_later(self.latency, callback, topic, payload)
+
+
+class _LoopbackSocket:
+    """
+    面板客户端的socket：有消息时可读
+    close() 与MicroPython上被关闭的socket一样让等待中的任务醒来（CPython的epoll会静默移除已关闭的描述符）
+    """
+
+    def __init__(self):
+        self._sock, self._peer = socket.socketpair()
+        self._sock.setblocking(False)
+        self.closed = False
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def notify(self):
+        self._peer.send(b"\0")
+
+    def read_one(self):
+        """读取一个通知，没有时返回None"""
+        try:
+            return self._sock.recv(1)
+        except BlockingIOError:
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.notify()
+
+    def release(self):
+        self._sock.close()
+        self._peer.close()
+
+
+class LoopbackMQTTClient:
+    """
+    umqtt.simple.MQTTClient 的替身：Wi-Fi断开时收发都失败，断线期间的消息丢失；
+    Wi-Fi重新关联后连接不再可用（与TCP连接一样），需要重新创建客户端
+    """
+
+    def __init__(self, host, client_id, server, port=1883, keepalive=0):
+        self._host = host
+        self.client_id = client_id
+        self._association = None
+        self.sock = _LoopbackSocket()
+        self._inbox = deque()
+        self._callback = None
+        host.sockets.append(self.sock)
+
+    def _alive(self):
+        return (not self.sock.closed and self._host.link_up()
+                and self._association in (None, self._host.network.wlan.associations))
+
+    def _check_link(self):
+        if not self._alive():
+            raise OSError("ECONNRESET")
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def connect(self):
+        self._check_link()
+        self._association = self._host.network.wlan.associations
+        return 0
+
+    def disconnect(self):
+        self._host.broker.unsubscribe(self._deliver)
+        self.sock.close()
+
+    def ping(self):
+        self._check_link()
+
+    def subscribe(self, topic):
+        self._check_link()
+        self._host.broker.subscribe(topic, self._deliver)
+
+    def publish(self, topic, msg):
+        self._check_link()
+        self._host.broker.publish(topic, msg)
+
+    def _deliver(self, topic, payload):
+        if not self._alive():
+            return
+        self._inbox.append((topic, payload, time.monotonic()))
+        self.sock.notify()
+
+    def check_msg(self):
+        """读取并分发一条消息"""
+        data = self.sock.read_one()
+        if data is None or not self._inbox:
+            return None
+        topic, payload, delivered_at = self._inbox.popleft()
+        self._host.on_dispatch(delivered_at)
+        self._callback(topic, payload)
+
+
+class FakeIRSender:
+    """红外发射端：执行 topic 上的指令（文本或二进制帧），ack_delay 秒后（红外发射）在 status_topic 上发布JSON状态"""
+
+    def __init__(self, broker, topic, status_topic, ack_delay=0.3):
+        self.broker = broker
+        self.status_topic = status_topic
+        self.ack_delay = ack_delay
+        self.power = False
+        self.temp = 26
+        self.commands = 0
+        broker.subscribe(topic, self._on_message)
+
+    def _on_message(self, topic, payload):
+        message = ac_protocol.decode_any(payload)
+        if message is None or message[0] != ac_protocol.MSG_COMMAND:
+            return
+        op, value = message[3], message[4]
+        self.commands += 1
+        if op == ac_protocol.OP_ON:
+            self.power = True
+        elif op == ac_protocol.OP_OFF:
+            self.power = False
+        elif op == ac_protocol.OP_TEMP:
+            self.temp = value
+        asyncio.get_running_loop().call_later(self.ack_delay, self._publish_status)
+
+    def _publish_status(self):
+        op = ac_protocol.OP_ON if self.power else ac_protocol.OP_OFF
+        self.broker.publish(self.status_topic, ac_protocol.to_legacy(
+            ac_protocol.MSG_STATE, op, self.temp, ac_protocol.DIALECT_FIRMWARE))
+
+
+# ------------------------------ 面板 ------------------------------
+class PanelHost:
+    """一块面板：main.py 的协程任务 + 代替 lv_utils 的LVGL刷新任务 + 产生触摸的线程"""
+
+    def __init__(self, access_points=(), **config):
+        stubs.install()
+        sys.modules["network"].WLAN.access_points = list(access_points)
+        self.module = module = load_panel()
+        self._tmpdir = tempfile.TemporaryDirectory()
+        module.WIFI_CACHE_FILE = os.path.join(self._tmpdir.name, "wifi_cache.json")
+        module.MQTTClient = lambda **kwargs: LoopbackMQTTClient(self, **kwargs)
+        for name, value in config.items():
+            setattr(module, name, value)
+        self.lv = sys.modules["lvgl"]
+        self.broker = LoopbackBroker()
+        self.sockets = []
+        self.network = None
+        self.tasks = []
+        self.frames = 0
+        self.touch_latency = []
+        self._touches = deque()
+        self._touch_stop = threading.Event()
+        self._touch_thread = None
+
+    def link_up(self):
+        return self.network is not None and self.network.wlan.isconnected()
+
+    def on_dispatch(self, delivered_at):
+        """接收任务取出一条消息（子类或场景可以覆盖，用于统计）"""
+
+    async def start(self):
+        module = self.module
+        self.screen = module.MainScreen()
+        self.network, self.tasks = module.create_tasks(self.screen)
+        self.tasks.append(asyncio.create_task(self._lvgl_task()))
+
+    async def stop(self):
+        self._touch_stop.set()
+        if self._touch_thread is not None:
+            self._touch_thread.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for sock in self.sockets:
+            sock.release()
+        self._tmpdir.cleanup()
+
+    async def wait_until(self, condition, timeout):
+        """等待条件成立，返回耗时（秒），超时返回None"""
+        start = time.monotonic()
+        while not condition():
+            if time.monotonic() - start > timeout:
+                return None
+            await asyncio.sleep(0.01)
+        return time.monotonic() - start
+
+    # ------------------------------ LVGL ------------------------------
+    async def _lvgl_task(self):
+        """代替 lv_utils.event_loop：每帧处理触摸输入，运行到期的lvgl定时器"""
+        interval = 1 / self.module.LVGL_REFRESH_HZ
+        next_run = {}
+        while True:
+            await asyncio.sleep(interval)
+            self.frames += 1
+            now = time.monotonic()
+            while self._touches:
+                self._touch()
+                self.touch_latency.append(now - self._touches.popleft())
+            for i, (callback, period) in enumerate(self.lv.timers):
+                if now >= next_run.get(i, 0):
+                    next_run[i] = now + period / 1000
+                    callback(None)
+
+    def _touch(self):
+        """拖动温度滑块（只更新界面，不发送指令）"""
+        slider = self.screen.control_panel.temp_slider
+        slider.set_value(16 + (slider.get_value() + 1) % 15)
+        slider.send_event(self.lv.EVENT.VALUE_CHANGED)
+
+    def tap_power(self, on):
+        """拨动电源开关"""
+        switch = self.screen.control_panel.power_btn
+        if on:
+            switch.add_state(self.lv.STATE.CHECKED)
+        else:
+            switch.clear_state(self.lv.STATE.CHECKED)
+        switch.send_event(self.lv.EVENT.VALUE_CHANGED)
+
+    def set_temperature(self, temp):
+        """拖动温度滑块后点击SET"""
+        panel = self.screen.control_panel
+        panel.temp_slider.set_value(temp)
+        panel.temp_slider.send_event(self.lv.EVENT.VALUE_CHANGED)
+        panel.set_temp_btn.send_event(self.lv.EVENT.CLICKED)
+
+    def start_touches(self, interval):
+        """在另一个线程中按 interval 秒产生触摸（相当于触摸控制器的中断）"""
+        def run():
+            while not self._touch_stop.wait(interval):
+                self._touches.append(time.monotonic())
+        self._touch_thread = threading.Thread(target=run, daemon=True)
+        self._touch_thread.start()
+
+
+def _ms(samples, fraction=None):
+    samples = sorted(samples)
+    if not samples:
+        return "-"
+    value = samples[-1] if fraction is None else percentile(samples, fraction)
+    return f"{value * 1000:.0f}"
+
+
+# ------------------------------ 场景 ------------------------------
+async def scenario_churn():
+    """
+    Wi-Fi反复断线期间的触摸延迟
+    前三次断线时缓存的BSSID仍然可用（快速重连），第四次接入点换了BSSID（快速重连超时后只按SSID连接），
+    第五次接入点下线（按SSID也连不上，回退到阻塞的扫描，改连备用网络），整个过程中每100ms触摸一次
+    """
+    office = make_access_point("office", 1, 6, -58)
+    backup = make_access_point("office_2.4", 2, 1, -72)
+    host = PanelHost([office, backup])
+    await host.start()
+    if await host.wait_until(lambda: host.network.mqtt_client is not None, 15) is None:
+        await host.stop()
+        return ["启动后没有连上MQTT"]
+
+    host.start_touches(0.1)
+    paths = ["快速重连"] * 3 + ["BSSID失效，按SSID连接", "接入点下线，回退到扫描"]
+    reconnects = []
+    for k in range(len(paths)):
+        await asyncio.sleep(2)
+        if k == 3:
+            office.bssid = bytes((0x02, 0, 0, 0, 0, 9))  # 接入点更换，缓存的BSSID失效
+        elif k == 4:
+            office.up = False
+        first = len(host.touch_latency)
+        host.network.wlan.drop()
+        dropped = time.monotonic()
+        await host.wait_until(lambda: not host.module.wifi_connected, 3)
+        if await host.wait_until(lambda: host.module.wifi_connected, 30) is None:
+            reconnects.append((None, None, None))
+        else:
+            worst = max(host.touch_latency[first:], default=0)
+            reconnects.append((time.monotonic() - dropped, host.network.last_reconnect_ms, worst))
+    await asyncio.sleep(1)
+    await host.stop()
+
+    latency = host.touch_latency
+    lines = [f"触摸 {len(latency)} 次，延迟 p50 {_ms(latency, 0.5)}ms，p95 {_ms(latency, 0.95)}ms，"
+             f"最大 {_ms(latency)}ms（LVGL {host.module.LVGL_REFRESH_HZ}帧/秒）"]
+    for k, (took, connect_ms, worst) in enumerate(reconnects):
+        if took is None:
+            lines.append(f"第{k + 1}次断线（{paths[k]}）: 30秒内没有恢复")
+        else:
+            lines.append(f"第{k + 1}次断线（{paths[k]}）: 断线到恢复 {took * 1000:.0f}ms，"
+                         f"connect_wifi 耗时 {connect_ms}ms，期间触摸延迟最大 {worst * 1000:.0f}ms")
+    lines.append(f"WLAN: {host.network.wlan.stats}")
+    return lines
+
+
+async def scenario_reconnect():
+    """
+    Wi-Fi断线到Wi-Fi和MQTT恢复的时间
+    接入点短暂掉线3次（缓存的BSSID可用，走快速重连），再更换BSSID 3次（快速重连超时后只按SSID连接）
+    """
+    office = make_access_point("office", 1, 6, -58)
+    host = PanelHost([office])
+    module = host.module
+    await host.start()
+    if await host.wait_until(lambda: host.network.mqtt_client is not None, 15) is None:
+        await host.stop()
+        return ["启动后没有连上MQTT"]
+
+    results = {"快速重连": [], "按SSID连接": []}
+    for path, samples in results.items():
+        for k in range(3):
+            await asyncio.sleep(1)
+            if path == "按SSID连接":
+                office.bssid = bytes((0x02, 0, 0, 0, 1, k))  # 接入点更换，缓存的BSSID失效
+            old_client = host.network.mqtt_client
+            host.network.wlan.drop()
+            dropped = time.monotonic()
+            await host.wait_until(lambda: not module.wifi_connected, 3)
+            if await host.wait_until(lambda: module.wifi_connected, 20) is None:
+                samples.append(None)
+                continue
+            wifi_s = time.monotonic() - dropped
+            new_client = lambda: host.network.mqtt_client not in (None, old_client)
+            mqtt_s = None if await host.wait_until(new_client, 20) is None else time.monotonic() - dropped
+            samples.append((wifi_s, host.network.last_reconnect_ms, mqtt_s))
+    await host.stop()
+
+    lines = []
+    for path, samples in results.items():
+        for k, sample in enumerate(samples):
+            if sample is None or sample[2] is None:
+                lines.append(f"{path} 第{k + 1}次: 20秒内没有恢复")
+                continue
+            wifi_s, connect_ms, mqtt_s = sample
+            lines.append(f"{path} 第{k + 1}次: 断线到Wi-Fi恢复 {wifi_s * 1000:.0f}ms（connect_wifi {connect_ms}ms），"
+                         f"到MQTT恢复 {mqtt_s * 1000:.0f}ms")
+    lines.append(f"断线检测间隔 {module.WIFI_LINK_CHECK_INTERVAL_MS}ms，快速重连超时 {module.WIFI_FAST_CONNECT_TIMEOUT_MS}ms，"
+                 f"WLAN: {host.network.wlan.stats}")
+    return lines
+
+
+async def scenario_idle():
+    """
+    空闲唤醒次数和消息到界面的延迟
+    先空闲10秒统计各任务的唤醒次数，再由服务器每200ms发送一条温度指令，读取面板记录的延迟
+    """
+    host = PanelHost([make_access_point("office", 1)])
+    module = host.module
+    await host.start()
+    if await host.wait_until(lambda: host.network.mqtt_client is not None, 15) is None:
+        await host.stop()
+        return ["启动后没有连上MQTT"]
+    await asyncio.sleep(1)
+
+    idle_seconds = 10
+    before = dict(module.task_wakeups)
+    await asyncio.sleep(idle_seconds)
+    idle = {name: (module.task_wakeups[name] - before[name]) / idle_seconds for name in before}
+
+    latency = []
+    for k in range(25):
+        frame = ac_protocol.encode(ac_protocol.MSG_COMMAND, ac_protocol.NODE_SERVER, k + 1, ac_protocol.OP_TEMP, 20 + k % 8)
+        host.broker.publish(module.MQTT_TOPIC, frame)
+        await asyncio.sleep(0.2)
+        latency.append(module.mqtt_stats["last_latency_ms"] / 1000)
+    await host.stop()
+
+    lines = ["空闲时每秒唤醒: " + "，".join(f"{name} {rate:.2f}" for name, rate in idle.items())
+             + f"，合计 {sum(idle.values()):.2f}（不含LVGL刷新 {module.LVGL_REFRESH_HZ}帧/秒）"]
+    lines.append(f"消息 {module.mqtt_stats['messages']} 条，socket可读到界面提交 p50 {_ms(latency, 0.5)}ms，"
+                 f"最大 {module.mqtt_stats['max_latency_ms']}ms，温度显示 {host.screen.control_panel.temp_label.text}")
+    return lines
+
+
+async def scenario_outbox():
+    """
+    发件箱的确认和重发
+    先在没有任何节点回复状态时开机，再加入一个在状态主题上回复JSON状态的红外发射端，设置温度后关机
+    """
+    host = PanelHost([make_access_point("office", 1)])
+    module = host.module
+    await host.start()
+    if await host.wait_until(lambda: host.network.mqtt_client is not None, 15) is None:
+        await host.stop()
+        return ["启动后没有连上MQTT"]
+
+    panel = host.screen.control_panel
+    outbox = module.command_outbox
+    results = []
+
+    def on_result(kind, op, value, acked):
+        panel.show_command_result(kind, op, value, acked)
+        results.append(module.ui_updater.get_text(panel.status_label))
+    outbox.on_result = on_result
+
+    lines = []
+    host.tap_power(True)
+    queued = module.ui_updater.get_text(panel.status_label)
+    await host.wait_until(lambda: results, module.OUTBOX_ACK_TIMEOUT_MS / 1000 + 2)
+    lines.append(f"没有节点确认: 触摸后显示 {queued!r}，之后 {results[-1] if results else None!r}，发件箱 {dict(outbox.stats)}")
+
+    sender = FakeIRSender(host.broker, module.MQTT_TOPIC, module.MQTT_STATUS_TOPIC)
+    sent = outbox.stats["sent"]
+    del results[:]
+    host.set_temperature(22)
+    queued = module.ui_updater.get_text(panel.status_label)
+    await host.wait_until(lambda: len(results) >= 1, 10)
+    host.tap_power(False)
+    await host.wait_until(lambda: len(results) >= 2, 10)
+    await host.stop()
+    lines.append(f"红外发射端确认: 触摸后显示 {queued!r}，之后 {results!r}，发送 {outbox.stats['sent'] - sent} 条，"
+                 f"发射端执行 {sender.commands} 条，发件箱 {dict(outbox.stats)}")
+    return lines
+
+
+GLYPH_WIDTH_PX = 8    # LVGL默认字体（montserrat 14）的平均字宽
+LINE_HEIGHT_PX = 16
+BYTES_PER_PIXEL = 2   # RGB565
+
+
+class _RedrawMeter:
+    """统计标签的重绘次数，按文本宽度 x 行高估算每次重绘需要经SPI传输的字节数（新旧文本中较宽的区域）"""
+
+    def __init__(self):
+        self.redraws = 0
+        self.spi_bytes = 0
+        self._saved = {}
+
+    def _record(self, widget, text):
+        width = max(len(widget.text), len(text)) * GLYPH_WIDTH_PX
+        self.redraws += 1
+        self.spi_bytes += width * LINE_HEIGHT_PX * BYTES_PER_PIXEL
+
+    def install(self):
+        meter = self
+
+        def set_text(widget, text):
+            meter._record(widget, text)
+            widget.text = text
+
+        def set_style_text_color(widget, color, selector=0):
+            meter._record(widget, widget.text)
+
+        for name, method in (("set_text", set_text), ("set_style_text_color", set_style_text_color)):
+            self._saved[name] = stubs.Widget.__dict__.get(name)
+            setattr(stubs.Widget, name, method)
+
+    def uninstall(self):
+        for name, method in self._saved.items():
+            if method is None:
+                delattr(stubs.Widget, name)
+            else:
+                setattr(stubs.Widget, name, method)
+
+
+def _direct_ui_updater(module):
+    """没有缓存和合并的界面更新层：每次请求都调用LVGL（相当于改用 ui_updater 之前的写法）"""
+    class DirectUIUpdater(module.UIUpdater):
+        def _queue(self, widget, attr, value):
+            self.stats["requested"] += 1
+            self._pending[(id(widget), attr, self.stats["requested"])] = (widget, attr, value)
+            module.ui_event.set()
+    return DirectUIUpdater()
+
+
+async def scenario_redraw():
+    """
+    界面缓存和合并的重绘次数和SPI传输量
+    开机后每50ms拖动一次温度滑块（快于30帧/秒的刷新），状态栏时钟和开机时长每秒更新，每种配置运行10秒
+    """
+    seconds = 10
+    configs = [
+        ("不缓存不合并，显示秒", False, True),
+        ("缓存并合并，显示秒（默认）", True, True),
+        ("缓存并合并，不显示秒", True, False),
+    ]
+    lines = []
+    for label, cached, show_seconds in configs:
+        host = PanelHost([make_access_point("office", 1)], STATUS_BAR_SHOW_SECONDS=show_seconds)
+        module = host.module
+        if not cached:
+            module.ui_updater = _direct_ui_updater(module)
+        await host.start()
+        await host.wait_until(lambda: host.network.mqtt_client is not None, 15)
+        host.tap_power(True)
+        await asyncio.sleep(1)
+
+        meter = _RedrawMeter()
+        meter.install()
+        requested = module.ui_updater.stats["requested"]
+        try:
+            host.start_touches(0.05)
+            await asyncio.sleep(seconds)
+            await host.stop()
+        finally:
+            meter.uninstall()
+        requests = module.ui_updater.stats["requested"] - requested
+        lines.append(f"{label}: 更新请求 {requests / seconds:.1f}/秒，重绘 {meter.redraws / seconds:.1f}/秒，"
+                     f"估算SPI {meter.spi_bytes / seconds / 1024:.1f} KB/秒")
+    return lines
+
+
+SCENARIOS = {
+    "churn": scenario_churn,
+    "reconnect": scenario_reconnect,
+    "idle": scenario_idle,
+    "outbox": scenario_outbox,
+    "redraw": scenario_redraw,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在PC上运行触摸屏面板的协程任务（桩模块）并测量")
+    parser.add_argument("scenarios", nargs="*", choices=[[]] + list(SCENARIOS), help="默认运行全部场景")
+    parser.add_argument("--verbose", action="store_true", help="显示面板程序的打印输出")
+    args = parser.parse_args()
+
+    for name in args.scenarios or SCENARIOS:
+        started = time.perf_counter()
+        with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(None):
+            lines = asyncio.run(SCENARIOS[name]())
+        print(f"[{name}] {SCENARIOS[name].__doc__.strip().splitlines()[0]}（耗时 {time.perf_counter() - started:.1f} 秒）")
+        for line in lines:
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+运行一次完整链路的仿真并输出每一跳的延迟和吞吐量
+
+    python -m simulation.run --sensors 20 --hours 6
+    python -m simulation.run --rooms 3 --no-panel --presses 10 --seed 7
+
+前 rooms 个传感器所在的房间启用恒温控制：第一个房间由红外发射端 stickc 制冷，
+启用面板时最后一个房间的空调换成触摸屏面板（二进制指令帧），其余房间为 stickc2、stickc3 ...
+"""
+import time
+import random
+import argparse
+
+from simulation.clock import VirtualClock
+from simulation.broker import SimBroker
+from simulation.metrics import HopMetrics, format_report
+from simulation.sensors import QingpingSensor, RoomModel
+from simulation.firmware import StickCEmulator
+from simulation.panel import HeadlessPanel
+from simulation.server import SimServer
+
+PANEL_UNIT = "panel"
+
+
+def build(args):
+    clock = VirtualClock()
+    metrics = HopMetrics()
+    broker = SimBroker(clock, metrics, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, seed=args.seed)
+    rng = random.Random(args.seed)
+
+    units = ["stickc"] + [f"stickc{i + 1}" for i in range(1, args.rooms)]
+    if args.panel and args.rooms:
+        units[-1] = PANEL_UNIT
+    units = units[:args.rooms]
+
+    devices = {}
+    for unit in units:
+        if unit == PANEL_UNIT:
+            devices[unit] = HeadlessPanel(clock, broker, metrics)
+        else:
+            devices[unit] = StickCEmulator(clock, broker, metrics, unit)
+
+    sensors = []
+    rooms = []
+    for i in range(args.sensors):
+        topic = f"qingping/sensor{i:02d}/up"
+        ac = None
+        if i < len(units):
+            unit = units[i]
+            ac = devices[unit] if unit != PANEL_UNIT else PanelAC(devices[unit])
+            rooms.append({"room": f"room{i + 1}", "device": topic, "unit": unit, "setpoint": args.setpoint,
+                          "mode": args.mode})
+        room = RoomModel(clock, temperature=rng.uniform(26.0, 30.0), outside=rng.uniform(29.0, 33.0), ac=ac)
+        sensors.append(QingpingSensor(clock, broker, topic, room, interval=args.interval, seed=rng.random(),
+                                      duplicate_rate=args.duplicate_rate, offline_rate=args.offline_rate))
+
+    server = SimServer(clock, broker, metrics, rooms, units, binary_units=[PANEL_UNIT] if args.panel else [],
+                       verbose=args.verbose)
+    return clock, metrics, broker, server, devices, sensors
+
+
+class PanelAC:
+    """房间模型读取面板显示的空调状态"""
+
+    def __init__(self, panel):
+        self.panel = panel
+
+    @property
+    def is_power_on(self):
+        return self.panel.module.is_power_on
+
+    @property
+    def current_temp(self):
+        return self.panel.module.current_temp
+
+
+def schedule_user_actions(clock, devices, duration, presses, touches, seed):
+    """在仿真时间内随机安排按键和触摸操作"""
+    rng = random.Random(seed)
+    stickcs = [device for device in devices.values() if isinstance(device, StickCEmulator)]
+    panels = [device for device in devices.values() if isinstance(device, HeadlessPanel)]
+    for _ in range(presses if stickcs else 0):
+        device = rng.choice(stickcs)
+        at = rng.uniform(0, duration)
+        # 连按几次按钮B调温，测试 TEMP_SEND_DELAY 去抖
+        for k in range(rng.randint(1, 4)):
+            clock.call_at(clock.start + at + k * rng.uniform(0.2, 0.8), device.press_b)
+    for _ in range(touches if panels else 0):
+        panel = rng.choice(panels)
+        at = clock.start + rng.uniform(0, duration)
+        if rng.random() < 0.5:
+            clock.call_at(at, panel.set_temperature, rng.randint(22, 28))
+        else:
+            clock.call_at(at, panel.tap_power, rng.random() < 0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传感器/服务器/红外发射端/面板 全链路仿真（虚拟时间）")
+    parser.add_argument("--sensors", type=int, default=20, help="青萍传感器数量")
+    parser.add_argument("--hours", type=float, default=6, help="仿真时长（小时）")
+    parser.add_argument("--interval", type=int, default=60, help="传感器上报间隔（秒）")
+    parser.add_argument("--rooms", type=int, default=2, help="启用恒温控制的房间数量")
+    parser.add_argument("--setpoint", type=float, default=26, help="恒温控制的设定温度")
+    parser.add_argument("--mode", choices=("hysteresis", "pid"), default="hysteresis")
+    parser.add_argument("--no-panel", dest="panel", action="store_false", help="不加载触摸屏面板")
+    parser.add_argument("--presses", type=int, default=3, help="随机的红外发射端按钮B调温次数")
+    parser.add_argument("--touches", type=int, default=0, help="随机的面板触摸操作次数")
+    parser.add_argument("--duplicate-rate", type=float, default=0.02, help="传感器重发数据包的概率")
+    parser.add_argument("--offline-rate", type=float, default=0.002, help="传感器离线（之后补传历史数据）的概率")
+    parser.add_argument("--latency-ms", type=float, default=5, help="MQTT投递延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=3, help="MQTT投递延迟的随机抖动（毫秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="显示服务器模块的打印输出")
+    args = parser.parse_args()
+
+    clock, metrics, broker, server, devices, sensors = build(args)
+    duration = args.hours * 3600
+
+    started = time.perf_counter()
+    server.start()
+    for device in devices.values():
+        device.connect()
+    for i, sensor in enumerate(sensors):
+        # 各传感器错开整数秒上报，设备时间戳与发布时间一致
+        sensor.start(offset=i % args.interval)
+    schedule_user_actions(clock, devices, duration, args.presses, args.touches, args.seed)
+    clock.run_until(clock.start + duration)
+    wall = time.perf_counter() - started
+
+    print(f"仿真 {args.hours} 小时，{args.sensors} 个传感器，{len(devices)} 台空调，"
+          f"{clock.processed} 个事件，耗时 {wall:.2f} 秒（{duration / wall:.0f} 倍速）")
+    print(f"消息: 发布 {broker.stats['published']}，投递 {broker.stats['delivered']}，"
+          f"无订阅者 {broker.stats['dropped']}，消息序列摘要 {broker.trace_digest()}")
+    print()
+    print(format_report(metrics.report(duration)))
+    print()
+    print(f"服务器: {server.stats}")
+    print(f"去重: {server.dedup.stats}")
+    print(f"调度器: {server.dispatcher.stats}")
+    thermostat = server.thermostat.status()
+    print(f"恒温控制: {thermostat['stats']}")
+    for room in thermostat["rooms"]:
+        print(f"  {room['room']} ({room['unit']}): 室温 {room['temperature']}°C，设定 {room['setpoint']}°C，"
+              f"电源 {room['power']}，空调温度 {room['ac_temp']}")
+    for unit, device in devices.items():
+        if isinstance(device, HeadlessPanel):
+            state = device.state()
+            print(f"面板 {unit}: 电源 {state['power']}，温度 {state['temp_label']}，发件箱 {state['outbox']}，"
+                  f"界面 {state['ui']}")
+        else:
+            print(f"红外发射端 {unit}: 电源 {'on' if device.is_power_on else 'off'}，温度 {device.current_temp}，"
+                  f"{device.stats}")
+    sensor_stats = {}
+    for sensor in sensors:
+        for key, value in sensor.stats.items():
+            sensor_stats[key] = sensor_stats.get(key, 0) + value
+    print(f"传感器: {sensor_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import math
+import random
+
+REALTIME_KEY = 0x14   # 434734 实时数据：时间戳(4) + 温湿度(3) + 气压(2) + 电量(1) + 信号强度(1)
+HISTORY_KEY = 0x03    # 434731 历史数据：基准时间戳(4) + 间隔(2) + 每条记录6字节
+
+
+def encode_reading(temperature, humidity, pressure, battery):
+    """编码一条6字节的传感器记录（与 sensor_parser.decode_sensor_record 相反）"""
+    temp_raw = int(round(temperature * 10)) + 500
+    humi_raw = int(round(humidity * 10))
+    combined = ((temp_raw & 0xFFF) << 12) | (humi_raw & 0xFFF)
+    pressure_raw = int(round(pressure * 100))
+    return combined.to_bytes(3, "little") + pressure_raw.to_bytes(2, "little") + bytes((battery,))
+
+
+def encode_packet(command, items):
+    """组装青萍数据包：'CG' + 指令 + 负载长度(2字节小端序) + [键(1) 长度(2) 值]..."""
+    body = b"".join(bytes((key,)) + len(value).to_bytes(2, "little") + value for key, value in items)
+    return b"CG" + command + len(body).to_bytes(2, "little") + body
+
+
+def realtime_packet(timestamp, temperature, humidity, pressure=101.32, battery=90, rssi=-60):
+    value = timestamp.to_bytes(4, "little") + encode_reading(temperature, humidity, pressure, battery)
+    return encode_packet(b"4", [(REALTIME_KEY, value + (rssi & 0xFF).to_bytes(1, "little"))])
+
+
+def history_packet(base_timestamp, interval, readings):
+    """readings 为 [(温度, 湿度, 气压, 电量), ...]，按时间顺序"""
+    value = base_timestamp.to_bytes(4, "little") + interval.to_bytes(2, "little")
+    value += b"".join(encode_reading(*reading) for reading in readings)
+    return encode_packet(b"1", [(HISTORY_KEY, value)])
+
+
+class RoomModel:
+    """
+    简单的房间热模型：室温按指数规律趋向室外温度，空调开机时同时趋向空调设定温度
+    室外温度按一天的正弦曲线变化；ac 为空调的红外发射端模拟器（可选）
+    """
+
+    def __init__(self, clock, temperature=28.0, outside=31.0, outside_swing=3.0, leak_time=7200.0,
+                 cooling_time=1200.0, ac=None):
+        self.clock = clock
+        self.temperature = temperature
+        self.outside = outside
+        self.outside_swing = outside_swing
+        self.leak_time = leak_time          # 不开空调时趋向室外温度的时间常数（秒）
+        self.cooling_time = cooling_time    # 空调开机时趋向设定温度的时间常数（秒）
+        self.ac = ac
+        self._updated = clock.time()
+
+    def outside_temperature(self, now):
+        return self.outside + self.outside_swing * math.sin(2 * math.pi * ((now % 86400) / 86400 - 0.375))
+
+    def read(self):
+        now = self.clock.time()
+        dt = now - self._updated
+        self._updated = now
+        if dt > 0:
+            outside = self.outside_temperature(now)
+            self.temperature += (outside - self.temperature) * (1 - math.exp(-dt / self.leak_time))
+            if self.ac is not None and self.ac.is_power_on:
+                self.temperature += (self.ac.current_temp - self.temperature) * (1 - math.exp(-dt / self.cooling_time))
+        return self.temperature
+
+
+class QingpingSensor:
+    """
+    青萍传感器模拟器：每隔 interval 秒发布一条434734实时数据
+    - duplicate_rate: 重发同一数据包的概率（测试去重）
+    - offline_rate: 每次上报时离线的概率，离线 offline_readings 个周期后用434731一次补传缓存的读数
+    """
+
+    def __init__(self, clock, broker, topic, room, interval=60, seed=0, duplicate_rate=0.0,
+                 offline_rate=0.0, offline_readings=10):
+        self.clock = clock
+        self.broker = broker
+        self.topic = topic
+        self.room = room
+        self.interval = interval
+        self.duplicate_rate = duplicate_rate
+        self.offline_rate = offline_rate
+        self.offline_readings = offline_readings
+        self._random = random.Random(seed)
+        self._humidity = self._random.uniform(40, 60)
+        self._battery = self._random.randint(60, 100)
+        self._buffer = []         # 离线期间缓存的读数
+        self._buffer_start = None
+        self.stats = {"readings": 0, "published": 0, "duplicates": 0, "backfilled": 0}
+
+    def start(self, offset=0.0):
+        self.clock.call_later(offset, self._tick)
+
+    def _sample(self):
+        temperature = self.room.read() + self._random.gauss(0, 0.05)
+        self._humidity = min(95.0, max(20.0, self._humidity + self._random.gauss(0, 0.3)))
+        return round(temperature, 1), round(self._humidity, 1), 101.32, self._battery
+
+    def _tick(self):
+        now = int(self.clock.time())
+        reading = self._sample()
+        self.stats["readings"] += 1
+        if self._buffer or self._random.random() < self.offline_rate:
+            if not self._buffer:
+                self._buffer_start = now
+            self._buffer.append(reading)
+            if len(self._buffer) >= self.offline_readings:
+                self._publish(history_packet(self._buffer_start, self.interval, self._buffer))
+                self.stats["backfilled"] += len(self._buffer)
+                self._buffer = []
+        else:
+            packet = realtime_packet(now, *reading, rssi=self._random.randint(-80, -50))
+            self._publish(packet)
+            if self._random.random() < self.duplicate_rate:
+                self.stats["duplicates"] += 1
+                self.clock.call_later(self._random.uniform(0.1, 2.0), self._publish, packet)
+        self.clock.call_later(self.interval, self._tick)
+
+    def _publish(self, packet):
+        self.stats["published"] += 1
+        self.broker.publish(self.topic, packet, "sensor")
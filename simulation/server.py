@@ -0,0 +1,125 @@
+"""
+服务器端的仿真：用 app 目录中的真实模块（数据包解析、去重、列式内存存储、恒温控制、空调指令调度器）
+处理仿真MQTT服务器上的消息；Flask接口、数据库和预写日志不参与
+"""
+import time
+import contextlib
+
+from sensor_parser import parse_mqtt_payload
+from ingest import DedupStage, event_time
+from hot_store import HotStore
+from thermostat import ThermostatService
+from ac_control import ACStateCache, CommandDispatcher, command_topic, parse_command, status_topic
+
+SENSOR_TOPICS = "qingping/#"
+
+
+class SimServer:
+    """
+    units 为空调编号列表，binary_units 中的空调（触摸屏面板）收发二进制帧，状态帧与指令在同一主题上
+    记录的链路：
+    - server ingest: 解析、去重、写入内存存储和恒温控制决策的真实CPU耗时
+    - server decision->publish: 恒温控制提交指令到调度器发布（合并等待和发送间隔）
+    - reading->AC confirmed: 传感器读数时间到收到空调的状态反馈
+    """
+
+    def __init__(self, clock, broker, metrics, rooms, units, binary_units=(), verbose=False):
+        self.clock = clock
+        self.broker = broker
+        self.metrics = metrics
+        self.verbose = verbose
+        self.dedup = DedupStage()
+        self.hot_store = HotStore()
+        self.state_cache = ACStateCache()
+        self.dispatcher = CommandDispatcher(self._publish_command, self.state_cache, binary_units=binary_units,
+                                            clock=clock.monotonic)
+        self.thermostat = ThermostatService(rooms, submit=self.dispatcher.submit,
+                                            ac_state=self.state_cache.get,
+                                            clock=clock.time)
+        self._units = {}
+        for unit in units:
+            topic = command_topic(unit) if unit in binary_units else status_topic(unit)
+            self._units[topic] = unit
+        self._submitted = {}   # (空调编号, 类型) -> (提交时间, 读数时间)
+        self._awaiting = {}    # 空调编号 -> 读数时间（指令已发布，等待状态反馈）
+        self._pump_at = None
+        self.stats = {"packets": 0, "duplicates": 0, "backfilled": 0, "errors": 0, "status": 0}
+
+    def start(self):
+        self.broker.subscribe(SENSOR_TOPICS, "server", self._on_sensor)
+        for topic in self._units:
+            self.broker.subscribe(topic, "server", self._on_status)
+
+    def _quiet(self):
+        return contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(None)
+
+    # ------------------------------ 传感器数据 ------------------------------
+    def _on_sensor(self, topic, payload):
+        received_at = self.clock.time()
+        started = time.perf_counter()
+        with self._quiet():
+            ts, submitted = self._ingest(topic, payload, received_at)
+        self.metrics.record("server ingest", None, time.perf_counter() - started, len(payload))
+        for room, kind, value, result in submitted:
+            unit = self.thermostat.rooms[room].unit
+            if result.get("status") in ("queued", "coalesced"):
+                # 读数时间（传感器时间戳）用于统计读数到空调确认的端到端延迟
+                self._submitted[(unit, kind)] = (received_at, ts)
+        if submitted:
+            self._pump()
+
+    def _ingest(self, topic, payload, received_at):
+        """返回 (读数时间, 提交的空调指令)"""
+        parsed_data, _ = parse_mqtt_payload(payload)
+        self.stats["packets"] += 1
+        if "error" in parsed_data:
+            self.stats["errors"] += 1
+            return None, []
+        if self.dedup.seen(topic, parsed_data.get("_timestamp"), payload, received_at):
+            self.stats["duplicates"] += 1
+            return None, []
+        if "_history" in parsed_data:
+            # 补传的历史数据只写入存储，不参与控制
+            for sample in parsed_data["_history"]:
+                fields = {name: value for name, value in sample.items() if not name.startswith("_")}
+                self.hot_store.append(topic, event_time(sample["timestamp"], received_at), fields)
+                self.stats["backfilled"] += 1
+            return None, []
+        ts = event_time(parsed_data.get("_timestamp"), received_at)
+        self.hot_store.append(topic, ts, parsed_data)
+        return ts, self.thermostat.observe(topic, ts, parsed_data, received_at)
+
+    # ------------------------------ 空调指令 ------------------------------
+    def _pump(self):
+        """代替调度器的后台线程：发送已到期的指令，并在下一条指令到期时再调用一次"""
+        self._pump_at = None
+        with self._quiet():
+            wait = self.dispatcher.dispatch_due()
+        if wait is not None:
+            self._pump_at = self.clock.time() + wait
+            self.clock.call_at(self._pump_at, self._pump_if_due, self._pump_at)
+
+    def _pump_if_due(self, scheduled_at):
+        if self._pump_at == scheduled_at:
+            self._pump()
+
+    def _publish_command(self, topic, payload):
+        unit = topic.split("/")[0]
+        kind, _ = parse_command(payload)
+        submitted = self._submitted.pop((unit, kind), None)
+        if submitted is not None:
+            self.metrics.record("server decision->publish", self.clock.time() - submitted[0])
+            self._awaiting.setdefault(unit, submitted[1])
+        return self.broker.publish(topic, payload, "server")
+
+    def _on_status(self, topic, payload):
+        unit = self._units[topic]
+        with self._quiet():
+            state = self.dispatcher.handle_status(unit, payload)
+        if state is None:
+            return
+        self.stats["status"] += 1
+        reading_time = self._awaiting.pop(unit, None)
+        if reading_time is not None:
+            self.metrics.record("reading->AC confirmed", self.clock.time() - reading_time)
+        self._pump()
@@ -0,0 +1,257 @@
+"""
+面板程序 esp32_lvgl/main.py 在PC上运行所需的桩模块：lvgl、network、umqtt.simple
+
+lvgl 桩只保存控件状态（文本、数值、选中状态、隐藏标志和事件回调），不做任何绘制；
+动画直接跳到终值，定时器只登记不运行
+"""
+import sys
+import time
+import types
+
+
+class _Names:
+    """lv.ALIGN.CENTER 之类的常量，返回 "ALIGN.CENTER" 字符串"""
+
+    def __init__(self, prefix, **values):
+        self._prefix = prefix
+        self.__dict__.update(values)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return f"{self._prefix}.{name}"
+
+
+class Event:
+    def __init__(self, target, code):
+        self._target = target
+        self._code = code
+
+    def get_target(self):
+        return self._target
+
+    def get_code(self):
+        return self._code
+
+
+class Widget:
+    """所有控件共用的桩：未实现的 set_*/align 等方法都是空操作"""
+    FLAG = _Names("FLAG")
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.text = ""
+        self.value = 0
+        self.states = set()
+        self.flags = set()
+        self.height = None
+        self.opa = None
+        self._callbacks = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def set_text(self, text):
+        self.text = text
+
+    def get_text(self):
+        return self.text
+
+    def set_value(self, value, anim=None):
+        self.value = value
+
+    def get_value(self):
+        return self.value
+
+    def add_state(self, state):
+        self.states.add(state)
+
+    def clear_state(self, state):
+        self.states.discard(state)
+
+    def has_state(self, state):
+        return state in self.states
+
+    def add_flag(self, flag):
+        self.flags.add(flag)
+
+    def clear_flag(self, flag):
+        self.flags.discard(flag)
+
+    def has_flag(self, flag):
+        return flag in self.flags
+
+    def set_height(self, height):
+        self.height = height
+
+    def set_style_text_opa(self, opa, selector=0):
+        self.opa = opa
+
+    def add_event_cb(self, callback, code, user_data):
+        self._callbacks.append((callback, code))
+
+    def send_event(self, code):
+        """模拟触摸操作触发的事件"""
+        for callback, callback_code in self._callbacks:
+            if callback_code == code:
+                callback(Event(self, code))
+
+
+class Animation:
+    """动画立即完成：执行一次终值回调和结束回调"""
+
+    path_ease_in = None
+    path_ease_out = None
+
+    def __init__(self):
+        self._end = None
+        self._exec_cb = None
+        self._ready_cb = None
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def set_values(self, start, end):
+        self._end = end
+
+    def set_custom_exec_cb(self, callback):
+        self._exec_cb = callback
+
+    def set_ready_cb(self, callback):
+        self._ready_cb = callback
+
+    @staticmethod
+    def start(anim):
+        if anim._exec_cb:
+            anim._exec_cb(anim, anim._end)
+        if anim._ready_cb:
+            anim._ready_cb(anim)
+
+
+def _make_lvgl():
+    lv = types.ModuleType("lvgl")
+    screen = Widget()
+    lv.obj = Widget
+    lv.label = lv.switch = lv.slider = lv.btn = lv.img = Widget
+    lv.scr_act = lambda: screen
+    lv.scr_load = lambda scr: None
+    lv.img_dsc_t = lambda description: description
+    lv.color_hex = lambda value: value
+    lv.color_make = lambda r, g, b: (r << 16) | (g << 8) | b
+    lv.timers = []
+    lv.timer_create = lambda callback, period, user_data: lv.timers.append((callback, period)) or len(lv.timers)
+    lv.anim_t = Animation
+    lv.ALIGN = _Names("ALIGN")
+    lv.EVENT = _Names("EVENT")
+    lv.STATE = _Names("STATE")
+    lv.PART = _Names("PART")
+    lv.ANIM = _Names("ANIM")
+    lv.OPA = _Names("OPA", _0=0, _100=255)
+    return lv
+
+
+class AccessPoint:
+    """桩WLAN能扫描和连接的接入点，up=False 时接入点不可用（断电、重启）"""
+
+    def __init__(self, ssid, bssid, channel=6, rssi=-60):
+        self.ssid = ssid
+        self.bssid = bssid      # 6字节
+        self.channel = channel
+        self.rssi = rssi
+        self.up = True
+
+
+class _WLAN:
+    """
+    network.WLAN 的桩
+    - 默认处于已连接状态（全链路仿真不运行Wi-Fi逻辑）
+    - access_points 不为空时按接入点模拟：connect 在 associate_ms 后连上可用的接入点（指定BSSID时必须一致；
+      不指定BSSID时驱动先在后台扫描，再多 scan_ms，但不阻塞调用者），
+      scan 与设备上一样阻塞 scan_ms；drop() 模拟链路断开
+    """
+    access_points = []   # 所有实例共用，由测试程序设置
+    associate_ms = 150
+    scan_ms = 2500
+
+    def __init__(self, interface):
+        self.interface = interface
+        self._connected = not self.access_points
+        self._ap = None
+        self._connecting = None   # (接入点, 连上的时间)
+        self.associations = 0     # 关联成功的次数，重新关联后原来的TCP连接失效
+        self.stats = {"connect": 0, "scan": 0, "disconnect": 0}
+
+    def isconnected(self):
+        if self._connecting is not None:
+            ap, ready_at = self._connecting
+            if not ap.up:
+                self._connecting = None
+            elif time.monotonic() >= ready_at:
+                self._connecting = None
+                self._connected = True
+                self._ap = ap
+                self.associations += 1
+        if self._connected and self._ap is not None and not self._ap.up:
+            self._connected = False
+        return self._connected
+
+    def connect(self, ssid, password, bssid=None):
+        self.stats["connect"] += 1
+        self._connected = False
+        self._connecting = None
+        for ap in self.access_points:
+            if ap.up and ap.ssid == ssid and (bssid is None or bytes(bssid) == ap.bssid):
+                delay = self.associate_ms + (0 if bssid is not None else self.scan_ms)
+                self._connecting = (ap, time.monotonic() + delay / 1000)
+                return
+
+    def disconnect(self):
+        self.stats["disconnect"] += 1
+        self._connected = False
+        self._connecting = None
+
+    def drop(self):
+        """链路断开（测试用）"""
+        self._connected = False
+        self._connecting = None
+
+    def scan(self):
+        self.stats["scan"] += 1
+        time.sleep(self.scan_ms / 1000)
+        return [(ap.ssid.encode(), ap.bssid, ap.channel, ap.rssi, 3, False)
+                for ap in self.access_points if ap.up]
+
+    def active(self, *args):
+        return True
+
+    def status(self, *args):
+        if self._ap is not None:
+            return self._ap.rssi
+        return -55
+
+    def ifconfig(self):
+        return ("192.168.1.100", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+
+
+def install():
+    """把桩模块放入 sys.modules（已有真实模块时不覆盖），返回 lvgl 桩"""
+    if "lvgl" not in sys.modules:
+        sys.modules["lvgl"] = _make_lvgl()
+    if "network" not in sys.modules:
+        network = types.ModuleType("network")
+        network.STA_IF = 0
+        network.WLAN = _WLAN
+        network.AccessPoint = AccessPoint
+        sys.modules["network"] = network
+    if "umqtt.simple" not in sys.modules:
+        umqtt = types.ModuleType("umqtt")
+        simple = types.ModuleType("umqtt.simple")
+        simple.MQTTClient = None  # 仿真中由 panel.SimUMQTTClient 代替
+        umqtt.simple = simple
+        sys.modules["umqtt"] = umqtt
+        sys.modules["umqtt.simple"] = simple
+    return sys.modules["lvgl"]
@@ -0,0 +1,114 @@
+import os
+import sys
+import unittest
+
+# 服务端模块位于仓库的 app 目录（平铺的模块，按模块名导入）
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from ac_control import CommandDispatcher, command_topic, encode_command
+
+
+class FakeClock:
+    """可手动推进的时钟，替代 time.monotonic"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class DispatchDueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.published = []
+        self.publish_ok = True
+        self.dispatcher = CommandDispatcher(self.publish, min_interval=2.0, coalesce_delay=1.0, clock=self.clock)
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+        return self.publish_ok
+
+    def test_nothing_pending(self):
+        self.assertIsNone(self.dispatcher.dispatch_due())
+        self.assertEqual(self.published, [])
+
+    def test_power_sent_immediately(self):
+        self.dispatcher.submit("stickc", "power", "on")
+        self.assertIsNone(self.dispatcher.dispatch_due())
+        self.assertEqual(self.published, [(command_topic("stickc"), encode_command("power", "on"))])
+
+    def test_temp_waits_for_coalesce_delay(self):
+        self.dispatcher.submit("stickc", "temp", 24)
+        self.assertAlmostEqual(self.dispatcher.dispatch_due(), 1.0)
+        self.assertEqual(self.published, [])
+        self.clock.advance(1.0)
+        self.assertIsNone(self.dispatcher.dispatch_due())
+        self.assertEqual(self.published, [(command_topic("stickc"), encode_command("temp", 24))])
+
+    def test_temp_commands_coalesced(self):
+        for temp in (22, 23, 24):
+            self.dispatcher.submit("stickc", "temp", temp)
+        self.clock.advance(1.0)
+        self.dispatcher.dispatch_due()
+        self.assertEqual(self.published, [(command_topic("stickc"), encode_command("temp", 24))])
+        self.assertEqual(self.dispatcher.stats["coalesced"], 2)
+
+    def test_min_interval_per_unit(self):
+        self.dispatcher.submit("stickc", "power", "on")
+        self.dispatcher.submit("stickc2", "power", "on")
+        self.dispatcher.dispatch_due()
+        # 不同空调互不影响；同一空调先开机，设温度要等 min_interval
+        self.assertEqual([topic for topic, _ in self.published], [command_topic("stickc"), command_topic("stickc2")])
+
+        self.dispatcher.submit("stickc", "temp", 24)
+        self.clock.advance(1.0)
+        self.assertAlmostEqual(self.dispatcher.dispatch_due(), 1.0)
+        self.assertEqual(len(self.published), 2)
+        self.clock.advance(1.0)
+        self.assertIsNone(self.dispatcher.dispatch_due())
+        self.assertEqual(self.published[-1], (command_topic("stickc"), encode_command("temp", 24)))
+
+    def test_due_commands_sent_in_one_call(self):
+        self.dispatcher.submit("stickc", "power", "on")
+        self.dispatcher.submit("stickc", "temp", 24)
+        self.clock.advance(5.0)
+        # 同一次调用里按 power、temp 的顺序发送，两条之间仍然间隔 min_interval（时钟不动时第二条留到下次）
+        self.assertAlmostEqual(self.dispatcher.dispatch_due(), 2.0)
+        self.assertEqual(self.published, [(command_topic("stickc"), encode_command("power", "on"))])
+        self.clock.advance(2.0)
+        self.dispatcher.dispatch_due()
+        self.assertEqual(self.published[-1], (command_topic("stickc"), encode_command("temp", 24)))
+
+    def test_failed_publish_requeued(self):
+        self.publish_ok = False
+        self.dispatcher.submit("stickc", "power", "on")
+        self.assertAlmostEqual(self.dispatcher.dispatch_due(), 2.0)
+        self.assertEqual(self.dispatcher.stats["failed"], 1)
+        self.assertEqual(self.dispatcher.pending("stickc"), {"power": "on"})
+
+        self.publish_ok = True
+        self.clock.advance(2.0)
+        self.assertIsNone(self.dispatcher.dispatch_due())
+        self.assertEqual(self.dispatcher.stats["published"], 1)
+        self.assertEqual(len(self.published), 2)
+
+    def test_redundant_command_dropped_when_due(self):
+        self.dispatcher.handle_status("stickc", '{"status":"on","temp":24}')
+        self.dispatcher.submit("stickc", "temp", 25)
+        # 等待合并期间空调报告已经是25°C，到期时不再发送
+        self.dispatcher.handle_status("stickc", '{"status":"on","temp":25}')
+        self.clock.advance(1.0)
+        self.assertIsNone(self.dispatcher.dispatch_due())
+        self.assertEqual(self.published, [])
+        self.assertEqual(self.dispatcher.stats["dropped"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
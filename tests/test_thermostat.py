@@ -0,0 +1,104 @@
+import os
+import sys
+import unittest
+
+# 服务端模块位于仓库的 app 目录（平铺的模块，按模块名导入）
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from thermostat import RoomThermostat, ThermostatService, PID_STEP_HYSTERESIS
+
+
+def pid_room(**kwargs):
+    """设定温度25°C的 pid 模式房间；ki=0 时 PID 输出等于室温偏差，便于推算空调设定温度"""
+    config = dict(room="卧室", device="qp1", unit="stickc", setpoint=25, mode="pid",
+                  pid={"kp": 1.0, "ki": 0.0})
+    config.update(kwargs)
+    return RoomThermostat(**config)
+
+
+class PIDStepHysteresisTest(unittest.TestCase):
+
+    def test_small_output_change_keeps_ac_temp(self):
+        room = pid_room()
+        self.assertEqual(room.decide(0, 26.0), [("power", "on"), ("temp", 24)])
+        # 输出 24.7，离当前空调温度 24 不到 PID_STEP_HYSTERESIS，不换挡（单纯取整会变成25）
+        self.assertLess(0.7, PID_STEP_HYSTERESIS)
+        self.assertEqual(room.decide(400, 25.3), [])
+        self.assertEqual(room.ac_temp, 24)
+
+    def test_output_beyond_hysteresis_changes_ac_temp(self):
+        room = pid_room()
+        room.decide(0, 26.0)
+        self.assertEqual(room.decide(400, 25.0), [("temp", 25)])
+        self.assertEqual(room.ac_temp, 25)
+
+    def test_output_hovering_on_rounding_boundary_sends_once(self):
+        room = pid_room()
+        room.decide(0, 26.0)
+        # 输出在 24.4 和 24.6 之间来回变化，不再每条读数都调一次空调
+        commands = []
+        for i, temperature in enumerate([25.6, 25.4] * 10):
+            commands += room.decide(400 * (i + 1), temperature)
+        self.assertEqual(commands, [])
+
+
+class PIDMinAdjustTest(unittest.TestCase):
+
+    def test_adjustment_waits_for_min_adjust(self):
+        room = pid_room(min_adjust=300)
+        room.decide(0, 26.0)
+        self.assertEqual(room.decide(100, 25.0), [])
+        self.assertEqual(room.decide(299, 25.0), [])
+        self.assertEqual(room.decide(300, 25.0), [("temp", 25)])
+
+    def test_interval_counts_from_last_adjustment(self):
+        room = pid_room(min_adjust=300)
+        room.decide(0, 26.0)
+        room.decide(300, 25.0)
+        self.assertEqual(room.decide(500, 26.0), [])
+        self.assertEqual(room.decide(600, 26.0), [("temp", 24)])
+
+    def test_power_on_sets_temp_immediately(self):
+        room = pid_room(min_adjust=300)
+        room.decide(0, 26.0)
+        room.decide(600, 24.0)
+        # 关机后再开机是新的一轮调节，开机时的空调温度不受 min_adjust 限制
+        self.assertEqual(room.decide(1000, 26.0), [("power", "on"), ("temp", 24)])
+
+    def test_hysteresis_mode_not_limited(self):
+        room = RoomThermostat(room="卧室", device="qp1", unit="stickc", setpoint=25, min_adjust=300)
+        room.decide(0, 26.0)
+        room.setpoint = 24
+        self.assertEqual(room.decide(10, 26.0), [("temp", 24)])
+
+
+class ACStateFeedbackTest(unittest.TestCase):
+
+    def test_manual_temp_change_is_corrected(self):
+        submitted = []
+        state = {"power": None, "temp": None}
+        service = ThermostatService(
+            [dict(room="卧室", device="qp1", unit="stickc", setpoint=25, mode="pid", pid={"kp": 1.0, "ki": 0.0})],
+            submit=lambda unit, kind, value: submitted.append((unit, kind, value)) or {"status": "queued"},
+            ac_state=lambda unit: state, clock=lambda: 0)
+        service.observe("qp1", 0, {"temperature": 26.0}, received_at=0)
+        self.assertEqual(submitted, [("stickc", "power", "on"), ("stickc", "temp", 24)])
+
+        # 有人用遥控器把空调调到了27°C，状态反馈报告的温度与发出的不一致
+        state.update(power="on", temp=27)
+        service.observe("qp1", 400, {"temperature": 26.0}, received_at=400)
+        self.assertEqual(submitted[-1], ("stickc", "temp", 24))
+        self.assertEqual(len(submitted), 3)
+
+    def test_feedback_ignored_while_awaiting_command(self):
+        room = pid_room()
+        room.decide(0, 26.0)
+        # 刚发出指令，空调还没回报新温度：不采信旧的状态反馈，也不重复发送
+        self.assertEqual(room.decide(30, 26.0, actual_power="on", actual_temp=27), [])
+        self.assertEqual(room.ac_temp, 24)
+
+
+if __name__ == "__main__":
+    unittest.main()